@@ -0,0 +1,234 @@
+"""
+Benchmarks of the nacoustik pipeline stages
+
+Times and memory-profiles each stage (Wave.read, psd, remove_background_noise,
+remove_anthrophony, sel, calculate_aci, plot_spectrogram) and the whole
+pipeline on synthetic soundscapes, and stores the results as JSON.
+
+Usage
+----------
+python benchmarks/run.py --output results.json
+python benchmarks/run.py --rates 44100 --channels 2 --durations 1 10 60
+python benchmarks/run.py --compare baseline.json results.json
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import scipy
+import numba
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from nacoustik import Wave
+from nacoustik.spectrum import psd, sel
+from nacoustik.noise import remove_background_noise, remove_anthrophony
+from nacoustik.index import calculate_aci
+from nacoustik.plot import plot_spectrogram
+from synthetic import write_soundscape
+
+
+def measure(function, *args, **kwargs):
+    """
+    Call a function and measure its wall time, cpu time,
+    and peak memory allocation (traced by tracemalloc)
+
+    Returns
+    ----------
+    result: the result of the function, or 'None' if it raised an exception
+
+    record: dictionary with 'time', 'cpu_time', 'peak_memory' (in bytes)
+        and 'error'
+    """
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    wall, cpu = time.perf_counter(), time.process_time()
+    error = None
+    try:
+        result = function(*args, **kwargs)
+    except Exception as exception:
+        result = None
+        error = '{0}: {1}'.format(type(exception).__name__, exception)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, {'time': wall, 'cpu_time': cpu, 'peak_memory': peak, 'error': error}
+
+
+def _read(filepath):
+    wave = Wave(filepath)
+    wave.read()
+    return wave
+
+
+def _pipeline(wave, dtype):
+    f, t, a = psd(wave, dtype = dtype)
+    ale = remove_background_noise(a)
+    ale = remove_anthrophony(ale, t[1] - t[0], f[1] - f[0])
+    sel(a, wave.rate, wave.duration / 60., b = np.ma.masked_equal(ale, 0))
+    calculate_aci(np.where(ale != 0, 10**(ale / 10), 0), t[1] - t[0])
+
+
+def benchmark(filepath, dtype = np.float64):
+    """
+    Benchmark every stage and the whole pipeline on a WAV file
+
+    Returns
+    ----------
+    records: list of dictionaries, one per stage
+    """
+
+    records = []
+
+    def stage(name, function, *args, **kwargs):
+        result, record = measure(function, *args, **kwargs)
+        record['stage'] = name
+        records.append(record)
+        return result
+
+    wave = stage('Wave.read', _read, filepath)
+    result = stage('psd', psd, wave, dtype = dtype)
+    if result is not None:
+        f, t, a = result
+        time_delta, freq_delta = t[1] - t[0], f[1] - f[0]
+        ale = stage('remove_background_noise', remove_background_noise, a)
+        if ale is not None:
+            ale = stage('remove_anthrophony', remove_anthrophony, ale.copy(),
+                        time_delta, freq_delta)
+        if ale is not None:
+            stage('sel', sel, a, wave.rate, wave.duration / 60.,
+                  b = np.ma.masked_equal(ale, 0))
+            stage('calculate_aci', calculate_aci,
+                  np.where(ale != 0, 10**(ale / 10), 0), time_delta)
+        del a, ale
+    stage('plot_spectrogram', plot_spectrogram, wave)
+    stage('pipeline', _pipeline, Wave(filepath), dtype)
+    return records
+
+
+def run(rates, channels, durations, dtypes, directory, repeat = 1):
+    """
+    Benchmark all combinations of sample rates, channels, durations, and dtypes
+
+    Returns
+    ----------
+    results: dictionary with 'metadata' and 'results' (a list of records)
+    """
+
+    # compile numba kernels before timing
+    with tempfile.TemporaryDirectory() as temp:
+        filepath = os.path.join(temp, 'warmup.wav')
+        write_soundscape(filepath, 2., 22050, 2)
+        for dtype in dtypes:
+            _pipeline(Wave(filepath), dtype)
+
+    results = []
+    for rate in rates:
+        for n_channels in channels:
+            for duration in durations:
+                filepath = os.path.join(directory, 'soundscape_{0}_{1}_{2}.wav'.format(
+                    rate, n_channels, duration))
+                if not os.path.exists(filepath):
+                    write_soundscape(filepath, duration * 60., rate, n_channels)
+                for dtype in dtypes:
+                    for iteration in range(repeat):
+                        print('{0} Hz, {1} channels, {2} min, {3}, run {4}'.format(
+                            rate, n_channels, duration, np.dtype(dtype).name, iteration + 1),
+                            file = sys.stderr)
+                        for record in benchmark(filepath, dtype):
+                            record.update({'rate': rate, 'channels': n_channels,
+                                           'duration': duration,
+                                           'dtype': np.dtype(dtype).name,
+                                           'iteration': iteration})
+                            results.append(record)
+    metadata = {'date': datetime.datetime.now().isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'processor': platform.processor(),
+                'cpu_count': os.cpu_count(),
+                'numpy': np.__version__,
+                'scipy': scipy.__version__,
+                'numba': numba.__version__}
+    return {'metadata': metadata, 'results': results}
+
+
+def _key(record):
+    return (record['stage'], record['rate'], record['channels'],
+            record['duration'], record['dtype'])
+
+
+def _best(results):
+    # fastest run of each stage and configuration
+    best = {}
+    for record in results['results']:
+        if record['error'] is None:
+            key = _key(record)
+            if key not in best or record['time'] < best[key]['time']:
+                best[key] = record
+    return best
+
+
+def compare(baseline, current):
+    """Print the time and peak memory ratios (current / baseline) of two result files"""
+
+    with open(baseline) as f:
+        baseline = _best(json.load(f))
+    with open(current) as f:
+        current = _best(json.load(f))
+    print('{0:<24} {1:>6} {2:>3} {3:>4} {4:>8} {5:>10} {6:>8} {7:>10}'.format(
+        'stage', 'rate', 'ch', 'min', 'dtype', 'time (s)', 'ratio', 'memory'))
+    for key in sorted(set(baseline) & set(current)):
+        b, c = baseline[key], current[key]
+        print('{0:<24} {1:>6} {2:>3} {3:>4} {4:>8} {5:>10.3f} {6:>8.2f} {7:>10.2f}'.format(
+            *key, c['time'], c['time'] / b['time'],
+            c['peak_memory'] / max(b['peak_memory'], 1)))
+
+
+def main(args = None):
+    parser = argparse.ArgumentParser(description = 'Benchmark the nacoustik pipeline')
+    parser.add_argument('--rates', type = int, nargs = '+', default = [22050, 44100, 96000])
+    parser.add_argument('--channels', type = int, nargs = '+', default = [1, 2, 4])
+    parser.add_argument('--durations', type = float, nargs = '+', default = [1.],
+                        help = 'durations in minutes (default: 1)')
+    parser.add_argument('--dtypes', nargs = '+', default = ['float64', 'float32'])
+    parser.add_argument('--repeat', type = int, default = 1)
+    parser.add_argument('--directory', default = None,
+                        help = 'directory of the generated WAV files (default: temporary)')
+    parser.add_argument('--output', default = 'benchmark.json')
+    parser.add_argument('--compare', nargs = 2, metavar = ('BASELINE', 'CURRENT'),
+                        help = 'compare two result files instead of running benchmarks')
+    args = parser.parse_args(args)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    durations = [int(d) if float(d).is_integer() else d for d in args.durations]
+    dtypes = [np.dtype(dtype).type for dtype in args.dtypes]
+    if args.directory is None:
+        with tempfile.TemporaryDirectory() as directory:
+            results = run(args.rates, args.channels, durations, dtypes, directory, args.repeat)
+    else:
+        os.makedirs(args.directory, exist_ok = True)
+        results = run(args.rates, args.channels, durations, dtypes, args.directory, args.repeat)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent = 1)
+    print('results written to {0}'.format(args.output), file = sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Synthetic soundscapes for benchmarks
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import wave
+import numpy as np
+from scipy.signal import chirp
+
+
+def soundscape(duration, rate, n_channels, seed = 0):
+    """
+    Generate the samples of a synthetic soundscape
+
+    The soundscape is broadband background noise with
+    intermittent tones (2 - 8 kHz), chirps (3 - 9 kHz),
+    and low frequency bursts (below 1 kHz)
+
+    Parameters
+    ----------
+    duration: float
+        duration in seconds
+
+    rate: integer
+        sample rate in herz
+
+    n_channels: integer
+        number of channels
+
+    seed: integer, default = 0
+        seed of the random number generator
+
+    Returns
+    ----------
+    samples: numpy float64 array in the shape (n_samples, n_channels)
+        with values between -1 and 1
+    """
+
+    rng = np.random.default_rng(seed)
+    n_samples = int(duration * rate)
+    time = np.arange(n_samples) / rate
+    nyquist = rate / 2.
+    samples = 0.01 * rng.standard_normal(size = (n_samples, n_channels))
+    for channel in range(n_channels):
+        # one event per second on average, of each kind
+        for kind in ('tone', 'chirp', 'burst'):
+            for _ in range(max(1, int(duration))):
+                length = int(rng.uniform(0.05, 0.5) * rate)
+                start = rng.integers(0, max(1, n_samples - length))
+                t = time[:length]
+                if kind == 'tone':
+                    frequency = min(rng.uniform(2000, 8000), 0.9 * nyquist)
+                    event = np.sin(2 * np.pi * frequency * t)
+                elif kind == 'chirp':
+                    f0, f1 = sorted(rng.uniform(3000, 9000, size = 2))
+                    event = chirp(t, f0 = min(f0, 0.9 * nyquist), t1 = t[-1],
+                                  f1 = min(f1, 0.9 * nyquist))
+                else:
+                    event = rng.standard_normal(size = length)
+                    # low-pass by a moving average over 1 ms
+                    width = max(1, int(rate / 1000))
+                    event = np.convolve(event, np.ones(width) / width, mode = 'same')
+                event *= np.hanning(length) * rng.uniform(0.05, 0.3)
+                samples[start:start + length, channel] += event[:n_samples - start]
+    return np.clip(samples, -1, 1)
+
+
+def write_soundscape(filepath, duration, rate, n_channels, seed = 0, block_duration = 60.):
+    """
+    Write a synthetic soundscape to a 16-bit WAV file
+
+    The soundscape is generated and written in blocks of 'block_duration'
+    seconds, so long recordings do not need to fit in memory
+
+    Parameters
+    ----------
+    filepath: path of the WAV file
+
+    duration, rate, n_channels, seed:
+        refer to 'soundscape'
+
+    block_duration: float, default = 60.
+        duration in seconds of each generated block
+    """
+
+    with wave.open(filepath, 'wb') as f:
+        f.setnchannels(n_channels)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        start = 0.
+        block = 0
+        while start < duration:
+            samples = soundscape(min(block_duration, duration - start), rate,
+                                 n_channels, seed = seed + block)
+            f.writeframes((samples * (2**15 - 1)).astype('<i2').tobytes())
+            start += block_duration
+            block += 1
@@ -1,2 +1,15 @@
+import importlib
 from .wave import *
-from .utilities import *
\ No newline at end of file
+from .utilities import *
+
+
+# subpackages imported on first access (e.g. nacoustik.noise),
+# so 'import nacoustik' does not load numba, scipy.signal, or matplotlib
+_SUBMODULES = ['spectrum', 'noise', 'index', 'plot', 'batch', 'monitor', 'store', 'ltsa',
+			   'profiling']
+
+
+def __getattr__(name):
+	if name in _SUBMODULES:
+		return importlib.import_module('.' + name, __name__)
+	raise AttributeError("module '{0}' has no attribute '{1}'".format(__name__, name))
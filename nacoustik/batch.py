@@ -0,0 +1,351 @@
+"""
+Batch processing of wave files
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import argparse
+import csv
+import json
+import os
+from contextlib import nullcontext
+from functools import partial
+from glob import glob
+from multiprocessing import Pool
+import numpy as np
+from nacoustik import Wave, warmup
+from nacoustik.utilities import recording_time, _init_worker
+from nacoustik.spectrum import psd, sel, SpectrogramCache
+from nacoustik.noise import remove_background_noise, remove_anthrophony
+from nacoustik.index import calculate_aci
+from nacoustik.profiling import Profile
+from nacoustik.store import ResultStore
+
+
+# columns of the result table
+FIELDS = ['file', 'status', 'duration', 'channels',
+          'anthrophony', 'biophony', 'aci', 'error']
+
+
+def find_files(source, pattern = '*.wav'):
+    """
+    Find the wave files to process
+
+    Parameters
+    ----------
+    source: string
+        path to a directory, which is searched recursively,
+        or path to a manifest file listing one file path per line
+
+    pattern: string, default = '*.wav'
+        file name pattern used when 'source' is a directory
+
+    Returns
+    ----------
+    filepaths: sorted list of file paths
+    """
+
+    if os.path.isdir(source):
+        filepaths = glob(os.path.join(source, '**', pattern), recursive = True)
+    else:
+        base = os.path.dirname(source)
+        with open(source) as manifest:
+            filepaths = [os.path.join(base, line.strip()) for line in manifest
+                         if line.strip() and not line.startswith('#')]
+    return sorted(filepaths)
+
+
+def process_file(filepath, window_length = 1024, window_overlap = 50,
+                 N = 0.1, iterations = 1, cutoffs = (1000, 11000),
+                 limit = 2000, block_duration = 1., cache = None,
+                 dtype = np.float64, bins = False):
+    """
+    Compute the psd, remove noise and compute indices for a wave file
+
+    Parameters
+    ----------
+    filepath: string
+        file path to a WAV file
+
+    window_length, window_overlap:
+        psd analysis window parameters, refer to 'spectrum.psd'
+
+    N, iterations:
+        background noise parameters, refer to 'noise.remove_background_noise'
+
+    cutoffs:
+        anthrophony cutoff frequencies, refer to 'noise.remove_anthrophony'
+
+    limit:
+        frequency separating anthrophony and biophony, refer to 'spectrum.sel'
+
+    block_duration:
+        aci block duration, refer to 'index.calculate_aci'
+
+    cache:
+        spectrogram cache, refer to 'spectrum.psd'
+
+    dtype:
+        float dtype of the spectrogram and all later stages, refer to 'spectrum.psd'
+
+    bins: boolean, default = False
+        include the sound exposure level of each 1 kHz frequency bin
+        ('sel_bins'), refer to 'spectrum.sel'
+
+    Returns
+    ----------
+    row: dictionary with the values of each result column,
+        and the aci of each frequency band averaged over channels ('aci_bands')
+    """
+
+    wave = Wave(filepath)
+    # one FFT thread, the files are processed by parallel workers
+    f, t, a = psd(wave, window_length = window_length, window_overlap = window_overlap,
+                  cache = cache, dtype = dtype, workers = 1)
+    # from the window parameters, as a short recording may have a single window
+    noverlap = int(window_length * (window_overlap / 100.))
+    time_delta = (window_length - noverlap) / float(wave.rate)
+    freq_delta = wave.rate / float(window_length)
+
+    # remove background noise and anthrophony
+    ale = remove_background_noise(a, N = N, iterations = iterations)
+    ale = remove_anthrophony(ale, time_delta, freq_delta, cutoffs = cutoffs)
+
+    # sound exposure level of anthrophony and biophony
+    anthrophony, biophony = sel(a, wave.rate, wave.duration / 60.,
+                                b = np.ma.masked_equal(ale, 0), limit = limit)
+
+    # acoustic complexity index (in watts, removed cells are zero)
+    watts = np.where(ale != 0, 10**(ale / 10), 0)
+    aci = calculate_aci(watts, time_delta, block_duration)
+
+    row = {'file': filepath,
+           'status': 'ok',
+           'duration': wave.duration,
+           'channels': wave.n_channels,
+           'anthrophony': anthrophony,
+           'biophony': biophony,
+           # total aci (sum over frequency bands), averaged over channels
+           'aci': aci.sum(axis = 1).mean(),
+           'error': '',
+           'aci_bands': aci.mean(axis = 0)}
+    if bins:
+        row['sel_bins'] = sel(a, wave.rate, wave.duration / 60., return_bins = True)[0]
+    return row
+
+
+def _process(filepath, profile = False, **parameters):
+    # process a file in a worker, recording errors instead of raising them,
+    # returns the result row and the profile records (or 'None')
+    with Profile(file = filepath) if profile else nullcontext() as p:
+        try:
+            row = process_file(filepath, **parameters)
+        except Exception as error:
+            row = {'file': filepath, 'status': 'error',
+                   'error': '{0}: {1}'.format(type(error).__name__, error)}
+    return row, (p.records if profile else None)
+
+
+def _store_row(row, site):
+    # result row with the columns of the store
+    row = {name: row[name] for name in FIELDS + ['aci_bands', 'sel_bins'] if name != 'error'}
+    row['site'] = site if site is not None else os.path.basename(os.path.dirname(
+        os.path.abspath(row['file'])))
+    time = recording_time(row['file'])
+    row['time'] = np.datetime64(time if time is not None else 'NaT', 'ns')
+    return row
+
+
+def _completed(output):
+    """Return the set of files processed without error in the output file"""
+    if not os.path.exists(output):
+        return set()
+    # discard a partially written last row (e.g. after a crash)
+    with open(output, 'rb+') as f:
+        content = f.read()
+        if content and not content.endswith(b'\n'):
+            f.truncate(content.rfind(b'\n') + 1)
+    with open(output, newline = '') as f:
+        return set(row['file'] for row in csv.DictReader(f)
+                   if row.get('status') == 'ok')
+
+
+def run(source, output, workers = None, pattern = '*.wav', profile = None,
+        store = None, site = None, chunk_size = 100, **parameters):
+    """
+    Process a corpus of wave files in parallel
+
+    One result row is appended to 'output' (a CSV file) per processed file.
+    Files recorded in 'output' with the status 'ok' are skipped,
+    so an interrupted run can be resumed by calling 'run' again.
+    Files recorded with the status 'error' (e.g. after a transient I/O error)
+    are processed again, and a new row is appended for them,
+    so the last row of a file is its current result.
+
+    Parameters
+    ----------
+    source: string or list of file paths
+        path to a directory or manifest file, refer to 'find_files',
+        or a list of file paths
+
+    output: string
+        file path of the CSV result table
+
+    workers: integer, default = None
+        number of worker processes,
+        if 'None', the number of CPUs is used,
+        if 1, files are processed in the calling process
+
+    pattern: string, default = '*.wav'
+        file name pattern used when 'source' is a directory
+
+    profile: string, default = None
+        file path of a JSON lines file, to which the profile records
+        of the stages of each file are appended (refer to 'profiling')
+
+    store: ResultStore object or path to a store directory, default = None
+        store, to which the results of the processed files are appended
+        with the per-band aci ('aci_bands'), the sel of 1 kHz bins ('sel_bins'),
+        the 'site', and the recording 'time' (refer to 'recording_time'),
+        files already in the store are not appended again
+
+    site: string, default = None
+        site of the files in the store,
+        if 'None', the name of the directory of each file
+
+    chunk_size: integer, default = 100
+        number of files of which the results are appended to the store
+        (and the output file) at once
+
+    parameters:
+        keyword arguments passed to 'process_file'
+
+    Returns
+    ----------
+    n_processed: number of files processed
+    """
+
+    if isinstance(source, str):
+        filepaths = find_files(source, pattern)
+    else:
+        filepaths = list(source)
+    completed = _completed(output)
+    pending = [filepath for filepath in filepaths if filepath not in completed]
+
+    write_header = not os.path.exists(output) or os.path.getsize(output) == 0
+    if store is not None:
+        if not isinstance(store, ResultStore):
+            store = ResultStore(store)
+        parameters['bins'] = True
+        # files in the store but not in the output file (after a crash between
+        # the two writes) are processed again, but not appended to the store again
+        stored = set(store.read(['file'])['file'].tolist())
+    else:
+        chunk_size = 1
+    process = partial(_process, profile = profile is not None, **parameters)
+    n_processed = 0
+    with open(output, 'a', newline = '') as f:
+        writer = csv.DictWriter(f, fieldnames = FIELDS, extrasaction = 'ignore')
+        if write_header:
+            writer.writeheader()
+
+        def write(rows):
+            # append rows to the store before the output file,
+            # so files recorded in the output file are in the store
+            if store is not None:
+                store.append_rows(_store_row(row, site) for row in rows
+                                  if row['status'] == 'ok' and row['file'] not in stored)
+            writer.writerows(rows)
+            f.flush()
+
+        if workers == 1:
+            rows = map(process, pending)
+            pool = None
+        else:
+            # compile the kernels once (they are cached on disk) rather than
+            # in every worker, in a separate process, as the threads
+            # of numba parallel kernels must not be started before forking,
+            # and one numba thread in each worker process (as one FFT thread)
+            if pending:
+                with Pool(1, initializer = _init_worker) as warmup_pool:
+                    warmup_pool.apply(warmup, ((parameters.get('dtype', np.float64),),))
+            pool = Pool(workers, initializer = _init_worker)
+            rows = pool.imap_unordered(process, pending)
+        chunk = []
+        try:
+            for row, records in rows:
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    write(chunk)
+                    chunk = []
+                if records:
+                    with open(profile, 'a') as profile_file:
+                        for record in records:
+                            profile_file.write(json.dumps(record, default = str) + '\n')
+                n_processed += 1
+            write(chunk)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+    return n_processed
+
+
+def main(args = None):
+    """Command line interface for 'run'"""
+
+    parser = argparse.ArgumentParser(
+        prog = 'nacoustik-batch',
+        description = 'Compute acoustic indices for a corpus of wave files')
+    parser.add_argument('source',
+                        help = 'directory of wave files or manifest of file paths')
+    parser.add_argument('output', help = 'CSV file to write (or resume) results')
+    parser.add_argument('-w', '--workers', type = int, default = None,
+                        help = 'number of worker processes (default: number of CPUs)')
+    parser.add_argument('--pattern', default = '*.wav',
+                        help = "file name pattern for directories (default: '*.wav')")
+    parser.add_argument('--window-length', type = int, default = 1024)
+    parser.add_argument('--window-overlap', type = int, default = 50)
+    parser.add_argument('--N', type = float, default = 0.1, dest = 'N')
+    parser.add_argument('--iterations', type = int, default = 1)
+    parser.add_argument('--cutoffs', type = int, nargs = 2, default = (1000, 11000))
+    parser.add_argument('--limit', type = int, default = 2000)
+    parser.add_argument('--block-duration', type = float, default = 1.)
+    parser.add_argument('--cache', default = None,
+                        help = 'directory of the spectrogram cache')
+    parser.add_argument('--cache-size', type = float, default = 10.,
+                        help = 'maximum size of the spectrogram cache in GiB (default: 10)')
+    parser.add_argument('--profile', default = None,
+                        help = 'JSON lines file to append the profile records of each stage')
+    parser.add_argument('--store', default = None,
+                        help = 'directory of a result store to append the results to')
+    parser.add_argument('--site', default = None,
+                        help = 'site of the files in the store (default: directory name)')
+    parser.add_argument('--chunk-size', type = int, default = 100,
+                        help = 'number of files appended to the store at once (default: 100)')
+    parser.add_argument('--dtype', choices = ['float64', 'float32'], default = 'float64',
+                        help = 'precision of the spectrogram (default: float64)')
+    args = parser.parse_args(args)
+
+    cache = None
+    if args.cache is not None:
+        cache = SpectrogramCache(args.cache, max_size = int(args.cache_size * 2**30))
+
+    n_processed = run(args.source, args.output, workers = args.workers,
+                      pattern = args.pattern, profile = args.profile,
+                      store = args.store, site = args.site, chunk_size = args.chunk_size,
+                      window_length = args.window_length,
+                      window_overlap = args.window_overlap,
+                      N = args.N, iterations = args.iterations,
+                      cutoffs = tuple(args.cutoffs), limit = args.limit,
+                      block_duration = args.block_duration, cache = cache,
+                      dtype = np.dtype(args.dtype))
+    print('{0} files processed'.format(n_processed))
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,2 @@
-from .indices import *
\ No newline at end of file
+from .indices import *
+from .windows import *
\ No newline at end of file
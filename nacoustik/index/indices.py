@@ -8,52 +8,37 @@ License: MIT
 """
 
 
+from functools import cached_property
 import numpy as np
-from numba import guvectorize, float64
-
-
-# implemented as a universal function via numba.guvectorize
-@guvectorize([(float64[:,:,:], float64[:], float64[:], float64[:,:])], 
-             '(c,f,t),(),()->(c,f)', nopython=True)
-def _calculate_aci(a, time_delta, block_duration, aci):
-    block_delta = int(np.around(block_duration[0] / time_delta[0]))
-    n_blocks = int(np.floor(a.shape[2] / block_delta))
-    remainder = int(a.shape[2] - (block_delta * n_blocks))
-    for channel in range(a.shape[0]):
-        for f_band in range(a.shape[1]):
-            aci_f_band = np.empty(shape=(n_blocks + 1))
-            for block in range(n_blocks):
-                d = np.empty(shape=(block_delta - 1))
-                for t_step in range(block_delta - 1):
-                    d[t_step] = np.abs(a[channel, \
-                                         f_band, \
-                                         (t_step * (block + 1))] - \
-                                       a[channel, \
-                                         f_band, \
-                                         ((t_step * (block + 1)) + 1)])
-                D = d.sum()
-                aci_f_band[block] = D / a[channel, f_band, \
-                                          (block_delta * block): \
-                                          (block_delta * (block + 1))].sum()
-            if remainder > 1:
-                d = np.empty(shape=(remainder - 1))
-                for t_step in range(remainder - 1):
-                    d[t_step] = np.abs(a[channel, \
-                                         f_band, \
-                                         ((t_step * n_blocks) + t_step)] - \
-                                       a[channel, \
-                                         f_band, \
-                                         ((t_step * n_blocks) + t_step + 1)])
-                D = d.sum()
-                aci_f_band[-1] = D / a[channel, \
-                                       f_band, \
-                                       -(remainder + 1):-1].sum()
-            # average aci value over blocks
-            aci[channel, f_band] = aci_f_band.sum() / \
-                                    (n_blocks + (remainder / block_delta))
-
-            
-def calculate_aci(a, time_delta, block_duration=1.):
+from numba import njit, prange
+from nacoustik.profiling import profiled, stage, jit_compiled
+
+
+@njit(parallel=True, cache=True)
+def _calculate_aci(a, block_delta, aci):
+    n_channels, n_bands, n_steps = a.shape
+    for row in prange(n_channels * n_bands):
+        channel = row // n_bands
+        f_band = row % n_bands
+        for block in range(aci.shape[2]):
+            start = block * block_delta
+            stop = min(start + block_delta, n_steps)
+            # sum of absolute differences between adjacent time steps
+            # and total intensity within the block
+            # (accumulated in float64 for any dtype of 'a')
+            d = 0.
+            intensity = np.float64(a[channel, f_band, start])
+            for t_step in range(start + 1, stop):
+                d += abs(a[channel, f_band, t_step] - a[channel, f_band, t_step - 1])
+                intensity += a[channel, f_band, t_step]
+            if intensity > 0:
+                aci[channel, f_band, block] = d / intensity
+            else:
+                aci[channel, f_band, block] = 0.
+
+
+@profiled('calculate_aci')
+def calculate_aci(a, time_delta=None, block_duration=1., kind='mean', level=0):
     """
     Calculates the acoustic complexity index 
     as defined in Pieretti, et al. 2011.
@@ -65,23 +50,300 @@ def calculate_aci(a, time_delta, block_duration=1.):
     
     Parameters
     ----------
-    a: numpy float64 array
+    a: numpy float64 or float32 array
         a 3d array (channels, frequency bands, time steps)
         representing the spectrogram of a wave signal
-        values should be in watts
+        values should be in watts,
+        or a SpectrogramPyramid object
     
     time_delta: float
-        amount of time in seconds represented by each window of the spectrogram
+        amount of time in seconds represented by each window of the spectrogram,
+        required unless 'a' is a pyramid
     
     block_duration: float, default = 1.
         duration in seconds of each calculation interval 
         used in the aci algorithm
     
+    kind: string, default = 'mean'
+        result type, 'mean', 'blocks', or 'both'
+    
+    level: integer or tuple of integers, default = 0
+        level of the spectrogram if 'a' is a SpectrogramPyramid,
+        refer to 'SpectrogramPyramid.level'
+    
     Returns
     ----------
-    aci: numpy float64 array
+    aci: numpy array of the dtype of 'a'
         a 2d array (channels, frequency bands)
-        containing the calculated aci for each frequency band
+        containing the calculated aci for each frequency band,
+        averaged over the blocks (kind = 'mean'),
+        a remaining partial block is weighted by its length
+    
+    aci_blocks: numpy array of the dtype of 'a'
+        a 3d array (channels, frequency bands, blocks)
+        containing the calculated aci of each block (kind = 'blocks'),
+        the last block is partial if the spectrogram is not
+        a multiple of the block duration
+    """
+    
+    # imported here, so 'nacoustik.index' does not load the spectrum subpackage
+    from nacoustik.spectrum.pyramid import SpectrogramPyramid
+    
+    # check parameters
+    if isinstance(a, SpectrogramPyramid):
+        time_delta = a.time_delta(level)
+        f, t, a = a.level(level, units='watts')
+    elif time_delta is None:
+        raise ValueError("'time_delta' is required unless 'a' is a SpectrogramPyramid")
+    if a.ndim == 2:
+        a = np.expand_dims(a, 0)
+    elif a.ndim != 3:
+        raise TypeError("'a' must be 2- or 3-dimensional")
+    if kind not in ['mean', 'blocks', 'both']:
+        raise ValueError("'{0}' is not an acceptable kind".format(kind))
+    
+    # number of time steps in each block
+    block_delta = int(np.around(block_duration / time_delta))
+    if block_delta < 2:
+        raise ValueError("'block_duration' must span at least two time steps")
+    n_blocks = a.shape[2] // block_delta
+    remainder = a.shape[2] - (block_delta * n_blocks)
+    # include a partial block if it has at least one difference
+    n_partial = 1 if remainder > 1 else 0
+    
+    # calculate aci of each block
+    aci_blocks = np.empty(shape=(a.shape[0], a.shape[1], n_blocks + n_partial), dtype=a.dtype)
+    with stage('aci_kernel') as info:
+        n_signatures = len(_calculate_aci.signatures)
+        _calculate_aci(np.ascontiguousarray(a), block_delta, aci_blocks)
+        info['jit_compiled'] = jit_compiled(_calculate_aci, n_signatures)
+    if kind == 'blocks':
+        return aci_blocks
+    
+    # average aci value over blocks
+    weights = np.ones(shape=(n_blocks + n_partial), dtype=a.dtype)
+    if n_partial:
+        weights[-1] = remainder / block_delta
+    aci = (aci_blocks * weights).sum(axis=2) / weights.sum()
+    if kind == 'both':
+        return aci, aci_blocks
+    return aci
+
+
+class _Intermediates:
+    """
+    Quantities of a spectrogram shared by several indices,
+    each computed once, when first used
+    """
+    
+    def __init__(self, a, f, t, parameters):
+        self.a = a
+        self.f = f
+        self.t = t
+        self.parameters = parameters
+    
+    @cached_property
+    def freq_delta(self):
+        # width of the frequency bands in herz
+        if len(self.f) < 2:
+            raise ValueError("'f' must have at least two frequency bands")
+        return self.f[1] - self.f[0]
+    
+    @cached_property
+    def time_delta(self):
+        # time between the analysis windows in seconds, indices which
+        # do not use it are computed for a single analysis window
+        if len(self.t) < 2:
+            raise ValueError("'t' must have at least two time steps for the "
+                             "time-dependent indices (e.g. aci)")
+        return self.t[1] - self.t[0]
+    
+    def band(self, low, high):
+        # slice of the frequency bands in the range [low, high)
+        return slice(np.searchsorted(self.f, low), np.searchsorted(self.f, high))
+    
+    @cached_property
+    def watts(self):
+        # spectrogram in watts
+        return 10**(self.a / 10)
+    
+    @cached_property
+    def spectrum(self):
+        # mean spectrum in watts (channels, frequency bands)
+        return self.watts.mean(axis=2)
+    
+    @cached_property
+    def envelope(self):
+        # energy of each time step in watts (channels, time steps)
+        return self.watts.sum(axis=1)
+    
+    @cached_property
+    def occupancy(self):
+        # proportion of cells above the decibel threshold (relative to the
+        # maximum of each channel) in each frequency bin (channels, bins)
+        step = self.parameters['frequency_step']
+        max_frequency = self.parameters['max_frequency']
+        starts = np.searchsorted(self.f, np.arange(0, max_frequency, step))
+        stops = np.searchsorted(self.f, np.minimum(np.arange(step, max_frequency + step, step),
+                                                   max_frequency))
+        # ignore bins without frequency bands (above the nyquist frequency)
+        starts, stops = starts[stops > starts], stops[stops > starts]
+        above = self.a > (self.a.max(axis=(1, 2), keepdims=True) + 
+                          self.parameters['db_threshold'])
+        cumsum = np.zeros(shape=(self.a.shape[0], self.a.shape[1] + 1))
+        cumsum[:, 1:] = np.cumsum(above.sum(axis=2), axis=1)
+        counts = cumsum[:, stops] - cumsum[:, starts]
+        return counts / ((stops - starts) * self.a.shape[2])
+
+
+def _entropy(p, axis):
+    # normalized Shannon entropy of the distribution p along axis
+    p = p / p.sum(axis=axis, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        h = -np.where(p > 0, p * np.log(p), 0).sum(axis=axis)
+    return h / np.log(p.shape[axis])
+
+
+def _aci(s):
+    aci = calculate_aci(s.watts, s.time_delta, s.parameters['block_duration'])
+    return aci.sum(axis=1)
+
+
+def _adi(s):
+    p = s.occupancy / s.occupancy.sum(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return -np.where(p > 0, p * np.log(p), 0).sum(axis=1)
+
+
+def _aei(s):
+    # gini coefficient of the occupancy of the frequency bins
+    x = np.sort(s.occupancy, axis=1)
+    n = x.shape[1]
+    rank = np.arange(1, n + 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (2 * (rank * x).sum(axis=1)) / (n * x.sum(axis=1)) - (n + 1) / n
+
+
+def _bi(s):
+    spectrum = 10 * np.log10(s.spectrum[:, s.band(*s.parameters['bi_range'])])
+    return (spectrum - spectrum.min(axis=1, keepdims=True)).sum(axis=1) * (s.freq_delta / 1000)
+
+
+def _ndsi(s):
+    anthrophony = s.spectrum[:, s.band(*s.parameters['anthrophony'])].sum(axis=1)
+    biophony = s.spectrum[:, s.band(*s.parameters['biophony'])].sum(axis=1)
+    return (biophony - anthrophony) / (biophony + anthrophony)
+
+
+def _hs(s):
+    return _entropy(s.spectrum, axis=1)
+
+
+def _ht(s):
+    return _entropy(s.envelope, axis=1)
+
+
+def _h(s):
+    return _hs(s) * _ht(s)
+
+
+def _events(s):
+    # number of times the envelope rises above the background level
+    # (median of the envelope) plus the event threshold
+    envelope = 10 * np.log10(s.envelope)
+    background = np.median(envelope, axis=1, keepdims=True)
+    above = envelope > (background + s.parameters['event_threshold'])
+    onsets = above[:, 1:] & ~above[:, :-1]
+    return onsets.sum(axis=1) + above[:, 0]
+
+
+# available indices
+INDICES = {'aci': _aci,
+           'adi': _adi,
+           'aei': _aei,
+           'bi': _bi,
+           'ndsi': _ndsi,
+           'hs': _hs,
+           'ht': _ht,
+           'h': _h,
+           'events': _events}
+
+
+@profiled('calculate_indices')
+def calculate_indices(a, f, t, indices=None, block_duration=1., 
+                      db_threshold=-50., frequency_step=1000, max_frequency=10000, 
+                      bi_range=(2000, 8000), anthrophony=(1000, 2000), 
+                      biophony=(2000, 11000), event_threshold=3.):
+    """
+    Calculates a set of acoustic indices from one spectrogram
+    
+    Quantities used by several indices (the spectrogram in watts, 
+    the mean spectrum, the envelope, and the occupancy of frequency bins)
+    are computed once and shared.
+    
+    aci: acoustic complexity index (Pieretti, et al. 2011),
+        summed over frequency bands, refer to 'calculate_aci'
+    adi: acoustic diversity index (Villanueva-Rivera, et al. 2011),
+        Shannon entropy of the proportion of cells above 'db_threshold'
+        in frequency bins of 'frequency_step' up to 'max_frequency'
+    aei: acoustic evenness index (Villanueva-Rivera, et al. 2011),
+        Gini coefficient of the same proportions
+    bi: bioacoustic index (Boelman, et al. 2007),
+        area (decibels x kilohertz) of the mean spectrum
+        above its minimum within 'bi_range'
+    ndsi: normalized difference soundscape index (Kasten, et al. 2012),
+        from the power of the mean spectrum 
+        in the 'anthrophony' and 'biophony' ranges
+    hs, ht, h: spectral, temporal, and total entropy (Sueur, et al. 2008),
+        normalized Shannon entropy of the mean spectrum 
+        and of the envelope (energy of each time step)
+    events: number of acoustic events, 
+        times the envelope rises more than 'event_threshold' decibels 
+        above its median
+    
+    Parameters
+    ----------
+    a: numpy float64 or float32 array
+        a 3d array (channels, frequency bands, time steps)
+        representing the psd spectrogram of a wave signal in decibels
+    
+    f: numpy array of the frequency of each band, as returned by 'psd'
+    
+    t: numpy array of the time of each time step, as returned by 'psd'
+    
+    indices: list of strings, default = None
+        names of the indices to calculate (keys of 'INDICES'),
+        if 'None', all indices are calculated
+    
+    block_duration: float, default = 1.
+        aci block duration in seconds
+    
+    db_threshold: float, default = -50.
+        adi and aei threshold in decibels,
+        relative to the maximum of each channel
+    
+    frequency_step: integer, default = 1000
+        adi and aei frequency bin width in herz
+    
+    max_frequency: integer, default = 10000
+        adi and aei maximum frequency in herz
+    
+    bi_range: tuple of integers, default = (2000, 8000)
+        bi frequency range in herz
+    
+    anthrophony: tuple of integers, default = (1000, 2000)
+        ndsi anthrophony frequency range in herz
+    
+    biophony: tuple of integers, default = (2000, 11000)
+        ndsi biophony frequency range in herz
+    
+    event_threshold: float, default = 3.
+        event threshold in decibels above the median envelope
+    
+    Returns
+    ----------
+    indices: dictionary
+        index name and a numpy array with the index value of each channel
     """
     
     # check parameters
@@ -89,9 +351,22 @@ def calculate_aci(a, time_delta, block_duration=1.):
         a = np.expand_dims(a, 0)
     elif a.ndim != 3:
         raise TypeError("'a' must be 2- or 3-dimensional")
+    if indices is None:
+        indices = list(INDICES)
+    for name in indices:
+        if name not in INDICES:
+            raise ValueError("'{0}' is not an available index".format(name))
     
-    # calculate and return aci
-    return _calculate_aci(a, 
-                          time_delta, 
-                          block_duration,
-                          np.zeros(shape=(a.shape[0], a.shape[1])))
\ No newline at end of file
+    s = _Intermediates(a, f, t, {'block_duration': block_duration,
+                                 'db_threshold': db_threshold,
+                                 'frequency_step': frequency_step,
+                                 'max_frequency': max_frequency,
+                                 'bi_range': bi_range,
+                                 'anthrophony': anthrophony,
+                                 'biophony': biophony,
+                                 'event_threshold': event_threshold})
+    result = {}
+    for name in indices:
+        with stage(name):
+            result[name] = INDICES[name](s)
+    return result
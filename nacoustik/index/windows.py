@@ -0,0 +1,218 @@
+"""
+Time series of acoustic indices
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import numpy as np
+from nacoustik.index.indices import _calculate_aci
+from nacoustik.profiling import profiled, stage
+
+
+def _window_sums(sums, positions):
+    # sums over windows of consecutive segments, as differences of
+    # cumulative sums over the last axis ('positions' are (start, stop) pairs
+    # of segment indices)
+    cumsum = np.zeros(sums.shape[:-1] + (sums.shape[-1] + 1,))
+    np.cumsum(sums, axis=-1, out=cumsum[..., 1:])
+    return cumsum[..., positions[:, 1]] - cumsum[..., positions[:, 0]]
+
+
+@profiled('calculate_windows')
+def calculate_windows(a, f, t, window_duration=60., step=None, b=None,
+                      limit=2000, max_frequency=10000, block_duration=1.,
+                      start_time=None, return_psd=False, chunk_length=4096):
+    """
+    Calculates indices over (possibly overlapping) time windows
+    of a spectrogram, e.g. per minute of a long recording
+
+    The spectrogram is read once, in chunks of time steps:
+    the power of the time steps between consecutive window boundaries
+    and the aci of each block are summed, and the value of each window
+    is the difference of the cumulative sums at its boundaries.
+
+    sel: sound exposure level of all frequency bands per minute, refer to 'spectrum.sel'
+    anthrophony, biophony: sound exposure levels per minute,
+        of the cells removed from 'b' and of 'b',
+        or of the bands below 'limit' and from 'limit' to 'max_frequency'
+        if 'b' is 'None'
+    aci: acoustic complexity index, summed over frequency bands
+        and averaged over channels, of the aci blocks within the window
+        (of 'b' if it is not 'None'), refer to 'calculate_aci'
+    psd_mean: mean power of the spectrogram over time steps,
+        frequency bands and channels in decibels
+
+    Parameters
+    ----------
+    a: numpy float64 or float32 array
+        a 3d array (channels, frequency bands, time steps)
+        representing the psd spectrogram of a wave signal in decibels
+
+    f: numpy array of the frequency of each band, as returned by 'psd'
+
+    t: numpy array of the time of each time step, as returned by 'psd'
+
+    window_duration: float, default = 60.
+        duration of each window in seconds
+
+    step: float, default = None
+        time in seconds between the start of consecutive windows,
+        if 'None', the windows do not overlap (step = window_duration)
+
+    b: numpy float64 or float32 array, default = None
+        a 3d array (channels, frequency bands, time steps)
+        representing the spectrogram of a wave signal (with ale applied),
+        masked (or numpy.ma.masked) cells are not counted, as in 'spectrum.sel'
+        (e.g. numpy.ma.masked_equal(ale, 0) to remove the cells
+        set to 0 by 'noise.remove_anthrophony')
+
+    limit: integer, default = 2000
+        frequency separating anthrophony and biophony (if 'b' is 'None')
+
+    max_frequency: integer, default = 10000
+        maximum frequency of biophony (if 'b' is 'None')
+
+    block_duration: float, default = 1.
+        aci block duration in seconds
+
+    start_time: datetime or pandas Timestamp, default = None
+        start time of the recording,
+        if 'None', the windows are indexed by seconds from the start
+
+    return_psd: boolean, default = False
+        return the mean psd of each window, channel and frequency band
+
+    chunk_length: integer, default = 4096
+        approximate number of time steps converted to watts at once
+
+    Returns
+    ----------
+    windows: pandas DataFrame
+        indexed by the start of each window ('start')
+        with the columns sel, anthrophony, biophony, aci, and psd_mean
+
+    psd: numpy float64 array
+        a 3d array (windows, channels, frequency bands)
+        of the mean psd of each window in decibels (return_psd = True)
+    """
+
+    import pandas as pd
+
+    # check parameters
+    if a.ndim == 2:
+        a = np.expand_dims(a, 0)
+    elif a.ndim != 3:
+        raise TypeError("'a' must be 2- or 3-dimensional")
+    if b is not None and b.ndim == 2:
+        b = np.expand_dims(b, 0)
+    if b is not None and b.shape != a.shape:
+        raise ValueError("'b' must have the shape of 'a'")
+    if step is None:
+        step = window_duration
+
+    if len(t) < 2 or len(f) < 2:
+        raise ValueError("'t' and 'f' must have at least two time steps and frequency bands")
+
+    time_delta = t[1] - t[0]
+    freq_delta = f[1] - f[0]
+    n_steps = a.shape[2]
+
+    # windows in time steps
+    window_length = int(np.around(window_duration / time_delta))
+    step_length = int(np.around(step / time_delta))
+    if window_length < 1 or step_length < 1:
+        raise ValueError("'window_duration' and 'step' must span at least one time step")
+    block_delta = int(np.around(block_duration / time_delta))
+    if block_delta < 2:
+        raise ValueError("'block_duration' must span at least two time steps")
+    starts = np.arange(0, n_steps - window_length + 1, step_length)
+    windows = np.stack([starts, starts + window_length], axis=1)
+
+    # boundaries of the segments of time steps summed in one pass,
+    # and the segments at the start and stop of each window
+    boundaries = np.unique(windows)
+    positions = np.searchsorted(boundaries, windows)
+    n_segments = max(len(boundaries) - 1, 0)
+
+    # frequency bands of anthrophony and biophony (if 'b' is 'None')
+    anthrophony_bands = f < limit
+    biophony_bands = (f >= limit) & (f < max_frequency)
+
+    sums = np.zeros(shape=(a.shape[0], a.shape[1], n_segments))
+    sums_b = np.zeros_like(sums) if b is not None else None
+    n_blocks = n_steps // block_delta
+    aci_blocks = np.zeros(shape=(a.shape[0], n_blocks))
+    # chunks of whole aci blocks
+    chunk_length = block_delta * max(1, chunk_length // block_delta)
+    stop = boundaries[-1] if len(boundaries) else 0
+    for start in range(0, stop, chunk_length):
+        end = min(start + chunk_length, stop)
+        with stage('window_chunk'):
+            # convert to watts
+            watts = 10**(a[:, :, start:end].astype(np.float64) / 10)
+            if b is not None:
+                chunk = b[:, :, start:end]
+                watts_b = np.where(np.ma.getmaskarray(chunk), 0,
+                                   10**(np.ma.getdata(chunk).astype(np.float64) / 10))
+
+            # sum the time steps of each segment starting in the chunk,
+            # and the remaining time steps of the segment started before
+            first = np.searchsorted(boundaries, start, side='right') - 1
+            if first < n_segments:
+                inner = boundaries[(boundaries > start) & (boundaries < end)]
+                offsets = np.concatenate([[start], inner]) - start
+                segments = slice(first, first + len(offsets))
+                sums[:, :, segments] += np.add.reduceat(watts, offsets, axis=2)
+                if b is not None:
+                    sums_b[:, :, segments] += np.add.reduceat(watts_b, offsets, axis=2)
+
+            # aci of the complete blocks of the chunk, summed over frequency bands
+            first_block = start // block_delta
+            n_chunk_blocks = min((end - start) // block_delta, n_blocks - first_block)
+            if n_chunk_blocks > 0:
+                aci = np.empty(shape=(a.shape[0], a.shape[1], n_chunk_blocks))
+                _calculate_aci(np.ascontiguousarray(watts_b if b is not None else watts),
+                               block_delta, aci)
+                aci_blocks[:, first_block:first_block + n_chunk_blocks] = aci.sum(axis=1)
+
+    # sums of each window
+    minutes = (window_length * time_delta) / 60.
+    totals = _window_sums(sums, positions)
+    sel = totals.sum(axis=(0, 1)) * freq_delta / minutes
+    if b is not None:
+        totals_b = _window_sums(sums_b, positions)
+        biophony = totals_b.sum(axis=(0, 1)) * freq_delta / minutes
+        anthrophony = sel - biophony
+    else:
+        anthrophony = totals[:, anthrophony_bands].sum(axis=(0, 1)) * freq_delta / minutes
+        biophony = totals[:, biophony_bands].sum(axis=(0, 1)) * freq_delta / minutes
+
+    # aci blocks within each window
+    block_windows = np.stack([-(-windows[:, 0] // block_delta),
+                              np.minimum(windows[:, 1] // block_delta, n_blocks)], axis=1)
+    block_windows[:, 1] = np.maximum(block_windows[:, 1], block_windows[:, 0])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        aci = (_window_sums(aci_blocks, block_windows).mean(axis=0) /
+               (block_windows[:, 1] - block_windows[:, 0]))
+        psd = 10 * np.log10(totals / window_length)
+        data = {'sel': 10 * np.log10(sel),
+                'anthrophony': 10 * np.log10(anthrophony),
+                'biophony': 10 * np.log10(biophony),
+                'aci': aci,
+                'psd_mean': 10 * np.log10(totals.mean(axis=(0, 1)) / window_length)}
+
+    # index by the start of each window
+    seconds = starts * time_delta
+    if start_time is None:
+        index = pd.Index(seconds, name='start')
+    else:
+        index = pd.DatetimeIndex(pd.Timestamp(start_time) + pd.to_timedelta(seconds, unit='s'),
+                                 name='start')
+    windows = pd.DataFrame(data, index=index)
+    if return_psd:
+        return windows, np.moveaxis(psd, 2, 0)
+    return windows
@@ -0,0 +1,339 @@
+"""
+Long-term spectral average (LTSA)
+
+An LTSA has one column for each time slice (e.g. each minute) of a series
+of recordings, the psd mean of the slice. Files are read in blocks
+(refer to 'spectrum.psd_blocks') and their columns are appended to a
+matrix on disk, so memory use does not depend on the length of the
+deployment, and new recordings can be appended to an existing LTSA.
+
+Example
+----------
+ltsa = build_ltsa(find_files('deployment'), 'deployment.ltsa', slice_duration = 60.)
+times, values = ltsa.read(start = '2024-06-01', end = '2024-06-02')
+plot_ltsa(ltsa, start = '2024-06-01', end = '2024-06-02', filepath = 'june-1.png')
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import json
+import os
+import numpy as np
+from nacoustik import Wave
+from nacoustik.spectrum import psd_blocks
+from nacoustik.utilities import recording_time
+from nacoustik.profiling import profiled, stage
+
+
+class LTSA:
+    """
+    Long-term spectral average stored in a directory
+
+    The directory holds the parameters ('ltsa.json'), the psd mean
+    of each column in decibels ('values.f32', float32 in the shape
+    (columns, channels, frequency bands)), the start time of each column
+    ('times.i8', datetime64[ns]), and the processed files with the number
+    of columns after each file and the end time of each file
+    ('files.txt'). Columns written after
+    the last recorded file (e.g. of an interrupted build) are discarded
+    when the LTSA is opened.
+    """
+
+
+    def __init__(self, directory):
+        """
+
+        Parameters
+        ----------
+        directory: path to the LTSA directory, created if it does not exist
+        """
+
+        self.directory = directory
+        os.makedirs(directory, exist_ok = True)
+        self.parameters = None
+        path = os.path.join(directory, 'ltsa.json')
+        if os.path.exists(path):
+            with open(path) as f:
+                self.parameters = json.load(f)
+            self.f = np.array(self.parameters['f'])
+            self._repair()
+
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+
+    def _column_size(self):
+        # number of bytes of a column of values
+        return self.parameters['n_channels'] * len(self.parameters['f']) * 4
+
+
+    def _repair(self):
+        # truncate the matrix to the columns of the recorded files
+        files = self.files()
+        n_columns = files[-1][1] if files else 0
+        for name, size in [('values.f32', self._column_size()), ('times.i8', 8)]:
+            path = self._path(name)
+            if not os.path.exists(path) or os.path.getsize(path) != n_columns * size:
+                with open(path, 'ab') as f:
+                    f.truncate(n_columns * size)
+
+
+    def files(self):
+        """Return the processed files as (file path, number of columns after the file,
+        end time of the file) tuples"""
+
+        path = self._path('files.txt')
+        if not os.path.exists(path):
+            return []
+        files = []
+        with open(path) as f:
+            for line in f.read().splitlines():
+                if line:
+                    filepath, n_columns, end_time = line.rsplit('\t', 2)
+                    files.append((filepath, int(n_columns), np.datetime64(int(end_time), 'ns')))
+        return files
+
+
+    @property
+    def n_columns(self):
+        if self.parameters is None:
+            return 0
+        return os.path.getsize(self._path('times.i8')) // 8
+
+
+    def initialize(self, f, n_channels, **parameters):
+        """
+        Write the parameters of a new LTSA,
+        or check that they are the parameters of an existing LTSA
+
+        Parameters
+        ----------
+        f: numpy array of the frequency of each band
+
+        n_channels: integer
+            number of channels
+
+        parameters: keyword arguments (json values)
+            parameters of the spectrogram and time slices
+        """
+
+        parameters = dict(parameters, f = [float(value) for value in f], n_channels = int(n_channels))
+        if self.parameters is not None:
+            if self.parameters != json.loads(json.dumps(parameters)):
+                raise ValueError("the parameters differ from those of the LTSA in '{0}'".format(
+                    self.directory))
+            return
+        with open(self._path('ltsa.json'), 'w') as file:
+            json.dump(parameters, file, indent = 1)
+        self.parameters = parameters
+        self.f = np.array(parameters['f'])
+        self._repair()
+
+
+    def append(self, times, values, filepath, end_time):
+        """
+        Append the columns of a file
+
+        Parameters
+        ----------
+        times: numpy datetime64 array of the start time of each column
+
+        values: numpy float array
+            a 3d array (columns, channels, frequency bands)
+            of the psd mean of each column in decibels
+
+        filepath: path of the file, recorded as processed
+
+        end_time: numpy datetime64 of the end of the file,
+            the start time of a following file without a start time
+
+        Columns must be appended in time order ('read' searches the times),
+        a ValueError is raised for columns earlier than the last column
+        """
+
+        if self.parameters is None:
+            raise ValueError("the LTSA is not initialized, refer to 'initialize'")
+        values = np.asarray(values, dtype = '<f4')
+        if values.ndim != 3 or values.shape[1:] != (self.parameters['n_channels'], len(self.f)):
+            raise ValueError("'values' must be in the shape (columns, {0}, {1})".format(
+                self.parameters['n_channels'], len(self.f)))
+        times = np.asarray(times, dtype = 'datetime64[ns]')
+        if len(times) != len(values):
+            raise ValueError("'times' and 'values' must have the same number of columns")
+        last = self.times()[-1:]
+        if np.any(np.diff(np.concatenate([last, times])) < np.timedelta64(0, 'ns')):
+            raise ValueError("the columns of '{0}' are earlier than the last column of the LTSA, "
+                             "columns must be appended in time order".format(filepath))
+        n_columns = self.n_columns + len(values)
+        with open(self._path('values.f32'), 'ab') as f:
+            f.write(values.tobytes())
+        with open(self._path('times.i8'), 'ab') as f:
+            f.write(times.astype('<i8').tobytes())
+        # the file is recorded last, so an interrupted append is discarded
+        with open(self._path('files.txt'), 'a') as f:
+            f.write('{0}\t{1}\t{2}\n'.format(filepath, n_columns,
+                                              np.datetime64(end_time, 'ns').astype(np.int64)))
+
+
+    def times(self):
+        """Return the start time of each column (memory-mapped)"""
+
+        if self.n_columns == 0:
+            return np.empty(0, dtype = 'datetime64[ns]')
+        return np.memmap(self._path('times.i8'), dtype = '<i8', mode = 'r').view('datetime64[ns]')
+
+
+    def values(self):
+        """Return the psd mean of each column in decibels (memory-mapped),
+        in the shape (columns, channels, frequency bands)"""
+
+        shape = (self.n_columns, self.parameters['n_channels'], len(self.f))
+        if self.n_columns == 0:
+            return np.empty(shape, dtype = '<f4')
+        return np.memmap(self._path('values.f32'), dtype = '<f4', mode = 'r', shape = shape)
+
+
+    def read(self, start = None, end = None):
+        """
+        Read the columns of a time range
+
+        Parameters
+        ----------
+        start, end: datetime, numpy datetime64, or string, default = None
+            range of the start time of the columns (start <= time < end)
+
+        Returns
+        ----------
+        times: numpy datetime64 array of the start time of each column
+
+        values: numpy float32 array (memory-mapped)
+            a 3d array (columns, channels, frequency bands) in decibels
+        """
+
+        times = self.times()
+        first = 0 if start is None else np.searchsorted(times, np.datetime64(start, 'ns'))
+        last = len(times) if end is None else np.searchsorted(times, np.datetime64(end, 'ns'))
+        return times[first:last], self.values()[first:last]
+
+
+def _file_columns(wave, start_time, windows_per_slice, **parameters):
+    """Return the start times and psd means (in decibels) of the slices of a wave"""
+
+    times, values = [], []
+    # blocks of whole slices
+    block_length = windows_per_slice * max(1, 4096 // windows_per_slice)
+    for f, t, a in psd_blocks(wave, units = 'watts', block_length = block_length, **parameters):
+        offsets = np.arange(0, a.shape[2], windows_per_slice)
+        counts = np.diff(np.append(offsets, a.shape[2]))
+        means = np.add.reduceat(a, offsets, axis = 2, dtype = np.float64) / counts
+        values.append(np.moveaxis(10 * np.log10(means / (parameters['pressure_reference']**2)), 2, 0))
+        # start of each slice (the first sample of its first analysis window)
+        seconds = t[offsets] - parameters['window_length'] / (2. * wave.rate)
+        times.append(start_time + np.around(seconds * 1e9).astype('timedelta64[ns]'))
+    if not values:
+        return np.empty(0, dtype = 'datetime64[ns]'), None
+    return np.concatenate(times), np.concatenate(values)
+
+
+@profiled('build_ltsa')
+def build_ltsa(filepaths, directory, slice_duration = 60., window_length = 1024,
+               window_overlap = 50, window_shape = 'hann', pressure_reference = 20.,
+               start_times = None):
+    """
+    Build (or extend) the long-term spectral average of a series of recordings
+
+    Files already in the LTSA are skipped, so an LTSA is extended
+    by building it again with the files of a longer deployment.
+    Slices do not span files, the last slice of each file
+    may average fewer analysis windows.
+
+    If the start time of every file is known ('start_times' or file names),
+    the files are processed in the order of their start times,
+    otherwise in the order of 'filepaths'. Files starting before
+    the last column of the LTSA raise a ValueError (refer to 'LTSA.append').
+
+    Parameters
+    ----------
+    filepaths: list of file paths (refer to 'batch.find_files')
+
+    directory: path to the LTSA directory
+
+    slice_duration: float, default = 60.
+        duration of each column in seconds
+
+    window_length, window_overlap, window_shape, pressure_reference:
+        psd analysis window parameters, refer to 'spectrum.psd'
+
+    start_times: list of datetimes, default = None
+        start time of each file, if 'None', the start time is read from
+        the file name (refer to 'utilities.recording_time'),
+        or follows the end of the previous file
+        (or 1970-01-01 for the first file)
+
+    Returns
+    ----------
+    ltsa: LTSA object
+    """
+
+    ltsa = LTSA(directory)
+    if ltsa.parameters is not None:
+        parameters = {'slice_duration': slice_duration, 'window_length': window_length,
+                      'window_overlap': window_overlap, 'window_shape': window_shape,
+                      'pressure_reference': pressure_reference}
+        if any(ltsa.parameters[name] != value for name, value in parameters.items()):
+            raise ValueError("the parameters differ from those of the LTSA in '{0}'".format(directory))
+    processed = {filepath: file_end for filepath, n_columns, file_end in ltsa.files()}
+
+    # process the files in the order of their start times, if all are known
+    filepaths = list(filepaths)
+    if start_times is None:
+        start_times = [recording_time(filepath) for filepath in filepaths]
+        if any(start_time is None for start_time in start_times):
+            start_times = None
+    if start_times is not None:
+        start_times = [np.datetime64(start_time, 'ns') for start_time in start_times]
+        order = sorted(range(len(filepaths)), key = lambda i: start_times[i])
+        filepaths = [filepaths[i] for i in order]
+        start_times = [start_times[i] for i in order]
+
+    end_time = None
+    for i, filepath in enumerate(filepaths):
+        if filepath in processed:
+            # a following file without a start time follows this file
+            end_time = processed[filepath]
+            continue
+        with stage('ltsa_file', file = filepath) as info:
+            wave = Wave(filepath)
+            noverlap = int(window_length * (window_overlap / 100.))
+            time_delta = (window_length - noverlap) / float(wave.rate)
+            windows_per_slice = max(1, int(np.around(slice_duration / time_delta)))
+            ltsa.initialize(np.fft.rfftfreq(window_length, 1. / wave.rate), wave.n_channels,
+                            rate = wave.rate, slice_duration = slice_duration,
+                            window_length = window_length, window_overlap = window_overlap,
+                            window_shape = window_shape, pressure_reference = pressure_reference)
+
+            # start time of the file
+            if start_times is not None:
+                start_time = start_times[i]
+            else:
+                start_time = recording_time(filepath)
+                if start_time is None:
+                    start_time = end_time if end_time is not None else np.datetime64(0, 's')
+            start_time = np.datetime64(start_time, 'ns')
+            end_time = start_time + np.timedelta64(int(np.around(wave.duration * 1e9)), 'ns')
+
+            times, values = _file_columns(wave, start_time, windows_per_slice,
+                                          window_length = window_length,
+                                          window_overlap = window_overlap,
+                                          window_shape = window_shape,
+                                          pressure_reference = pressure_reference)
+            if values is None:
+                values = np.empty(shape = (0, wave.n_channels, len(ltsa.f)))
+            ltsa.append(times, values, filepath, end_time)
+            info['columns'] = len(times)
+    return ltsa
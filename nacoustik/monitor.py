@@ -0,0 +1,362 @@
+"""
+Incremental monitoring of live audio
+
+A Monitor receives successive blocks of samples (e.g. from a capture
+process) and emits the indices of every completed interval, using memory
+that depends on the interval length but not on the length of the stream.
+
+Example
+----------
+# samples piped from a capture process,
+# e.g. arecord -f S16_LE -c 2 -r 48000 -t raw
+monitor = Monitor(rate = 48000, n_channels = 2, interval = 60.)
+for result in monitor.run(read_blocks(sys.stdin.buffer, n_channels = 2)):
+    print(result['start'], result['anthrophony'], result['biophony'], result['aci'])
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+from collections import deque
+import numpy as np
+from nacoustik import Wave
+from nacoustik.spectrum import sel, stft_psd
+from nacoustik.noise import remove_anthrophony
+from nacoustik.noise.noise import _noise_profile, _remove_noise
+from nacoustik.index import calculate_aci
+from nacoustik.profiling import profiled, stage
+
+
+class Monitor:
+    """
+    Incremental analysis of a stream of samples
+
+    Between calls, a monitor keeps the samples of the incomplete analysis
+    window, the psd spectrogram and psd sum of the current interval,
+    and the noise histograms of the previous intervals. The noise profile
+    of an interval is determined from histograms with fixed edges
+    (rather than the range of each band, as in 'remove_background_noise'),
+    summed over the 'history' intervals.
+    """
+
+
+    def __init__(self, rate, n_channels, interval = 60., window_length = 1024,
+                 window_overlap = 50, window_shape = 'hann', pressure_reference = 20.,
+                 N = 0.1, iterations = 1, neighborhood = (9, 3), threshold = 10.,
+                 history = 10, db_range = (-100., 100.), bin_width = 0.5,
+                 cutoffs = (1000, 11000), limit = 2000, block_duration = 1.,
+                 dtype = np.float64, workers = None):
+        """
+
+        Parameters
+        ----------
+        rate: integer
+            sample rate of the stream
+
+        n_channels: integer
+            number of channels of the stream
+
+        interval: float, default = 60.
+            duration in seconds between results
+
+        window_length, window_overlap, window_shape, pressure_reference:
+            psd analysis window parameters, refer to 'spectrum.psd'
+
+        N, iterations, neighborhood, threshold:
+            background noise parameters, refer to 'noise.remove_background_noise'
+
+        history: integer, default = 10
+            number of intervals of which the noise histograms are summed
+
+        db_range: tuple of floats, (low, high), default = (-100., 100.)
+            range of the noise histograms in decibels,
+            values outside the range are counted in the first or last bin
+
+        bin_width: float, default = 0.5
+            width of the noise histogram bins in decibels
+
+        cutoffs:
+            anthrophony cutoff frequencies, refer to 'noise.remove_anthrophony'
+
+        limit:
+            frequency separating anthrophony and biophony, refer to 'spectrum.sel'
+
+        block_duration:
+            aci block duration, refer to 'index.calculate_aci'
+
+        dtype: numpy float dtype, default = numpy.float64
+            dtype of the spectrogram, refer to 'spectrum.psd'
+
+        workers: integer, default = None
+            number of FFT threads, refer to 'spectrum.psd'
+        """
+
+        # check parameters
+        if len(neighborhood) != 2 or any(size < 1 or size % 2 == 0 for size in neighborhood):
+            raise ValueError("'neighborhood' must be a tuple of two odd, positive integers")
+        if history < 1:
+            raise ValueError("'history' must be at least 1")
+
+        self.rate = rate
+        self.n_channels = n_channels
+        self.window_length = window_length
+        self._window_overlap = window_overlap
+        self.window_shape = window_shape
+        self.pressure_reference = pressure_reference
+        self.N = N
+        self.iterations = iterations
+        self.neighborhood = neighborhood
+        self.threshold = threshold
+        self.cutoffs = cutoffs
+        self.limit = limit
+        self.block_duration = block_duration
+        self.dtype = np.dtype(dtype)
+        self.workers = workers
+
+        # number of overlapping samples and samples between analysis windows
+        self._noverlap = int(window_length * (window_overlap / 100.))
+        self._hop = window_length - self._noverlap
+        self.time_delta = self._hop / float(rate)
+        self.f = np.fft.rfftfreq(window_length, 1. / rate)
+        n_bands = len(self.f)
+
+        # number of analysis windows of an interval
+        self._n_interval = int(round(interval / self.time_delta))
+        if self._n_interval < neighborhood[1]:
+            raise ValueError("'interval' must span at least {0} analysis windows".format(
+                neighborhood[1]))
+        if block_duration / self.time_delta < 2:
+            raise ValueError("'block_duration' must span at least 2 analysis windows")
+
+        # noise histograms with fixed edges
+        n_bins = int(np.ceil((db_range[1] - db_range[0]) / bin_width))
+        self._edges = db_range[0] + bin_width * np.arange(n_bins + 1)
+        self._bin_width = bin_width
+
+        # state between calls
+        self._buffer = None
+        self._n_windows = 0
+        self._frames = np.empty(shape = (n_channels, n_bands, self._n_interval), dtype = self.dtype)
+        self._n_frames = 0
+        self._psd_sum = np.zeros(shape = (n_channels, n_bands))
+        self._history = deque()
+        self._history_sum = np.zeros(shape = (n_channels, n_bands, n_bins), dtype = np.int64)
+        self._max_history = history
+
+
+    @profiled('Monitor.update')
+    def update(self, samples):
+        """
+        Analyse a block of samples
+
+        Parameters
+        ----------
+        samples: numpy array of samples in the shape (n_samples, n_channels)
+            (or (n_samples,) for a single channel), or a Wave object
+
+        Returns
+        ----------
+        results: list of the results of the intervals completed by the block,
+            refer to 'flush'
+        """
+
+        if type(samples) is Wave:
+            samples = samples.samples
+        samples = np.asarray(samples)
+        if samples.ndim == 1:
+            samples = samples[:, np.newaxis]
+        if samples.ndim != 2 or samples.shape[1] != self.n_channels:
+            raise ValueError("'samples' must be in the shape (n_samples, {0})".format(
+                self.n_channels))
+
+        if self._buffer is not None and len(self._buffer):
+            samples = np.concatenate([self._buffer, samples])
+        results = []
+        if len(samples) >= self.window_length:
+            n_windows = (len(samples) - self._noverlap) // self._hop
+            last = ((n_windows - 1) * self._hop) + self.window_length
+            with stage('spectrogram') as info:
+                f, t, psd = stft_psd(samples[:last], self.rate, window_length = self.window_length,
+                                     window_overlap = self._window_overlap,
+                                     window_shape = self.window_shape, dtype = self.dtype,
+                                     workers = self.workers)
+                info['shape'] = psd.shape
+            self._add(psd, results)
+            samples = samples[n_windows * self._hop:]
+        # keep the samples of the incomplete analysis window
+        self._buffer = samples.copy()
+        return results
+
+
+    def _add(self, psd, results):
+        # add analysis windows (in watts) to the current interval,
+        # appending the result of each completed interval
+        decibels = 10 * np.log10(psd / (self.pressure_reference**2))
+        start = 0
+        while start < psd.shape[2]:
+            stop = min(psd.shape[2], start + self._n_interval - self._n_frames)
+            self._frames[:, :, self._n_frames:self._n_frames + stop - start] = decibels[:, :, start:stop]
+            self._psd_sum += psd[:, :, start:stop].sum(axis = 2, dtype = np.float64)
+            self._n_frames += stop - start
+            if self._n_frames == self._n_interval:
+                results.append(self._emit())
+            start = stop
+
+
+    def _count(self, decibels):
+        # noise histograms of the values of each channel and frequency band
+        shape = self._history_sum.shape
+        bins = np.clip((decibels - self._edges[0]) / self._bin_width, 0, shape[2] - 1).astype(np.int64)
+        bins += (np.arange(shape[0] * shape[1]) * shape[2]).reshape(shape[:2] + (1,))
+        return np.bincount(bins.ravel(), minlength = np.prod(shape)).reshape(shape)
+
+
+    def _emit(self):
+        # compute the results of the current interval and start a new interval
+        n = self._n_frames
+        a = self._frames[:, :, :n]
+        with stage('monitor_interval') as info:
+            info['shape'] = a.shape
+            # count the histograms of the interval (once, rather than every update),
+            # and sum the histograms of the last intervals
+            histograms = self._count(a)
+            self._history.append(histograms)
+            self._history_sum += histograms
+            if len(self._history) > self._max_history:
+                self._history_sum -= self._history.popleft()
+
+            # remove background noise and anthrophony
+            with stage('noise_profile'):
+                edges = np.broadcast_to(self._edges, self._history_sum.shape[:2] + self._edges.shape)
+                modals, cutoffs = _noise_profile(self._history_sum.astype(np.float64), edges, self.N)
+            ale = _remove_noise(a, cutoffs, self.iterations, self.neighborhood, self.threshold)
+            ale = remove_anthrophony(ale, self.time_delta, self.f[1], cutoffs = self.cutoffs)
+
+            # sound exposure level of anthrophony and biophony
+            duration = n * self.time_delta
+            anthrophony, biophony = sel(a, self.rate, duration / 60.,
+                                        b = np.ma.masked_equal(ale, 0), limit = self.limit)
+
+            # acoustic complexity index (in watts, removed cells are zero)
+            watts = np.where(ale != 0, 10**(ale / 10), 0)
+            aci = calculate_aci(watts, self.time_delta, self.block_duration)
+
+            psd_mean = 10 * np.log10(self._psd_sum / n / (self.pressure_reference**2))
+            result = {'start': self._n_windows * self.time_delta,
+                      'duration': duration,
+                      'anthrophony': anthrophony,
+                      'biophony': biophony,
+                      # total aci (sum over frequency bands), averaged over channels
+                      'aci': aci.sum(axis = 1).mean(),
+                      'psd_mean': psd_mean.astype(self.dtype)}
+
+        self._n_windows += n
+        self._n_frames = 0
+        self._psd_sum[:] = 0
+        return result
+
+
+    def flush(self):
+        """
+        Emit the result of the incomplete current interval,
+        e.g. at the end of a stream
+
+        Returns
+        ----------
+        results: list of dictionaries (empty if the interval is too short)
+            with the 'start' time and 'duration' of the interval in seconds,
+            'anthrophony' and 'biophony' sound exposure levels, 'aci'
+            (summed over frequency bands, averaged over channels),
+            and 'psd_mean', the mean psd of each channel in decibels
+        """
+
+        if self._n_frames < max(self.neighborhood[1], 2):
+            return []
+        return [self._emit()]
+
+
+    def run(self, blocks):
+        """
+        Analyse a stream of sample blocks
+
+        Parameters
+        ----------
+        blocks: iterable of sample blocks, refer to 'update'
+
+        Yields
+        ----------
+        result: the result of each interval, refer to 'flush',
+            including the incomplete last interval
+        """
+
+        for block in blocks:
+            yield from self.update(block)
+        yield from self.flush()
+
+
+def read_blocks(source, n_channels, block_size = 4096, dtype = np.int16):
+    """
+    Read blocks of raw, interleaved samples from a file or pipe
+
+    Parameters
+    ----------
+    source: file path or binary file object (e.g. sys.stdin.buffer)
+
+    n_channels: integer
+        number of channels of the stream
+
+    block_size: integer, default = 4096
+        number of samples in each block
+
+    dtype: numpy dtype, default = numpy.int16
+        dtype of the samples
+
+    Yields
+    ----------
+    samples: numpy array of samples in the shape (n_samples, n_channels)
+    """
+
+    dtype = np.dtype(dtype)
+    frame_size = n_channels * dtype.itemsize
+    n_bytes = block_size * frame_size
+    f = open(source, 'rb') if isinstance(source, str) else source
+    try:
+        # bytes of an incomplete frame, a pipe may return part of a frame
+        remainder = b''
+        while True:
+            data = f.read(n_bytes - len(remainder))
+            if not data:
+                break
+            data = remainder + data
+            n_samples = len(data) // frame_size
+            remainder = data[n_samples * frame_size:]
+            if n_samples:
+                yield np.frombuffer(data, dtype = dtype, count = n_samples * n_channels).reshape(
+                    n_samples, n_channels)
+    finally:
+        if f is not source:
+            f.close()
+
+
+def wave_blocks(wave, block_size = 4096):
+    """
+    Read a wave in blocks of samples, e.g. to replay a WAV file as a stream
+
+    Parameters
+    ----------
+    wave: Wave object or file path to an audio file (WAV, FLAC)
+
+    block_size: integer, default = 4096
+        number of samples in each block
+
+    Yields
+    ----------
+    samples: numpy array of samples in the shape (n_samples, n_channels)
+    """
+
+    if type(wave) is not Wave:
+        wave = Wave(wave)
+    yield from wave.blocks(block_size)
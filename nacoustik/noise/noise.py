@@ -9,16 +9,16 @@ License: MIT
 
 
 import numpy as np
-import pandas as pd
-from numba import guvectorize, float64, int64
-from scipy.ndimage import label, find_objects
-from scipy.ndimage.morphology import generate_binary_structure
+from numba import guvectorize, njit, prange, float32, float64, int64
+from nacoustik.profiling import profiled, stage, jit_compiled
 
 
 # implemented as a universal function via numba.guvectorize
 @guvectorize([(float64[:,:,:], int64[:], int64[:], 
+               float64[:,:,:], float64[:,:,:]),
+              (float32[:,:,:], int64[:], int64[:], 
                float64[:,:,:], float64[:,:,:])], 
-             '(c,f,t),(h),(e)->(c,f,h),(c,f,e)', nopython=True)
+             '(c,f,t),(h),(e)->(c,f,h),(c,f,e)', nopython=True, cache=True)
 def _calculate_histograms(a, h_bins, e_bins, hists, edges):
     for channel in range(a.shape[0]):
         for f_band in range(a.shape[1]):
@@ -26,29 +26,153 @@ def _calculate_histograms(a, h_bins, e_bins, hists, edges):
                 np.histogram(a[channel, f_band], h_bins[0])
 
 
-def _find_cutoff_index(histogram, cutoff_count):
-    cumsum = 0.0
-    for index, value in histogram.iteritems():
-        cumsum += value
-        if cumsum >= cutoff_count:
-            break
-    return index
+def _noise_profile(histograms, edges, N):
+    """
+    Determine the modal and cutoff values of every frequency band
+
+    Parameters
+    ----------
+    histograms: numpy float64 array
+        a 3d array (channels, frequency bands, histogram bins)
+        of the histogram counts of each frequency band
 
+    edges: numpy float64 array
+        a 3d array (channels, frequency bands, histogram bins + 1)
+        of the histogram edges of each frequency band
+
+    N: float
+        decimal value (0 - 1) to determine signal cutoff levels
+
+    Returns
+    ----------
+    modals: numpy float64 array
+        a 2d array (channels, frequency bands) of modal values,
+        as a running minimum over the frequency bands
+
+    cutoffs: numpy float64 array
+        a 2d array (channels, frequency bands) of cutoff values,
+        smoothed over the frequency bands
+    """
+
+    n_bins = histograms.shape[2]
+
+    # smooth histograms with a moving average (window of 5 bins),
+    # bins without a complete window are set to 0
+    cumsum = np.cumsum(histograms, axis=2)
+    smoothed = np.zeros_like(histograms)
+    smoothed[:, :, 4:] = cumsum[:, :, 4:]
+    smoothed[:, :, 5:] -= cumsum[:, :, :-5]
+    smoothed[:, :, 4:] /= 5
+
+    # determine modal values
+    modal_indices = np.argmax(smoothed, axis=2)
+    modals = np.take_along_axis(edges, modal_indices[:, :, np.newaxis], axis=2)[:, :, 0]
+    modals = np.minimum.accumulate(np.minimum(modals, 0), axis=1)
+
+    # determine cutoff values, the first bin at which the cumulative count
+    # reaches the cutoff count (or the last bin)
+    cumsum = np.cumsum(smoothed, axis=2)
+    below_modal = np.take_along_axis(cumsum,
+                                     np.maximum(modal_indices - 1, 0)[:, :, np.newaxis],
+                                     axis=2)[:, :, 0]
+    cutoff_counts = np.where(modal_indices > 0, below_modal, 0) * 0.68 * N
+    reached = cumsum >= cutoff_counts[:, :, np.newaxis]
+    cutoff_indices = np.where(reached.any(axis=2), np.argmax(reached, axis=2), n_bins - 1)
+    cutoffs = np.take_along_axis(edges, cutoff_indices[:, :, np.newaxis], axis=2)[:, :, 0]
+
+    # smooth cutoffs over frequency bands with a moving average (window of 5 bands),
+    # bands without a complete window are set to the maximum smoothed value
+    if cutoffs.shape[1] >= 5:
+        smoothed = np.lib.stride_tricks.sliding_window_view(cutoffs, 5, axis=1).mean(axis=2)
+        cutoffs = np.concatenate(
+            [np.repeat(smoothed.max(axis=1, keepdims=True), 4, axis=1), smoothed], axis=1)
+    else:
+        cutoffs = np.full_like(cutoffs, np.nan)
+
+    return modals, cutoffs
+
+
+@njit(nogil=True, cache=True)
+def _sliding_sum(x, size, out):
+    # sums of all windows of 'size' consecutive values, as a running sum
+    # (accumulated in float64, so the sums of float32 values do not drift)
+    total = 0.
+    for i in range(size):
+        total += np.float64(x[i])
+    out[0] = total
+    for i in range(1, len(x) - size + 1):
+        total += np.float64(x[i + size - 1]) - np.float64(x[i - 1])
+        out[i] = total
+
+
+@njit(nogil=True, cache=True)
+def _sliding_min(x, size, out):
+    # minima of all windows of 'size' consecutive values
+    # (van Herk / Gil-Werman algorithm, independent of the window size)
+    n = len(x)
+    prefix = np.empty(n, dtype=x.dtype)
+    suffix = np.empty(n, dtype=x.dtype)
+    for start in range(0, n, size):
+        stop = min(start + size, n)
+        prefix[start] = x[start]
+        for i in range(start + 1, stop):
+            prefix[i] = min(prefix[i - 1], x[i])
+        suffix[stop - 1] = x[stop - 1]
+        for i in range(stop - 2, start - 1, -1):
+            suffix[i] = min(suffix[i + 1], x[i])
+    for i in range(n - size + 1):
+        out[i] = min(suffix[i], prefix[i + size - 1])
+
+
+# number of time steps processed together in the frequency pass of '_denoise'
+_BLOCK_STEPS = 64
+
+
+@njit(parallel=True, cache=True)
+def _denoise(a, b, f_size, t_size, threshold):
+    n_channels, n_bands, n_steps = a.shape
+    # number of frequency bands and time steps with a complete neighborhood
+    n_f = n_bands - f_size + 1
+    n_t = n_steps - t_size + 1
+    f_offset = f_size // 2
+    t_offset = t_size // 2
+    b[:] = 0
+    if n_f < 1 or n_t < 1:
+        return
+    # sums and minima over the frequency extent of the neighborhood,
+    # for blocks of columns (channel, time steps)
+    column_sums = np.empty((n_channels, n_f, n_steps), dtype=a.dtype)
+    column_mins = np.empty((n_channels, n_f, n_steps), dtype=a.dtype)
+    n_blocks = (n_steps + _BLOCK_STEPS - 1) // _BLOCK_STEPS
+    for block in prange(n_channels * n_blocks):
+        channel = block // n_blocks
+        start = (block % n_blocks) * _BLOCK_STEPS
+        stop = min(start + _BLOCK_STEPS, n_steps)
+        columns = np.ascontiguousarray(a[channel, :, start:stop].T)
+        sums = np.empty((stop - start, n_f), dtype=a.dtype)
+        mins = np.empty((stop - start, n_f), dtype=a.dtype)
+        for i in range(stop - start):
+            _sliding_sum(columns[i], f_size, sums[i])
+            _sliding_min(columns[i], f_size, mins[i])
+        column_sums[channel, :, start:stop] = sums.T
+        column_mins[channel, :, start:stop] = mins.T
+    # sums and minima over the time extent of the neighborhood,
+    # for every row (channel, frequency band)
+    size = f_size * t_size
+    for row in prange(n_channels * n_f):
+        channel = row // n_f
+        f_band = row % n_f
+        sums = np.empty(n_t, dtype=a.dtype)
+        mins = np.empty(n_t, dtype=a.dtype)
+        _sliding_sum(column_sums[channel, f_band], t_size, sums)
+        _sliding_min(column_mins[channel, f_band], t_size, mins)
+        for t_step in range(n_t):
+            if sums[t_step] / size < threshold:
+                b[channel, f_band + f_offset, t_step + t_offset] = mins[t_step]
+            else:
+                b[channel, f_band + f_offset, t_step + t_offset] = \
+                    a[channel, f_band + f_offset, t_step + t_offset]
 
-# implemented as a universal function via numba.guvectorize
-@guvectorize([(float64[:,:,:], float64[:,:,:])], 
-             '(c,f,t)->(c,f,t)', nopython=True)
-def _denoise(a, b):
-    for channel in range(2):
-        for f_band in range(4, a.shape[1] - 4):
-            for t_step in range(1, a.shape[2] - 1):
-                neighborhood = a[channel, \
-                                 f_band - 4:f_band + 5, \
-                                 t_step - 1:t_step + 2]
-                if neighborhood.mean() < 10:
-                    b[channel, f_band, t_step] = neighborhood.min()
-                else:
-                    b[channel, f_band, t_step] = neighborhood[4, 1]
 
 # convenience function to subtract two values given in decibels
 # returns 0 if subtraction result is negative
@@ -58,25 +182,70 @@ def _subtract_decibels(a, b):
     return 10 * np.log10(c)
 
 
-def remove_background_noise(a, N=0.1, iterations=1):
+def _remove_noise(a, cutoffs, iterations, neighborhood, threshold):
+    # subtract the cutoff values of each frequency band and denoise,
+    # returns 'a' where the denoised values are not 0
+
+    # subtract cutoff values, set values below the cutoff to 0
+    ale = a - cutoffs.astype(a.dtype)[:, :, np.newaxis]
+    ale[~(ale > 0)] = 0
+
+    b = np.empty_like(ale)
+    for i in range(iterations):
+        with stage('denoise') as info:
+            n_signatures = len(_denoise.signatures)
+            _denoise(ale, b, neighborhood[0], neighborhood[1], threshold)
+            info['jit_compiled'] = jit_compiled(_denoise, n_signatures)
+        ale, b = b, ale
+  
+    # replace values through the ale mask (where ale = 0)
+    mask = ale != 0
+    #a_mask = a * mask
+    #it = np.nditer([cutoffs], flags=['c_index', 'multi_index'], 
+    #               op_flags=[['readonly']])
+    #while not it.finished:
+    #    a_mask[it.multi_index[0], it.multi_index[1]] = \
+    #    _subtract_decibels(a_mask[it.multi_index[0], it.multi_index[1]], 
+    #                       it.value)
+    #    it.iternext()
+    #ale = a_mask * mask
+    
+    #return ale
+    return a * mask
+
+
+@profiled('remove_background_noise')
+def remove_background_noise(a, N=0.1, iterations=1, neighborhood=(9, 3), threshold=10.):
     """
     Removes background noise
     
     Parameters
     ----------
-    a: numpy float64 array
+    a: numpy float64 or float32 array
         a 3d array (channels, frequency bands, time steps)
-        representing the spectrogram of a wave signal
+        representing the spectrogram of a wave signal,
+        the result has the same dtype
     
     N: float, default = 0.1
         decimal value (0 - 1) to determine signal cutoff levels 
     
     iterations: int, default = 1
         number of iterations to run the denoise algorithm
+    
+    neighborhood: tuple of integers, (frequency bands, time steps), default = (9, 3)
+        odd size of the neighborhood used by the denoise algorithm
+    
+    threshold: float, default = 10.
+        values are replaced by the minimum of their neighborhood
+        where the neighborhood mean is below the threshold (in decibels)
     """
     
+    # check parameters
+    if len(neighborhood) != 2 or any(size < 1 or size % 2 == 0 for size in neighborhood):
+        raise ValueError("'neighborhood' must be a tuple of two odd, positive integers")
+    
     # determine number of histogram bins
-    n_bins = np.round(a.shape[1] / 8).astype(np.int)
+    n_bins = int(np.round(a.shape[1] / 8))
         
     # allocate arrays for histograms and edge values
     shape_histograms = (a.shape[0], a.shape[1], n_bins)
@@ -85,106 +254,92 @@ def remove_background_noise(a, N=0.1, iterations=1):
     edges = np.empty(shape_edges)
     
     # call 'calculate_histograms' ufunc
-    histograms, edges = _calculate_histograms(a, 
-         # number of bins in histograms, as an array (hack)
-         # necessary for numba.guvectorize function
-         np.ones(shape=(n_bins), dtype=np.int64) * n_bins, 
-         # number of histogram edges, as an array (hack)
-         np.ones(shape=(n_bins + 1), dtype=np.int64) * (n_bins + 1), 
-         histograms, edges)
-                
-    # allocate array for modal and cutoff values
-    cutoffs = np.empty(shape=(histograms.shape[0], histograms.shape[1]))
-    modals = np.empty(shape=(histograms.shape[0], histograms.shape[1]))
-    # loop through all histograms for each frequency band
-    for channel in range(a.shape[0]):
-        # allocate minimum modal variable
-        modal_minimum = 0
-        for f_band in range(a.shape[1]):
-            # convert histogram to pandas.Series (to use moving average function)
-            histogram = pd.Series(histograms[channel, f_band])
-            # smooth
-            histogram = histogram.rolling(center=False, window=5).mean()
-            # replace NaN values generated by moving average
-            histogram.replace(np.NaN, 0, inplace=True)
-            # determine modal value
-            modal_index = histogram.idxmax()
-            modal = edges[channel, f_band, modal_index]
-            if modal > modal_minimum:
-                modals[channel, f_band] = modal_minimum
-            else:
-                modal_minimum = modal
-                modals[channel, f_band] = modal_minimum
-            # determine cutoff value
-            cutoff_count = histogram[0:modal_index].sum() * 0.68 * N
-            cutoffs[channel, f_band] = edges[channel, f_band, _find_cutoff_index(histogram, cutoff_count)]
+    with stage('histograms'):
+        histograms, edges = _calculate_histograms(a, 
+             # number of bins in histograms, as an array (hack)
+             # necessary for numba.guvectorize function
+             np.ones(shape=(n_bins), dtype=np.int64) * n_bins, 
+             # number of histogram edges, as an array (hack)
+             np.ones(shape=(n_bins + 1), dtype=np.int64) * (n_bins + 1), 
+             histograms, edges)
+    
+    # determine cutoff values for all frequency bands
+    with stage('noise_profile'):
+        modals, cutoffs = _noise_profile(histograms, edges, N)
 
-    #cutoffs_smooth = np.empty(shape=cutoffs.shape)
-    for channel in range(a.shape[0]):
-        smoothed = pd.Series(cutoffs[channel]) \
-                    .rolling(center=False, window=5).mean()
-        # replace NaN values
-        smoothed.replace(np.NaN, smoothed.max(), inplace=True)
-        cutoffs[channel] = smoothed.values
-
-    ale = np.empty_like(a)
-    it = np.nditer([cutoffs], flags=['c_index', 'multi_index'], 
-                    op_flags=[['readonly']])
-    while not it.finished:
-        ale[it.multi_index[0], it.multi_index[1]] = \
-            a[it.multi_index[0], it.multi_index[1]] - it.value
-        it.iternext()
-
-    ale = np.select(condlist=[ale > 0], choicelist=[ale], default=0)
+    return _remove_noise(a, cutoffs, iterations, neighborhood, threshold)
+
+# fields of the region of interest (roi) table returned by 'remove_anthrophony'
+ROI_DTYPE = np.dtype([('channel', np.int32),
+                      ('f_start', np.int32), ('f_stop', np.int32),
+                      ('t_start', np.int32), ('t_stop', np.int32),
+                      ('area', np.int64), ('energy', np.float64)])
 
-    for i in range(iterations):
-        ale = _denoise(ale, np.zeros_like(ale))
-  
-    # replace values through the ale mask (where ale = 0)
-    mask = np.ma.masked_not_equal(ale, value=0).mask
-    #a_mask = a * mask
-    #it = np.nditer([cutoffs], flags=['c_index', 'multi_index'], 
-    #               op_flags=[['readonly']])
-    #while not it.finished:
-    #    a_mask[it.multi_index[0], it.multi_index[1]] = \
-    #    _subtract_decibels(a_mask[it.multi_index[0], it.multi_index[1]], 
-    #                       it.value)
-    #    it.iternext()
-    #ale = a_mask * mask
-    
-    #return ale
-    return a * mask
 
 def _label(ale):
-    s = generate_binary_structure(2, 2)
-    labels = np.empty_like(ale, dtype=np.int32)
-    n_features = np.empty(shape=(2), dtype=np.int32)
-    for channel in range(2):
-        labels[channel], n_features[channel] = label(ale[channel], structure=s)
-    return labels, n_features
-
-def _find_low_rois(cutoff_frequency, rois, n_channels, freq_delta):
-    cutoffs = []
-    for channel in range(n_channels):
-        index = np.ceil(cutoff_frequency / freq_delta).astype(np.int32)
-        cutoffs.append(np.searchsorted(rois[channel][:, 0], index))
-    return cutoffs
-
-def _find_high_rois(cutoff_frequency, rois, n_channels, freq_delta):
-    indices = []
-    for channel in range(n_channels):
-        index = np.ceil(cutoff_frequency / freq_delta).astype(np.int32)
-        indices.append(np.where(rois[channel][:, 1] >= index)[0])
-    return indices
-
-
-def remove_anthrophony(ale, time_delta, freq_delta, cutoffs=(1000, 11000)):
+    # label the connected regions of all channels in a single pass,
+    # regions are 8-connected within a channel and never span channels
+    # (scipy.ndimage is imported here, as it is slow to import)
+    from scipy.ndimage import label, generate_binary_structure
+    s = np.zeros(shape=(3, 3, 3), dtype=bool)
+    s[1] = generate_binary_structure(2, 2)
+    return label(ale, structure=s)
+
+
+def _roi_table(ale, labels, n_features):
+    """
+    Compute the bounding box, area, and energy of every labelled region
+
+    Parameters
+    ----------
+    ale: numpy float64 or float32 array
+        a 3d array (channels, frequency bands, time steps) in decibels
+
+    labels: numpy integer array
+        labels of the regions of 'ale', as returned by '_label'
+
+    n_features: int
+        number of labelled regions
+
+    Returns
+    ----------
+    rois: numpy structured array (ROI_DTYPE)
+        one row per region, ordered by label,
+        start and stop values are (exclusive) band and time step indices,
+        energy is the sum of the region values in watts
+    """
+
+    labels = labels.ravel()
+    positions = np.flatnonzero(labels)
+    roi_labels = labels[positions] - 1
+    channels, f_bands, t_steps = np.unravel_index(positions, ale.shape)
+
+    rois = np.zeros(shape=(n_features), dtype=ROI_DTYPE)
+    # regions do not span channels, so every position of a region has the same channel
+    rois['channel'][roi_labels] = channels
+    for field, values, initial, reduce in (
+            ('f_start', f_bands, ale.shape[1], np.minimum),
+            ('t_start', t_steps, ale.shape[2], np.minimum),
+            ('f_stop', f_bands + 1, 0, np.maximum),
+            ('t_stop', t_steps + 1, 0, np.maximum)):
+        extent = np.full(shape=(n_features), fill_value=initial, dtype=values.dtype)
+        reduce.at(extent, roi_labels, values)
+        rois[field] = extent
+    rois['area'] = np.bincount(roi_labels, minlength=n_features)
+    rois['energy'] = np.bincount(roi_labels,
+                                 weights=10**(ale.ravel()[positions] / 10),
+                                 minlength=n_features)
+    return rois
+
+
+@profiled('remove_anthrophony')
+def remove_anthrophony(ale, time_delta, freq_delta, cutoffs=(1000, 11000), return_rois=False):
     """
     Removes anthrophony from a PSD spectrogram
     
     Parameters
     ----------
-    ale: numpy float64 array
+    ale: numpy float64 or float32 array
         a 3d array (channels, frequency bands, time steps)
         representing the spectrogram of a wave signal (with ale applied)
     
@@ -198,58 +353,32 @@ def remove_anthrophony(ale, time_delta, freq_delta, cutoffs=(1000, 11000)):
         low and high cutoff frequencies that 
         determine what noise events to remove
         (any event with frequencies above and below the range)
+    
+    return_rois: boolean, default = False
+        also return the table of regions of interest (rois),
+        a numpy structured array with the fields
+        channel, f_start, f_stop, t_start, t_stop, area, and energy
+        (start and stop values are band and time step indices,
+        energy is in watts)
     """
     
-    # label
-    s = generate_binary_structure(2, 2)
-    labels = np.empty_like(ale, dtype=np.int32)
-    n_features = np.empty(shape=(2), dtype=np.int32)
-    for channel in range(labels.shape[0]):
-        labels[channel], n_features[channel] = label(ale[channel], structure=s)
-    
-    roi_windows = []
-    for channel in range(labels.shape[0]):
-        roi_windows_channel = find_objects(labels[channel])
-        roi_windows.append(roi_windows_channel)
-    
-    rois = []
-    for channel in range(labels.shape[0]):
-        rois_channel = np.empty(shape=(n_features[channel], 4), dtype=np.int32)
-        index = 0
-        for window in roi_windows[channel]:
-            # frequency band
-            rois_channel[index, 0] = window[0].start
-            rois_channel[index, 1] = window[0].stop
-            # time window
-            rois_channel[index, 2] = window[1].start
-            rois_channel[index, 3] = window[1].stop
-            index += 1
-        rois.append(rois_channel)
-    
-    #low_cutoffs
-    low_cutoffs = []
-    for channel in range(labels.shape[0]):
-        index = np.ceil(cutoffs[0] / freq_delta).astype(np.int32)
-        low_cutoffs.append(np.searchsorted(rois[channel][:, 0], index))
-
-    #high_indices
-    high_indices = []
-    for channel in range(labels.shape[0]):
-        index = np.ceil(cutoffs[1] / freq_delta).astype(np.int32)
-        high_indices.append(np.where(rois[channel][:, 1] >= index)[0])
-      
-    for channel in range(labels.shape[0]):
-        for i in range(0, low_cutoffs[channel]):
-            a_roi = labels[channel, rois[channel][i, 0]:rois[channel][i, 1], rois[channel][i, 2]:rois[channel][i, 3]]
-            mask = np.ma.masked_not_equal(a_roi, value=(i + 1)).mask
-            a_roi = ale[channel, rois[channel][i, 0]:rois[channel][i, 1], rois[channel][i, 2]:rois[channel][i, 3]] * mask
-            ale[channel, rois[channel][i, 0]:rois[channel][i, 1], rois[channel][i, 2]:rois[channel][i, 3]] = a_roi
-    
-    for channel in range(labels.shape[0]):
-        for i in high_indices[channel]:
-            a_roi = labels[channel, rois[channel][i, 0]:rois[channel][i, 1], rois[channel][i, 2]:rois[channel][i, 3]]
-            mask = np.ma.masked_not_equal(a_roi, value=(i + 1)).mask
-            a_roi = ale[channel, rois[channel][i, 0]:rois[channel][i, 1], rois[channel][i, 2]:rois[channel][i, 3]] * mask
-            ale[channel, rois[channel][i, 0]:rois[channel][i, 1], rois[channel][i, 2]:rois[channel][i, 3]] = a_roi
-    
-    return ale
\ No newline at end of file
+    # label the regions of interest (rois) of all channels
+    with stage('label') as info:
+        labels, n_features = _label(ale)
+        info['n_features'] = n_features
+    with stage('roi_table'):
+        rois = _roi_table(ale, labels, n_features)
+    
+    # select rois starting below the low cutoff
+    # or extending above the high cutoff
+    low_index = np.ceil(cutoffs[0] / freq_delta).astype(np.int32)
+    high_index = np.ceil(cutoffs[1] / freq_delta).astype(np.int32)
+    remove = (rois['f_start'] < low_index) | (rois['f_stop'] >= high_index)
+    
+    # zero the selected rois with a lookup table (label 0 is the background)
+    lookup = np.concatenate([[False], remove])
+    ale[lookup[labels]] = 0
+    
+    if return_rois:
+        return ale, rois
+    return ale
@@ -8,24 +8,257 @@ License: MIT
 """
 
 
+import io
+import json
+import os
+from functools import partial
+from multiprocessing import get_context
 import numpy as np
-from nacoustik.spectrum import psd
+from nacoustik.spectrum import psd, psd_blocks, SpectrogramPyramid
 from nacoustik import Wave
+from nacoustik.utilities import _init_worker
 #from nacoustik.colormaps import spectro_white
-import matplotlib.pyplot as plt
-from matplotlib import rcParams
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.image import imsave
+from matplotlib import dates
+from nacoustik.profiling import profiled, stage
 
 
+def _pool_decibels(a, row_factor, column_factor, pooling):
+	# pool blocks of 'row_factor' x 'column_factor' values of a 2d array in decibels,
+	# means are computed in watts
+	rows = np.arange(0, a.shape[0], row_factor)
+	columns = np.arange(0, a.shape[1], column_factor)
+	if pooling == 'max':
+		return np.maximum.reduceat(np.maximum.reduceat(a, rows, axis = 0), columns, axis = 1)
+	watts = np.add.reduceat(np.add.reduceat(10**(a.astype(np.float64) / 10), rows, axis = 0),
+							columns, axis = 1)
+	counts = np.outer(np.diff(np.append(rows, a.shape[0])), np.diff(np.append(columns, a.shape[1])))
+	return 10 * np.log10(watts / counts)
+
+
+def decimate(a, n_rows, n_columns, pooling = 'max', chunk_length = 8192):
+	"""
+	Reduce a spectrogram in decibels to a pixel grid
+	
+	Blocks of frequency bands and time steps are pooled into one pixel,
+	so that the result has at most 'n_rows' x 'n_columns' values.
+	
+	Parameters
+	----------
+	a: numpy float array
+		a 2d array (frequency bands, time steps) in decibels
+	
+	n_rows, n_columns: integers
+		maximum number of pixel rows and columns
+	
+	pooling: string, default = 'max'
+		'max' keeps the loudest value of each block (short events stay visible),
+		'mean' averages the power (in watts) of each block
+	
+	chunk_length: integer, default = 8192
+		approximate number of time steps pooled at once
+	
+	Returns
+	----------
+	pixels: numpy float array
+		a 2d array (rows, columns) in decibels
+	"""
+	
+	# check parameters
+	if pooling not in ['max', 'mean']:
+		raise ValueError("'{0}' is not an acceptable pooling".format(pooling))
+	
+	# number of frequency bands and time steps of each pixel
+	row_factor = max(1, int(np.ceil(a.shape[0] / n_rows)))
+	column_factor = max(1, int(np.ceil(a.shape[1] / n_columns)))
+	
+	# pool chunks of whole pixel columns
+	chunk_length = column_factor * max(1, chunk_length // column_factor)
+	return np.concatenate([_pool_decibels(a[:, start:start + chunk_length],
+										  row_factor, column_factor, pooling)
+						   for start in range(0, a.shape[1], chunk_length)], axis = 1)
+
+
+class SpectrogramFigure:
+	"""
+	Figure of the psd spectrogram and psd mean of each channel of a wave
+	
+	The figure is built with the object-oriented matplotlib interface
+	on an Agg canvas (without pyplot), so it is not shared with other threads
+	and is released with the object. The layout is built once,
+	'update' replaces the image data of each channel,
+	so one figure renders any number of waves with the same channel count.
+	The figure is not shown by matplotlib, notebooks display it
+	as a PNG image ('_repr_png_'), other callers use 'figure' or 'save'.
+	"""
+	
+	
+	def __init__(self, n_channels, dpi = 64, cmap = 'gray_r', vmin = -150., vmax = -50., 
+			pooling = 'max', font = None):
+		"""
+		
+		Parameters
+		----------
+		n_channels: integer
+			number of channels (rows of the figure)
+		
+		dpi: integer, default = 64
+			resolution of the figure, the figure is 920 pixels wide 
+			and 230 pixels high for each channel at 64 dpi
+		
+		cmap, vmin, vmax:
+			colormap of the spectrogram and the decibel values of its limits
+		
+		pooling: string, default = 'max'
+			pooling of the spectrogram to pixels, 'max' or 'mean', refer to 'decimate'
+		
+		font: sequence of font family names, default = None
+			font of the text, used without changing matplotlib rcParams,
+			if 'None', the font of the rcParams is used
+		"""
+		
+		self.n_channels = n_channels
+		self.pooling = pooling
+		
+		# configure figure (a row for each channel)
+		self.figure = Figure(figsize=((920 / 192) * 3, (230 / 192) * 3 * n_channels), dpi=dpi, 
+		                     frameon=False)
+		FigureCanvasAgg(self.figure)
+		self.figure.subplots_adjust(left=0, bottom=0, right=1, top=1, wspace=0, hspace=0)
+		grid = self.figure.add_gridspec(n_channels, 10)
+		
+		# size of each spectrogram in pixels
+		self.n_columns = int(self.figure.get_figwidth() * dpi * 9 / 10)
+		self.n_rows = int(self.figure.get_figheight() * dpi / n_channels)
+		
+		if n_channels == 2:
+			names = ['left', 'right']
+		else:
+			names = ['channel {0}'.format(channel + 1) for channel in range(n_channels)]
+		# add background to 'max frequency' text
+		bbox_properties = dict(boxstyle="square, pad=0", ec='white', fc='white')
+		font_properties = {} if font is None else dict(family=list(font))
+		
+		self.axes, self.images, self.means, self.labels = [], [], [], []
+		for channel in range(n_channels):
+			# psd spectrogram
+			ax_spec = self.figure.add_subplot(grid[channel, 0:9])
+			image = ax_spec.imshow(np.zeros(shape=(1, 1)), cmap=cmap, vmin=vmin, vmax=vmax, 
+			                       origin='lower', aspect='auto', interpolation='nearest')
+			ax_spec.tick_params(length=12,
+			                    bottom=False, labelbottom=False,
+			                    top=False, labeltop=False,
+			                    labelleft=False,
+			                    labelright=False)
+			ax_spec.set_frame_on(False)
+			
+			# psd mean
+			ax_mean = self.figure.add_subplot(grid[channel, 9])
+			mean, = ax_mean.plot([], [], color='black')
+			ax_mean.set(frame_on=False,
+			            xlim=(-150, -100),
+			            xticks = [-150, -100])
+			ax_mean.tick_params(length=12,
+			                    bottom=False, labelbottom=False,
+			                    top=False, labeltop=False,
+			                    left=False, labelleft=False,
+			                    right=False, labelright=False)
+			
+			# text
+			label = ax_spec.text(x=0, y=0, s='', va='top', size=12, bbox=bbox_properties, 
+			                     **font_properties)
+			ax_mean.text(x=-100, y=1, s=names[channel], ha='right', va='top', size=12, 
+			             transform=ax_mean.get_xaxis_transform(), **font_properties)
+			
+			self.axes.append((ax_spec, ax_mean))
+			self.images.append(image)
+			self.means.append(mean)
+			self.labels.append(label)
+	
+	
+	def update(self, f, t, a, a_mean, rate, duration):
+		"""
+		Replace the data of the figure
+		
+		Parameters
+		----------
+		f, t, a, a_mean:
+			frequencies, times, psd spectrogram, and psd mean in decibels,
+			as returned by 'psd' with kind = 'both'
+		
+		rate: sample rate of the wave
+		
+		duration: duration of the wave in seconds
+		"""
+		
+		if a.shape[0] != self.n_channels:
+			raise ValueError("'a' must have {0} channels".format(self.n_channels))
+		
+		# specify frequency bins (width of 1 kiloherz)
+		bins = np.arange(0, (rate / 2), 1000)
+		
+		# extent of the analysis windows
+		time_delta = t[1] - t[0] if len(t) > 1 else t[0] * 2
+		extent = (t[0] - time_delta / 2, t[-1] + time_delta / 2, 0, rate / 2)
+		
+		for channel in range(self.n_channels):
+			ax_spec, ax_mean = self.axes[channel]
+			with stage('decimate') as info:
+				pixels = decimate(a[channel], self.n_rows, self.n_columns, self.pooling)
+				info['shape'] = pixels.shape
+			self.images[channel].set_data(pixels)
+			self.images[channel].set_extent(extent)
+			ax_spec.set(xlim=(0, duration),
+			            ylim=([0, rate / 2]),
+			            xticks = np.arange(30, duration, 30).astype(int),
+			            yticks = bins.astype(int) + 1000)
+			self.means[channel].set_data(a_mean[channel], f)
+			ax_mean.set(ylim=(0, rate / 2))
+			self.labels[channel].set(y=(rate / 2), text="{0:.0f} herz".format(rate / 2))
+	
+	
+	def save(self, target, format = 'png'):
+		"""
+		Write the figure
+		
+		Parameters
+		----------
+		target: file path or binary file object (e.g. io.BytesIO)
+		
+		format: string, default = 'png'
+			image format, refer to matplotlib savefig
+		"""
+		
+		with stage('save'):
+			self.figure.savefig(target, format=format)
+	
+	
+	def _repr_png_(self):
+		# display the figure in notebooks (e.g. IPython, Jupyter)
+		buffer = io.BytesIO()
+		self.figure.savefig(buffer, format='png')
+		return buffer.getvalue()
+
+
+@profiled('plot_spectrogram')
 def plot_spectrogram(wave, rate = None, units = 'decibels', scaling = 'density', 
 		window_length = 1000, window_overlap = 50, window_shape = 'hann', 
-		pressure_reference = 20.):
+		pressure_reference = 20., cache = None, pooling = 'max', 
+		filepath = None, figure = None, level = 0, workers = None):
 	"""
 	Plot the power spectral density (psd) of a wave
 	
+	The spectrogram of each channel is reduced to the pixels 
+	of the figure (refer to 'decimate') and drawn as an image
+	
 	Parameters
 	----------
 	wave: Wave object
-		reference to a nacoustik Wave object
+		reference to a nacoustik Wave object,
+		or a SpectrogramPyramid object (the spectrogram of 'level'
+		is plotted, the psd parameters are ignored)
 		
 	rate: sample rate of signal, default = None
 		required when 'wave' is a numpy array
@@ -49,108 +282,315 @@ def plot_spectrogram(wave, rate = None, units = 'decibels', scaling = 'density',
 	
 	pressure_reference: float, default = 20.
 		reference pressure for measurements in air in micropascals
+	
+	cache: SpectrogramCache object or path to a cache directory, default = None
+		cache of spectrograms, refer to 'psd'
+	
+	pooling: string, default = 'max'
+		pooling of the spectrogram to pixels, 'max' or 'mean', refer to 'decimate'
+	
+	filepath: file path or binary file object, default = None
+		if not 'None', the figure is written to it as a PNG image
+	
+	figure: SpectrogramFigure object, default = None
+		figure to reuse (it must have the channel count of the wave),
+		if 'None', a new figure is created
+	
+	level: integer or tuple of integers, default = 0
+		level of the spectrogram if 'wave' is a SpectrogramPyramid,
+		refer to 'SpectrogramPyramid.level'
+	
+	workers: integer, default = None
+		number of FFT threads, refer to 'psd'
+	
+	Returns
+	----------
+	figure: SpectrogramFigure object, its matplotlib Figure is 'figure.figure'
+		(the figure is not shown, notebooks display the returned object,
+		interactive callers save it or use 'figure.figure')
 	"""
 	
 	# check parameters
-	# check wave
-	if type(wave) is not Wave:
-		wave = Wave(wave)
-	if not hasattr(wave, 'samples'):
-		wave.read()
-	# check rate
-	if rate is None:
-		rate = wave.rate
 	# check units
 	if units not in ['decibels', 'watts']:
 		raise ValueError("'{0}' are not acceptable units".format(units))
 	
-	# parameters to add
-	cmap = 'gray_r'
-	dpi = 192
-	# fig_width
-	# fig_height
-	
-	# compute psd
-	f, t, a, a_mean = psd(wave, rate, units = units, scaling = 'density', kind = 'both', 
-						  window_length = window_length, window_overlap = window_overlap, window_shape = window_shape, 							  pressure_reference = 20.)
-	
-	# configure figure
-	fig = plt.figure(figsize=((920 / dpi) * 3, (460 / dpi) * 3), dpi=dpi)
-	plt.subplots_adjust(left=0, bottom=0, right=1, top=1, wspace=0, hspace=0)
-	
-	# register colormap
-	#plt.register_cmap(cmap=spectro_white())
-	fig.set_frameon(False)
-	
-	# specify frequency bins (width of 1 kiloherz)
-	bins = np.arange(0, (rate / 2), 1000)
-	
-	# psd spectrogram left
-	ax_spec_l = plt.subplot2grid((2, 10), (0, 0), rowspan=1, colspan=9)
-	spec_l = ax_spec_l.pcolormesh(t, f, a[0], cmap=cmap, vmin=-150, vmax=-50)
-	ax_spec_l.set(ylim=([0, rate / 2]),
-	              xticks = np.arange(30, (wave.n_samples / rate), 30).astype(np.int),
-	              yticks = bins.astype(np.int) + 1000)
-	ax_spec_l.tick_params(length=12,
-	                      bottom=False, labelbottom=False,
-	                      top=False, labeltop=False,
-	                      labelleft=False,
-	                      labelright=False)
-	ax_spec_l.set_frame_on(False)
-	
-	# psd mean left
-	ax_mean_l = plt.subplot2grid((2, 10), (0, 9), rowspan=1, colspan=1)
-	ax_mean_l.plot(a_mean[0], f, color='black')
-	ax_mean_l.set(frame_on=False,
-	              xlim=(-150, -100),
-	              ylim=(0, rate / 2),
-	              xticks = [-150, -100])
-	ax_mean_l.tick_params(length=12,
-	                      bottom=False, labelbottom=False,
-	                      top=False, labeltop=False,
-	                      left=False, labelleft=False,
-	                      right=False, labelright=False)
-	
-	# psd spectrogram right
-	ax_spec_r = plt.subplot2grid((2, 10), (1, 0), rowspan=1, colspan=9)
-	spec_r = ax_spec_r.pcolormesh(t, f, a[1], cmap=cmap, vmin=-150, vmax=-50)
-	ax_spec_r.set(ylim=([0, rate / 2]),
-	              xticks = np.arange(30, (wave.n_samples / rate), 30).astype(np.int),
-	              yticks = bins.astype(np.int) + 1000)
-	ax_spec_r.tick_params(length=12,
-	                      bottom=False, labelbottom=False,
-	                      top=False, labeltop=False,
-	                      labelleft=False,
-	                      labelright=False)
-	ax_spec_r.set_frame_on(False)
-	
-	# psd mean right
-	ax_mean_r = plt.subplot2grid((2, 10), (1, 9), rowspan=1, colspan=1)
-	ax_mean_r.plot(a_mean[1], f, color='black')
-	ax_mean_r.set(frame_on=False,
-	              xlim=(-150, -100),
-	              ylim=(0, rate / 2),
-	              xticks = [-150, -100])
-	ax_mean_r.tick_params(length=12,
-	                      bottom=False, labelbottom=False,
-	                      top=False, labeltop=False,
-	                      left=False, labelleft=False,
-	                      right=False, labelright=False)
-	
-	# text
-	# set font
-	rcParams['font.family'] = 'sans-serif'
-	rcParams['font.sans-serif'] = ['Input Sans', 'sans-serif']
-	# add background to 'max frequency' text
-	bbox_properties = dict(boxstyle="square, pad=0", ec='white', fc='white')
-	ax_spec_l.text(x=0, y=(rate / 2), s="{0:.0f} herz".format(rate / 2),
-	               va='top', size=12, bbox=bbox_properties)
-	ax_mean_l.text(x=-100, y=(rate / 2), s="left", ha='right', va='top', size=12)
-	ax_spec_r.text(x=0, y=(rate / 2), s="{0:.0f} herz".format(rate / 2), 
-	               va='top', size=12, bbox=bbox_properties)
-	ax_mean_r.text(x=-100, y=(rate / 2), s="right", ha='right', va='top', size=12)
-	
-	#plt.savefig(plot_filepath, dpi=(dpi / 3))
-	#fig.clear()
-	#plt.close()
-	plt.show()
\ No newline at end of file
+	if isinstance(wave, SpectrogramPyramid):
+		# spectrogram of a pyramid level
+		rate = wave.rate if rate is None else rate
+		duration = wave.duration
+		f, t, a = wave.level(level, units = units)
+		a_mean = wave.mean(level, units = units)
+	else:
+		# check wave
+		if type(wave) is not Wave:
+			wave = Wave(wave)
+		if not hasattr(wave, 'samples'):
+			wave.read()
+		# check rate
+		if rate is None:
+			rate = wave.rate
+		duration = wave.n_samples / rate
+		
+		# compute psd
+		f, t, a, a_mean = psd(wave, rate, units = units, scaling = 'density', kind = 'both', 
+							  window_length = window_length, window_overlap = window_overlap, window_shape = window_shape, 
+							  pressure_reference = pressure_reference, cache = cache, workers = workers)
+	
+	if figure is None:
+		figure = SpectrogramFigure(a.shape[0], pooling = pooling)
+	figure.update(f, t, a, a_mean, rate, duration)
+	if filepath is not None:
+		figure.save(filepath)
+	return figure
+
+
+# figures of a worker process of 'render_spectrograms', by channel count
+_figures = {}
+
+
+def _render(filepath, directory, **parameters):
+	# render the spectrogram of a file in a worker, reusing its figures,
+	# returns the file path and the output path (or the error)
+	try:
+		wave = Wave(filepath)
+		figure = _figures.get(wave.n_channels)
+		if figure is None:
+			figure = _figures[wave.n_channels] = SpectrogramFigure(
+				wave.n_channels, pooling = parameters.get('pooling', 'max'))
+		output = os.path.join(directory, os.path.splitext(wave.basename)[0] + '.png')
+		# one FFT thread in each worker process, the processes use the CPUs
+		plot_spectrogram(wave, figure = figure, filepath = output, workers = 1, **parameters)
+		return filepath, output
+	except Exception as error:
+		return filepath, '{0}: {1}'.format(type(error).__name__, error)
+
+
+def render_spectrograms(filepaths, directory, workers = None, **parameters):
+	"""
+	Render the spectrogram figures of many wave files
+	
+	Each worker process reuses one figure per channel count
+	and writes 'directory/<file name>.png' for each file.
+	
+	The worker processes are started with 'spawn' rather than forked,
+	as a process forked after numba parallel kernels have run (in any
+	part of the program) can hang, so scripts calling 'render_spectrograms'
+	with more than one worker need an 'if __name__ == "__main__":' guard.
+	
+	Parameters
+	----------
+	filepaths: list of file paths to WAV files
+	
+	directory: path to the output directory, created if it does not exist
+	
+	workers: integer, default = None
+		number of worker processes,
+		if 'None', the number of CPUs is used,
+		if 1, files are rendered in the calling process
+	
+	parameters:
+		keyword arguments passed to 'plot_spectrogram'
+	
+	Returns
+	----------
+	results: list of (file path, output path or error message) tuples
+	"""
+	
+	os.makedirs(directory, exist_ok = True)
+	render = partial(_render, directory = directory, **parameters)
+	if workers == 1:
+		return [render(filepath) for filepath in filepaths]
+	# spawned processes do not inherit the numba threads of this process,
+	# one numba thread in each worker process
+	with get_context('spawn').Pool(workers, initializer = _init_worker) as pool:
+		return list(pool.imap_unordered(render, filepaths))
+
+
+def _pool_pairs(pixels, pooling):
+	# pool pairs of adjacent pixel columns (in decibels)
+	columns = np.arange(0, pixels.shape[1], 2)
+	if pooling == 'max':
+		return np.maximum.reduceat(pixels, columns, axis = 1)
+	counts = np.diff(np.append(columns, pixels.shape[1]))
+	watts = np.add.reduceat(10**(pixels / 10), columns, axis = 1)
+	return 10 * np.log10(watts / counts)
+
+
+@profiled('render_tiles')
+def render_tiles(wave, directory, tile_width = 1024, tile_height = 256, pooling = 'max',
+		cmap = 'gray_r', vmin = -150., vmax = -50., window_length = 1000, 
+		window_overlap = 50, window_shape = 'hann', pressure_reference = 20.):
+	"""
+	Render the spectrogram of a wave as a pyramid of PNG tiles
+	
+	The tiles of the last level have one pixel column per analysis window,
+	each level above pools pairs of columns of the level below,
+	and the first level (0) is a single tile of the whole wave.
+	The wave is read in blocks (refer to 'psd_blocks'),
+	so memory use does not depend on the duration of the wave.
+	
+	Tiles are written to 'directory/<channel>/<level>/<tile>.png',
+	and the parameters of the pyramid to 'directory/tiles.json'.
+	
+	Parameters
+	----------
+	wave: Wave object or file path to a WAV file
+	
+	directory: path to the tile directory, created if it does not exist
+	
+	tile_width, tile_height: integers, default = 1024, 256
+		size of each tile in pixels, 
+		frequency bands are pooled to 'tile_height' rows
+	
+	pooling: string, default = 'max'
+		pooling of the spectrogram to pixels, 'max' or 'mean', refer to 'decimate'
+	
+	cmap, vmin, vmax:
+		colormap and the decibel values of its limits
+	
+	window_length, window_overlap, window_shape, pressure_reference:
+		psd analysis window parameters, refer to 'psd'
+	
+	Returns
+	----------
+	n_levels: number of levels of the pyramid
+	"""
+	
+	# check parameters
+	if type(wave) is not Wave:
+		wave = Wave(wave)
+	if pooling not in ['max', 'mean']:
+		raise ValueError("'{0}' is not an acceptable pooling".format(pooling))
+	
+	# number of analysis windows and levels
+	noverlap = int(window_length * (window_overlap / 100.))
+	hop = window_length - noverlap
+	n_windows = max((wave.n_samples - noverlap) // hop, 0)
+	n_tiles = max(int(np.ceil(n_windows / tile_width)), 1)
+	n_levels = int(np.ceil(np.log2(n_tiles))) + 1
+	
+	def write(channel, level, index, pixels):
+		path = os.path.join(directory, str(channel), str(level))
+		os.makedirs(path, exist_ok = True)
+		imsave(os.path.join(path, '{0}.png'.format(index)), pixels, 
+			   cmap = cmap, vmin = vmin, vmax = vmax, origin = 'lower')
+	
+	# pixel columns of each level not yet written, and the index of the next tile
+	pending = [[[] for level in range(n_levels)] for channel in wave.channels]
+	indices = np.zeros(shape = (len(wave.channels), n_levels), dtype = int)
+	
+	def add(channel, level, pixels):
+		# add pixel columns to a level, write its complete tiles,
+		# and add the pooled tiles to the level above
+		pending[channel][level].append(pixels)
+		columns = np.concatenate(pending[channel][level], axis = 1)
+		while columns.shape[1] >= tile_width:
+			tile, columns = columns[:, :tile_width], columns[:, tile_width:]
+			write(channel, level, indices[channel, level], tile)
+			indices[channel, level] += 1
+			if level > 0:
+				add(channel, level - 1, _pool_pairs(tile, pooling))
+		pending[channel][level] = [columns]
+	
+	for f, t, a in psd_blocks(wave, units = 'decibels', window_length = window_length,
+							  window_overlap = window_overlap, window_shape = window_shape,
+							  pressure_reference = pressure_reference, block_length = tile_width):
+		for channel in wave.channels:
+			with stage('decimate'):
+				add(channel, n_levels - 1, decimate(a[channel], tile_height, a.shape[2], pooling))
+	
+	# write the incomplete last tile of each level
+	for channel in wave.channels:
+		for level in range(n_levels - 1, -1, -1):
+			columns = np.concatenate(pending[channel][level], axis = 1) \
+				if pending[channel][level] else np.empty((0, 0))
+			pending[channel][level] = []
+			if columns.size:
+				write(channel, level, indices[channel, level], columns)
+				if level > 0:
+					add(channel, level - 1, _pool_pairs(columns, pooling))
+	
+	with open(os.path.join(directory, 'tiles.json'), 'w') as file:
+		json.dump({'rate': wave.rate, 'n_channels': int(wave.n_channels),
+				   'n_windows': int(n_windows), 'time_delta': hop / float(wave.rate),
+				   'tile_width': tile_width, 'tile_height': tile_height,
+				   'n_levels': n_levels, 'pooling': pooling,
+				   'vmin': vmin, 'vmax': vmax}, file, indent = 1)
+	return n_levels
+
+
+@profiled('plot_ltsa')
+def plot_ltsa(ltsa, start = None, end = None, channel = 0, pooling = 'mean', 
+		cmap = 'gray_r', vmin = None, vmax = None, dpi = 64, size = (1800, 400), 
+		filepath = None):
+	"""
+	Plot a long-term spectral average (LTSA) over a time range
+	
+	The columns of the range are reduced to the pixels of the figure
+	(refer to 'decimate') in chunks, so any range (from minutes to the
+	whole deployment) is plotted with the same memory use.
+	Columns are drawn side by side, gaps between recordings are not shown.
+	
+	Parameters
+	----------
+	ltsa: LTSA object or path to an LTSA directory, refer to 'ltsa.build_ltsa'
+	
+	start, end: datetime, numpy datetime64, or string, default = None
+		time range of the plot, refer to 'LTSA.read'
+	
+	channel: integer, default = 0
+		channel to plot
+	
+	pooling: string, default = 'mean'
+		pooling of the columns to pixels, 'max' or 'mean', refer to 'decimate'
+	
+	cmap, vmin, vmax:
+		colormap and the decibel values of its limits,
+		if 'None', the limits are the range of the values
+	
+	dpi: integer, default = 64
+		resolution of the figure
+	
+	size: tuple of integers, default = (1800, 400)
+		width and height of the figure in pixels
+	
+	filepath: file path or binary file object, default = None
+		if not 'None', the figure is written to it as a PNG image
+	
+	Returns
+	----------
+	figure: matplotlib Figure
+	"""
+	
+	# imported here, so 'nacoustik.plot' does not load the LTSA dependencies
+	from nacoustik.ltsa import LTSA
+	
+	if not isinstance(ltsa, LTSA):
+		ltsa = LTSA(ltsa)
+	times, values = ltsa.read(start, end)
+	if len(times) == 0:
+		raise ValueError("the LTSA has no columns in the time range")
+	
+	figure = Figure(figsize = (size[0] / float(dpi), size[1] / float(dpi)), dpi = dpi)
+	FigureCanvasAgg(figure)
+	ax = figure.add_subplot(1, 1, 1)
+	
+	# pixels of the axes
+	width, height = ax.get_window_extent().size
+	with stage('decimate') as info:
+		pixels = decimate(values[:, channel, :].T, int(height), int(width), pooling)
+		info['shape'] = pixels.shape
+	
+	slice_duration = np.timedelta64(int(ltsa.parameters['slice_duration'] * 1e9), 'ns')
+	extent = (dates.date2num(times[0]), dates.date2num(times[-1] + slice_duration), 
+			  0, ltsa.parameters['rate'] / 2)
+	ax.imshow(pixels, origin = 'lower', aspect = 'auto', interpolation = 'nearest', 
+			  extent = extent, cmap = cmap, vmin = vmin, vmax = vmax)
+	ax.xaxis_date()
+	ax.set_ylabel('frequency (herz)')
+	
+	if filepath is not None:
+		with stage('save'):
+			figure.savefig(filepath, format = 'png')
+	return figure
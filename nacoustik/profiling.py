@@ -0,0 +1,246 @@
+"""
+Profiling of nacoustik stages
+
+Stages of nacoustik (reading waves, computing spectrograms, removing noise,
+computing indices, ...) report their wall time, cpu time, peak memory
+allocation, and array shapes while a Profile is active (in the thread
+running the stage) or a callback is registered. Otherwise stages are not measured.
+
+Example
+----------
+with Profile(memory = True) as profile:
+    f, t, a = psd(wave)
+    ale = remove_background_noise(a)
+records = profile.records
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+
+
+# registered callbacks, called with the records of all threads
+_callbacks = []
+_lock = threading.Lock()
+# active profiles and stack of the stages being measured of each thread
+_local = threading.local()
+
+
+def _profiles():
+    # active profiles of the current thread
+    profiles = getattr(_local, 'profiles', None)
+    if profiles is None:
+        profiles = _local.profiles = []
+    return profiles
+
+
+class Profile:
+    """Collect the records of all stages run while the profile is active,
+    in the thread that entered it (profile other threads with their own Profile)"""
+
+
+    def __init__(self, memory = False, **tags):
+        """
+
+        Parameters
+        ----------
+        memory: boolean, default = False
+            measure the peak memory allocation of each stage with tracemalloc
+            (slows down allocations while active)
+
+        tags:
+            values added to every record (e.g. file = filepath)
+        """
+
+        self.memory = memory
+        self.tags = tags
+        self.records = []
+        self._started_tracemalloc = False
+
+
+    def __enter__(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        _profiles().append(self)
+        return self
+
+
+    def __exit__(self, *exception):
+        _profiles().remove(self)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+
+    def _add(self, record):
+        record = dict(record)
+        record.update(self.tags)
+        self.records.append(record)
+
+
+    def summary(self):
+        """
+        Aggregate the records by stage
+
+        Returns
+        ----------
+        summary: dictionary of stage path and a dictionary with the
+            count, total wall time, total cpu time, and maximum peak memory
+        """
+
+        summary = {}
+        for record in self.records:
+            stage = summary.setdefault(record['path'], {
+                'count': 0, 'wall_time': 0., 'cpu_time': 0., 'peak_memory': None})
+            stage['count'] += 1
+            stage['wall_time'] += record['wall_time']
+            stage['cpu_time'] += record['cpu_time']
+            if record['peak_memory'] is not None:
+                stage['peak_memory'] = max(stage['peak_memory'] or 0, record['peak_memory'])
+        return summary
+
+
+    def write(self, filepath):
+        """Append the records to a file as JSON lines"""
+
+        with open(filepath, 'a') as f:
+            for record in self.records:
+                f.write(json.dumps(record, default = str) + '\n')
+
+
+def add_callback(callback):
+    """
+    Register a function called with the record of every stage
+
+    Parameters
+    ----------
+    callback: function accepting one argument (a dictionary)
+    """
+
+    with _lock:
+        _callbacks.append(callback)
+
+
+def remove_callback(callback):
+    """Unregister a function registered with 'add_callback'"""
+
+    with _lock:
+        _callbacks.remove(callback)
+
+
+def is_active():
+    """Return 'True' if stages of the current thread are measured"""
+
+    return bool(getattr(_local, 'profiles', None) or _callbacks)
+
+
+@contextmanager
+def stage(name, **info):
+    """
+    Measure a stage
+
+    Yields a dictionary of information about the stage (e.g. array shapes),
+    which the stage may update. The record of the stage has the keys
+    stage, path (names of the enclosing stages), start, wall_time, cpu_time,
+    peak_memory (in bytes, 'None' if memory is not traced), and the information
+
+    Parameters
+    ----------
+    name: name of the stage
+
+    info:
+        initial information about the stage
+    """
+
+    if not (getattr(_local, 'profiles', None) or _callbacks):
+        yield info
+        return
+
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        current, peak = tracemalloc.get_traced_memory()
+        # keep the peak of the enclosing stage before resetting it
+        if stack:
+            stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+        tracemalloc.reset_peak()
+    else:
+        current = 0
+    frame = {'name': name, 'current': current, 'peak': current}
+    stack.append(frame)
+    start = time.time()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield info
+    finally:
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        path = '/'.join(f['name'] for f in stack)
+        stack.pop()
+        peak_memory = None
+        if tracing and tracemalloc.is_tracing():
+            peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            peak_memory = peak - frame['current']
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+        record = {'stage': name, 'path': path, 'start': start,
+                  'wall_time': wall, 'cpu_time': cpu, 'peak_memory': peak_memory}
+        record.update(info)
+        profiles = list(getattr(_local, 'profiles', None) or ())
+        with _lock:
+            callbacks = list(_callbacks)
+        for profile in profiles:
+            profile._add(record)
+        for callback in callbacks:
+            callback(record)
+
+
+def _shapes(values):
+    # shapes of the arrays in a sequence of values
+    return [list(value.shape) for value in values if hasattr(value, 'shape')]
+
+
+def profiled(name):
+    """
+    Decorator measuring each call of a function as a stage,
+    with the shapes of its array arguments and results
+    
+    Parameters
+    ----------
+    name: name of the stage
+    """
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not (getattr(_local, 'profiles', None) or _callbacks):
+                return function(*args, **kwargs)
+            with stage(name) as info:
+                shapes = _shapes(args)
+                if shapes:
+                    info['input_shapes'] = shapes
+                result = function(*args, **kwargs)
+                shapes = _shapes(result if isinstance(result, tuple) else (result,))
+                if shapes:
+                    info['output_shapes'] = shapes
+                return result
+        return wrapper
+    return decorator
+
+
+def jit_compiled(kernel, n_signatures):
+    """Return 'True' if a numba kernel was compiled since it had 'n_signatures'"""
+
+    return len(kernel.signatures) > n_signatures
@@ -0,0 +1,289 @@
+"""
+Readers of audio files
+
+A reader provides the properties of an audio file (read from its header)
+and decodes any range of samples without reading the rest of the file.
+Readers are chosen by file extension, further formats are added
+with 'register_reader'.
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import os
+import struct
+from abc import ABC, abstractmethod
+import numpy as np
+
+
+# WAV format tags
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_IEEE_FLOAT = 0x0003
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def _read_header(filepath):
+    """
+    Read the RIFF header of a WAV file
+
+    Parameters
+    ----------
+    filepath: file path to WAV file
+
+    Returns
+    ----------
+    header: dictionary with the format tag, number of channels,
+        sample rate, bit depth, block alignment,
+        and the offset and size (in bytes) of the data chunk
+    """
+
+    header = {}
+    with open(filepath, 'rb') as f:
+        riff, riff_size, wave = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave != b'WAVE':
+            raise ValueError("'{0}' is not a RIFF WAVE file".format(filepath))
+        file_size = os.path.getsize(filepath)
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                break
+            chunk_id, chunk_size = struct.unpack('<4sI', chunk)
+            if chunk_id == b'fmt ':
+                fmt = f.read(chunk_size)
+                (header['format_tag'], header['n_channels'], header['rate'], _,
+                    header['block_align'], header['bit_depth']) = \
+                    struct.unpack('<HHIIHH', fmt[:16])
+                if header['format_tag'] == _WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                    # the first two bytes of the sub-format GUID hold the format tag
+                    header['format_tag'] = struct.unpack('<H', fmt[24:26])[0]
+                # chunks are padded to an even number of bytes
+                f.seek(chunk_size % 2, 1)
+            elif chunk_id == b'data':
+                header['data_offset'] = f.tell()
+                # size may be missing or wrong in files that were not closed properly
+                header['data_size'] = min(chunk_size, file_size - header['data_offset'])
+                break
+            else:
+                f.seek(chunk_size + (chunk_size % 2), 1)
+    if 'format_tag' not in header or 'data_offset' not in header:
+        raise ValueError("'{0}' has no 'fmt ' or 'data' chunk".format(filepath))
+    return header
+
+
+def _sample_dtype(format_tag, bit_depth):
+    """Return the numpy dtype of samples stored with a format tag and bit depth,
+    or 'None' if the samples can not be memory-mapped"""
+
+    if format_tag == _WAVE_FORMAT_PCM:
+        return {8: np.dtype('u1'), 16: np.dtype('<i2'), 32: np.dtype('<i4'),
+                64: np.dtype('<i8')}.get(bit_depth)
+    elif format_tag == _WAVE_FORMAT_IEEE_FLOAT:
+        return {32: np.dtype('<f4'), 64: np.dtype('<f8')}.get(bit_depth)
+    return None
+
+
+def _decode_24(data, n_channels):
+    """Decode packed 24-bit samples to int32 (in the range of 24-bit integers)"""
+
+    packed = np.frombuffer(data, dtype = 'u1').reshape(-1, n_channels, 3)
+    # place the 3 bytes in the upper bytes of an int32,
+    # shifting back extends the sign
+    unpacked = np.zeros(shape = packed.shape[:2] + (4,), dtype = 'u1')
+    unpacked[:, :, 1:] = packed
+    return unpacked.view('<i4')[:, :, 0] >> 8
+
+
+class Reader(ABC):
+    """
+    Reader of an audio file
+
+    Readers do not keep files open between calls,
+    so any number of waves hold a reader without file descriptors.
+
+    Attributes
+    ----------
+    filepath, rate, n_channels, n_samples, bit_depth
+
+    dtype: numpy dtype of the decoded samples
+        (integer samples are not scaled, 24-bit samples are decoded to int32)
+    """
+
+
+    @abstractmethod
+    def read(self, start = 0, stop = None):
+        """
+        Decode the samples from 'start' to 'stop' (sample indices)
+
+        Returns
+        ----------
+        samples: numpy array in the shape (n_samples, n_channels)
+        """
+
+
+    def samples(self):
+        """Return all samples, memory-mapped if the format allows it"""
+
+        return self.read()
+
+
+    def blocks(self, block_size = 2**16):
+        """
+        Decode the samples in consecutive blocks
+
+        Yields
+        ----------
+        samples: numpy array in the shape (block_size, n_channels),
+            the last block may be shorter
+        """
+
+        for start in range(0, self.n_samples, block_size):
+            yield self.read(start, min(start + block_size, self.n_samples))
+
+
+    def close(self):
+        pass
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+    def _range(self, start, stop):
+        # clip a range of sample indices to the samples of the file
+        stop = self.n_samples if stop is None else min(stop, self.n_samples)
+        start = min(max(start, 0), stop)
+        return start, stop
+
+
+class WavReader(Reader):
+    """
+    Reader of WAV files (8-, 16-, 24-, 32-, 64-bit integer and 32-, 64-bit float samples)
+
+    Samples other than 24-bit are memory-mapped,
+    24-bit samples are decoded from the accessed bytes only.
+    """
+
+
+    def __init__(self, filepath):
+        header = _read_header(filepath)
+        self.filepath = filepath
+        self.header = header
+        self.rate = header['rate']
+        self.n_channels = header['n_channels']
+        self.bit_depth = header['bit_depth']
+        self.n_samples = header['data_size'] // header['block_align']
+        self._dtype = _sample_dtype(header['format_tag'], header['bit_depth'])
+        if self._dtype is not None:
+            self.dtype = self._dtype
+        elif header['format_tag'] == _WAVE_FORMAT_PCM and header['bit_depth'] == 24:
+            self.dtype = np.dtype('<i4')
+        else:
+            raise ValueError("'{0}' has an unsupported sample format (format tag {1}, {2} bits)".format(
+                filepath, header['format_tag'], header['bit_depth']))
+
+
+    def samples(self):
+        """Return all samples, memory-mapped (except 24-bit samples)"""
+
+        if self._dtype is None:
+            return self.read()
+        if self.n_samples == 0:
+            return np.empty(shape = (0, self.n_channels), dtype = self.dtype)
+        return np.memmap(self.filepath, dtype = self.dtype, mode = 'r',
+                         offset = self.header['data_offset'],
+                         shape = (self.n_samples, self.n_channels))
+
+
+    def read(self, start = 0, stop = None):
+        start, stop = self._range(start, stop)
+        block_align = self.header['block_align']
+        with open(self.filepath, 'rb') as f:
+            f.seek(self.header['data_offset'] + start * block_align)
+            data = f.read((stop - start) * block_align)
+        if self._dtype is None:
+            return _decode_24(data, self.n_channels)
+        return np.frombuffer(data, dtype = self.dtype).reshape(-1, self.n_channels).copy()
+
+
+class FlacReader(Reader):
+    """
+    Reader of FLAC files (requires the 'soundfile' package)
+
+    Samples are decoded with libsndfile, which seeks to 'start'
+    without decoding the preceding samples. The file is opened
+    for each read, and once for all blocks of 'blocks'.
+    """
+
+
+    def __init__(self, filepath):
+        try:
+            import soundfile
+        except ImportError:
+            raise ImportError("reading FLAC files requires the 'soundfile' package")
+        self.filepath = filepath
+        self._soundfile = soundfile
+        with soundfile.SoundFile(filepath) as f:
+            self.rate = f.samplerate
+            self.n_channels = f.channels
+            self.n_samples = f.frames
+            self.bit_depth = {'PCM_S8': 8, 'PCM_16': 16, 'PCM_24': 24}.get(f.subtype, 16)
+        self.dtype = np.dtype('<i2') if self.bit_depth <= 16 else np.dtype('<i4')
+
+
+    def read(self, start = 0, stop = None):
+        start, stop = self._range(start, stop)
+        with self._soundfile.SoundFile(self.filepath) as f:
+            return self._decode(f, start, stop)
+
+
+    def blocks(self, block_size = 2**16):
+        # consecutive blocks are decoded from one open file
+        with self._soundfile.SoundFile(self.filepath) as f:
+            for start in range(0, self.n_samples, block_size):
+                yield self._decode(f, start, min(start + block_size, self.n_samples))
+
+
+    def _decode(self, f, start, stop):
+        f.seek(start)
+        samples = f.read(stop - start, dtype = self.dtype.name, always_2d = True)
+        if self.bit_depth in (8, 24):
+            # libsndfile returns 8- and 24-bit samples
+            # in the upper bytes of int16 and int32
+            samples >>= 8
+        return samples
+
+
+# readers by file extension
+READERS = {'.wav': WavReader,
+           '.wave': WavReader,
+           '.flac': FlacReader}
+
+
+def register_reader(extension, reader):
+    """
+    Register a reader class for files with an extension
+
+    Parameters
+    ----------
+    extension: string, e.g. '.ogg'
+
+    reader: subclass of 'Reader', called with the file path
+    """
+
+    READERS[extension.lower()] = reader
+
+
+def open_reader(filepath):
+    """Return a reader of an audio file, chosen by its extension"""
+
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension not in READERS:
+        raise ValueError("'{0}' files are not supported".format(extension))
+    return READERS[extension](filepath)
@@ -1 +1,6 @@
-from .analysis import *
\ No newline at end of file
+from .analysis import *
+from .cache import *
+from .stft import *
+from .summary import *
+from .bands import *
+from .pyramid import *
\ No newline at end of file
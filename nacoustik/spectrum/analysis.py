@@ -9,16 +9,36 @@ License: MIT
 
 
 import numpy as np
-from scipy.signal import spectrogram, get_window
 from nacoustik import Wave
+from nacoustik.spectrum.cache import SpectrogramCache
+from nacoustik.spectrum.stft import stft_psd, _window_times
+from nacoustik.spectrum.summary import SpectrumSummary
+from nacoustik.spectrum.bands import sel_bands
+from nacoustik.profiling import profiled, stage
 
 
+def _decibels(a, pressure_reference):
+    # convert power in watts to decibels in place
+    np.log10(a, out = a)
+    a *= 10
+    a -= 10 * np.log10(pressure_reference**2)
+    return a
+
+
+@profiled('psd')
 def psd(wave, rate = None, units = 'decibels', scaling = 'density', kind = 'spectrogram',
         window_length = 1024, window_overlap = 50, window_shape = 'hann', 
-        pressure_reference = 20.):
+        pressure_reference = 20., cache = None, dtype = np.float64, out = None, workers = None,
+        levels = None):
     """
     Estimate the power spectral density (psd) of a wave
     
+    The spectrogram of all channels is computed by 'stft_psd'
+    into one array, which is converted to decibels in place.
+    The mean (kind = 'mean') is accumulated from blocks of the spectrogram
+    (refer to 'psd_blocks'), so memory use does not depend on the length
+    of the wave, unless the spectrogram is read from or written to a cache.
+    
     Parameters
     ----------
     wave: Wave object, file path to a WAV file, or numpy array of WAV signal samples
@@ -48,14 +68,56 @@ def psd(wave, rate = None, units = 'decibels', scaling = 'density', kind = 'spec
     
     pressure_reference: float, default = 20.
         reference pressure for measurements in air in micropascals
+    
+    cache: SpectrogramCache object or path to a cache directory, default = None
+        cache of spectrograms, if the spectrogram of the wave 
+        and parameters is cached, it is not computed again
+    
+    dtype: numpy float dtype, default = numpy.float64
+        dtype of the result, numpy.float32 halves memory use;
+        the relative error of float32 power values is below 1e-6 
+        (below 1e-4 decibels), samples are transformed in float64
+        precision in either case (float32 samples in float32)
+    
+    out: numpy float array, default = None
+        array to write the spectrogram into (e.g. reused for files
+        of the same length), in the shape (channels, frequency bands, time steps),
+        if 'None', an array of 'dtype' is allocated,
+        with kind = 'mean', the mean is computed from the spectrogram in 'out'
+        instead of blocks
+    
+    workers: integer, default = None
+        number of FFT threads, if 'None', all CPUs are used
+    
+    levels: sequence of floats, default = None
+        percents of the percent exceedance levels of each channel and
+        frequency band to return with the mean (kind = 'mean'),
+        e.g. (10, 50, 90) for L10, L50, and L90, estimated from histograms
+        with 0.25 decibel bins, refer to 'SpectrumSummary'
+    
+    Returns
+    ----------
+    f: numpy array of the frequency of each band
+    
+    t: numpy array of the time of each analysis window
+    
+    psd: numpy float array
+        a 3d array (channels, frequency bands, time steps)
+        representing the psd spectrogram (kind = 'spectrogram' or 'both')
+    
+    psd_mean: numpy float array
+        a 2d array (channels, frequency bands)
+        representing the psd mean (kind = 'mean' or 'both')
+    
+    levels: numpy float64 array
+        a 3d array (channels, frequency bands, levels)
+        of the percent exceedance levels (if 'levels' is not 'None')
     """
     
     # check parameters
     # check wave
     if type(wave) is not Wave:
         wave = Wave(wave)
-    if not hasattr(wave, 'samples'):
-        wave.read()
     # check rate
     if rate is None:
         rate = wave.rate
@@ -64,118 +126,292 @@ def psd(wave, rate = None, units = 'decibels', scaling = 'density', kind = 'spec
         raise ValueError("'{0}' are not acceptable units".format(units))
     if kind not in ['spectrogram', 'mean', 'both']:
         raise ValueError("'{0}' is not an acceptable kind".format(kind))
+    if levels is not None and kind != 'mean':
+        raise ValueError("'levels' are only returned with kind = 'mean'")
     
-    # convert window_overlap percent value to decimal value
-    window_overlap = window_overlap / 100.
+    # accumulate the mean from blocks, without the whole spectrogram
+    if kind == 'mean' and cache is None and out is None:
+        f = np.fft.rfftfreq(window_length, 1. / rate)
+        summary = SpectrumSummary(len(wave.channels), len(f), pressure_reference,
+                                  levels = levels is not None)
+        with stage('spectrogram_mean'):
+            for f, t, a in psd_blocks(wave, rate, units = 'watts', scaling = scaling,
+                                      window_length = window_length, window_overlap = window_overlap,
+                                      window_shape = window_shape, block_length = 512,
+                                      dtype = dtype, workers = workers):
+                summary.add(a)
+        # times of the analysis windows, without keeping those of each block
+        t = _window_times(wave.n_samples, rate, window_length, window_overlap)
+        return _summary(f, t, summary, units, levels, dtype)
     
-    # compute the number of analysis windows (used to allocate the result array)
-    n_windows = int(np.ceil(wave.n_samples - (window_overlap * window_length)) / ((1 - window_overlap) * window_length))
+    if not hasattr(wave, 'samples'):
+        wave.read()
+    
+    # check cache
+    if cache is not None:
+        if not isinstance(cache, SpectrogramCache):
+            cache = SpectrogramCache(cache)
+        with stage('cache_get') as info:
+            key = cache.key(wave, rate, window_length, window_overlap, window_shape, scaling,
+                            dtype = dtype)
+            cached = cache.get(key)
+            info['hit'] = cached is not None
+    else:
+        cached = None
     
-    # compute the psd spectrogram for each channel
-    psd = np.array( [ np.empty(shape = (int((window_length / 2) + 1), n_windows)) for channel in wave.channels ] )
-    for channel in wave.channels:
-        f, t, psd[channel] = spectrogram(wave.samples[:, channel], 
-                                         fs = rate, 
-                                         window = window_shape,
-                                         nperseg = window_length, 
-                                         noverlap = window_length * window_overlap, 
-                                         return_onesided = True, 
-                                         scaling = scaling)
+    if cached is not None:
+        f, t, psd = cached
+        if out is not None:
+            out[...] = psd
+            psd = out
+        else:
+            psd = psd.astype(dtype, copy = False)
+    else:
+        # the spectrogram is converted to decibels by 'stft_psd'
+        # unless the watts are cached or averaged
+        in_place = units == 'decibels' and kind == 'spectrogram' and cache is None
+        with stage('spectrogram') as info:
+            f, t, psd = stft_psd(wave.samples, rate, window_length = window_length,
+                                 window_overlap = window_overlap, window_shape = window_shape,
+                                 scaling = scaling, units = 'decibels' if in_place else 'watts',
+                                 pressure_reference = pressure_reference, out = out,
+                                 dtype = dtype, workers = workers)
+            info['shape'] = psd.shape
+        if in_place:
+            return f, t, psd
+        if cache is not None:
+            with stage('cache_put'):
+                cache.put(key, f, t, psd)
     
     # compute psd mean (RMS mean)
-    if kind in ['mean', 'both']:
-        psd_mean = ( psd.sum(axis = 2) / psd.shape[2] )
+    if kind == 'mean':
+        summary = SpectrumSummary(psd.shape[0], psd.shape[1], pressure_reference,
+                                  levels = levels is not None)
+        summary.add(psd)
+        return _summary(f, t, summary, units, levels, psd.dtype)
+    if kind == 'both':
+        psd_mean = ( psd.sum(axis = 2, dtype = np.float64) / psd.shape[2] ).astype(psd.dtype)
         
-    # convert to decibels
+    # convert to decibels (in place, the watts are not used anymore)
     if units == 'decibels':
-        if kind == 'mean':
-            f, t, 10 * np.log10(psd_mean / (pressure_reference**2))
-        elif kind == 'both':
-            return f, t, 10 * np.log10(psd / (pressure_reference**2)), 10 * np.log10(psd_mean / (pressure_reference**2))
+        if kind == 'both':
+            return f, t, _decibels(psd, pressure_reference), _decibels(psd_mean, pressure_reference)
         else:
-            return f, t, 10 * np.log10(psd / (pressure_reference**2))
+            return f, t, _decibels(psd, pressure_reference)
     # return watts
     else:
-        if kind == 'mean':
-            return f, t, psd_mean
-        elif kind == 'both':
+        if kind == 'both':
             return f, t, psd, psd_mean
         else:
             return f, t, psd
 
 
-def sel(a, rate, duration, b=None, limit=2000, bin_width = 1000, return_bins=False):
+def _summary(f, t, summary, units, levels, dtype):
+    # return the psd mean (and levels) of a summary in 'units'
+    psd_mean = summary.mean(units).astype(dtype)
+    if levels is None:
+        return f, t, psd_mean
+    values = summary.levels(levels)
+    if units == 'watts':
+        values = 10**(values / 10) * (summary.pressure_reference**2)
+    return f, t, psd_mean, values
+
+
+def psd_blocks(wave, rate = None, units = 'decibels', scaling = 'density',
+               window_length = 1024, window_overlap = 50, window_shape = 'hann',
+               pressure_reference = 20., block_length = 4096, dtype = np.float64,
+               workers = None):
+    """
+    Estimate the power spectral density (psd) spectrogram of a wave
+    in consecutive blocks of analysis windows
+
+    The wave is read in overlapping blocks of samples, so memory use is
+    bounded by 'block_length' rather than the length of the wave.
+    Concatenating the blocks along the time axis gives the same result
+    as 'psd' with kind = 'spectrogram'.
+
+    Parameters
+    ----------
+    wave: Wave object, file path to an audio file (WAV, FLAC), or numpy array of WAV signal samples
+
+    rate: sample rate of signal, default = None
+        required when 'wave' is a numpy array
+        if 'None', the rate will be determined by the 'wave' object
+
+    units: string, default = 'decibels'
+        result units in 'decibels' or 'watts'
+
+    scaling: string, default = 'density'
+        result scaling, 'spectrum' or 'density'
+
+    window_length: integer, default = 1024
+        length of analysis window in number of samples
+
+    window_overlap: integer, default = 50
+        amount of analysis window overlap in percent
+
+    window_shape: string, default = 'hann'
+        shape of analysis window,
+        refer to scipy.signal for window types
+
+    pressure_reference: float, default = 20.
+        reference pressure for measurements in air in micropascals
+
+    block_length: integer, default = 4096
+        number of analysis windows in each block
+
+    dtype: numpy float dtype, default = numpy.float64
+        dtype of the result, refer to 'psd'
+
+    workers: integer, default = None
+        number of FFT threads, refer to 'psd'
+
+    Yields
+    ----------
+    f: numpy array of the frequency of each band
+
+    t: numpy array of the time of each analysis window in the block
+
+    a: numpy float array
+        a 3d array (channels, frequency bands, time steps)
+        representing the psd spectrogram of the block
+    """
+
+    # check parameters
+    # check wave
+    if type(wave) is not Wave:
+        wave = Wave(wave)
+    # check rate
+    if rate is None:
+        rate = wave.rate
+    # check units
+    if units not in ['decibels', 'watts']:
+        raise ValueError("'{0}' are not acceptable units".format(units))
+    if block_length < 1:
+        raise ValueError("'block_length' must be at least 1")
+
+    # number of overlapping samples and samples between analysis windows
+    noverlap = int(window_length * (window_overlap / 100.))
+    hop = window_length - noverlap
+
+    # compute the number of analysis windows
+    n_windows = (wave.n_samples - noverlap) // hop
+
+    for start in range(0, n_windows, block_length):
+        n_block = min(block_length, n_windows - start)
+        # first and last sample of the block,
+        # including the overlap with the next block
+        first = start * hop
+        last = first + ((n_block - 1) * hop) + window_length
+
+        with stage('psd_block') as info:
+            # samples of files are decoded block by block
+            samples = wave.read_samples(first, last)
+            f, t, psd = stft_psd(samples, rate, window_length = window_length,
+                                 window_overlap = window_overlap, window_shape = window_shape,
+                                 scaling = scaling, units = units,
+                                 pressure_reference = pressure_reference,
+                                 dtype = dtype, workers = workers)
+            info['shape'] = psd.shape
+        # time of each analysis window relative to the start of the wave
+        t = np.arange(window_length / 2 + first,
+                      last - window_length / 2 + 1, hop) / float(rate)
+        yield f, t, psd
+
+
+@profiled('sel')
+def sel(a, rate=None, duration=None, b=None, limit=2000, bin_width = 1000, return_bins=False,
+        level=0, max_frequency=10000):
     """
     Estimate the sound exposure level (sel) per minute from a wave
     
+    The power of the frequency bins, anthrophony and biophony is summed
+    in one pass over the spectrogram, refer to 'sel_bands'
+    
     Parameters
     ----------
-    a: numpy float64 array, required
+    a: numpy float64 or float32 array, required
         a 3d array (channels, frequency bands, time steps)
         representing the psd (power spectral density)
-        spectrogram of a wave signal in decibels
+        spectrogram of a wave signal in decibels,
+        or a SpectrogramPyramid object
         
-    rate: sample rate of signal, required
+    rate: sample rate of signal, required unless 'a' is a pyramid
         
-    duration: duration of signal in minutes, required
+    duration: duration of signal in minutes, required unless 'a' is a pyramid
     
-    b: numpy float64 array, default = None
+    b: numpy float64 or float32 array, default = None
         a 3d array (channels, frequency bands, time steps)
-        representing the spectrogram of a wave signal (with ale applied)
+        representing the spectrogram of a wave signal (with ale applied),
+        masked cells are not counted
         
-    limit: numpy float64 array, default = None
-        frequency separating anthrophony and biophony
+    limit: float, default = 2000
+        frequency separating anthrophony (from 0 to 'limit')
+        and biophony (from 'limit' to 'max_frequency') if 'b' is 'None'
     
     bin_width: int, default = 1000
         width of frequency bins in herz
         
-    bins: boolean, default = False
+    return_bins: boolean, default = False
         return values for each frequency bin of specified bin_width
-
-    """    
+        (if 'b' is 'None')
+    
+    level: integer or tuple of integers, default = 0
+        level of the spectrogram if 'a' is a SpectrogramPyramid,
+        refer to 'SpectrogramPyramid.level', only time levels
+        (frequency level 0) are accepted, as the aggregated bands
+        of frequency levels straddle the edges of the bins
+    
+    max_frequency: float, default = 10000
+        maximum frequency of biophony if 'b' is 'None'
     
-    # convert to watts
-    a = 10**(a / 10)
+    Returns
+    ----------
+    sel: numpy float64 array of the sel of each frequency bin in decibels
+        (return_bins = True)
     
-    # multiply by frequency delta
-    f_delta = (rate / 2) / (a.shape[1] - 1)
-    a = a * f_delta
+    anthrophony, biophony: sel of anthrophony and biophony in decibels,
+        of the cells removed from 'b' and of 'b' if 'b' is not 'None'
+    """    
+    
+    # imported here, as the pyramid module imports 'psd'
+    from nacoustik.spectrum.pyramid import SpectrogramPyramid, _factors
+    time_factor = 1
+    if isinstance(a, SpectrogramPyramid):
+        pyramid = a
+        if _factors(level)[1] != 1:
+            raise ValueError("'level' must have frequency level 0, as the aggregated bands "
+                             "of frequency levels straddle the edges of the bins")
+        rate = pyramid.rate if rate is None else rate
+        duration = pyramid.duration / 60. if duration is None else duration
+        f, t, a = pyramid.level(level)
+        # each time step of the level is the mean of 'time_factor' time steps
+        time_factor = pyramid.time_delta(level) / pyramid.time_delta()
+    elif rate is None or duration is None:
+        raise ValueError("'rate' and 'duration' are required unless 'a' is a SpectrogramPyramid")
+    else:
+        f = np.linspace(0, rate / 2, a.shape[1])
+    # time steps of a pyramid level count 'time_factor' times
+    duration = duration / time_factor
     
-    # compute sel for separate frequency bins if b is None
     if b is None:
-        # compute frequency bins of spectrogram
-        f = np.arange(0, (rate / 2) + f_delta, f_delta)
-        # determine frequency bins for sel
-        bins = np.arange(0, (rate / 2), bin_width)
-        bin_bound_indicies = np.searchsorted(f, bins)
-        # include last index
-        bin_bound_indicies = np.append(bin_bound_indicies, a.shape[1])
-        
-        # compute sel
-        sel = np.empty(len(bins))
-        for i in (bins / bin_width).astype(np.int):
-            low_bound = bin_bound_indicies[i]
-            high_bound = bin_bound_indicies[i + 1]
-            sel[i] = (a[:, low_bound:high_bound, :].sum())
-        
-        # divide by wave duration in minutes
-        sel = sel / duration
-        
-        # calculate anthrophony and biophony
-        anthrophony = sel[0:2].sum()
-        biophony = sel[2:10].sum()
+        # edges of the frequency bins, the last bin includes the highest frequency,
+        # and of anthrophony and biophony
+        bin_edges = np.append(np.arange(0, (rate / 2), bin_width), np.inf)
+        edges = np.unique(np.concatenate([bin_edges, [0, limit, max_frequency]]))
+        energies = sel_bands(a, edges, f = f, duration = duration, units = 'watts').sum(axis = 0)
         
+        # sum the bands between edges
+        positions = np.searchsorted(edges, [limit, max_frequency])
+        anthrophony = energies[:positions[0]].sum()
+        biophony = energies[positions[0]:positions[1]].sum()
+        sel = np.add.reduceat(energies, np.searchsorted(edges, bin_edges[:-1]))
     else:
         # do not return bins if b is not None
         return_bins = False
-        # convert to watts
-        b = 10**(b / 10)
-        # multiply by frequency delta
-        b = b * f_delta
-        
-        # compute anthrophony and biophony
-        anthrophony = (a - (b.data * np.invert(b.mask))).sum() / duration
-        biophony = b.sum() / duration
+        total, biophony = sel_bands(a, [0, np.inf], f = f, duration = duration, b = b, units = 'watts')
+        biophony = biophony.sum()
+        anthrophony = total.sum() - biophony
     
     # convert back to decibels
     anthrophony = 10 * np.log10(anthrophony)
@@ -184,4 +420,4 @@ def sel(a, rate, duration, b=None, limit=2000, bin_width = 1000, return_bins=Fal
         sel = 10 * np.log10(sel)
         return sel, anthrophony, biophony
     else:
-        return anthrophony, biophony
\ No newline at end of file
+        return anthrophony, biophony
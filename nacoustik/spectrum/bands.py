@@ -0,0 +1,183 @@
+"""
+Sound exposure levels of frequency bands
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import numpy as np
+from nacoustik.profiling import profiled, stage
+
+
+def octave_bands(low = 25., high = 20000., fraction = 1):
+    """
+    Return the edges of (fractional) octave bands
+
+    Band centers are 1000 * 2**(k / fraction) herz (base-two bands),
+    the edges of each band are its center times 2**(-1 / (2 * fraction))
+    and 2**(1 / (2 * fraction)), so the bands are adjacent
+
+    Parameters
+    ----------
+    low, high: floats, default = 25., 20000.
+        range of the band centers in herz
+
+    fraction: integer, default = 1
+        bands per octave, e.g. 3 for third-octave bands
+
+    Returns
+    ----------
+    edges: numpy float64 array of the band edges in herz (one more than the bands),
+        the center of each band is the geometric mean of its edges
+    """
+
+    k = np.arange(np.ceil(fraction * np.log2(low / 1000.) - 1e-9),
+                  np.floor(fraction * np.log2(high / 1000.) + 1e-9) + 1)
+    if len(k) == 0:
+        raise ValueError("there are no band centers from {0} to {1} herz".format(low, high))
+    centers = 1000. * 2**(k / fraction)
+    return np.append(centers * 2**(-0.5 / fraction), centers[-1] * 2**(0.5 / fraction))
+
+
+def third_octave_bands(low = 25., high = 20000.):
+    """Return the edges of third-octave bands, refer to 'octave_bands'"""
+
+    return octave_bands(low, high, fraction = 3)
+
+
+def _power_sums(a, b, chunk_length):
+    """Sum the power (in watts) of a spectrogram in decibels over time steps,
+    converting chunks of time steps, and the power of the cells of 'b'
+    that are not masked"""
+
+    sums = np.zeros(shape = a.shape[:2])
+    sums_b = np.zeros_like(sums) if b is not None else None
+    for start in range(0, a.shape[2], chunk_length):
+        chunk = a[:, :, start:start + chunk_length].astype(np.float64)
+        chunk /= 10
+        sums += np.power(10., chunk, out = chunk).sum(axis = 2)
+        if b is not None:
+            chunk = np.ma.getdata(b[:, :, start:start + chunk_length]).astype(np.float64)
+            chunk /= 10
+            np.power(10., chunk, out = chunk)
+            chunk[np.ma.getmaskarray(b[:, :, start:start + chunk_length])] = 0
+            sums_b += chunk.sum(axis = 2)
+    return sums, sums_b
+
+
+def _reduce_bands(sums, indices):
+    """Sum the frequency bands (last axis) of each pair of consecutive 'indices'"""
+
+    # reduceat returns the first value of decreasing ranges rather than a sum
+    if np.any(np.diff(indices) < 0):
+        raise ValueError("'indices' must not decrease")
+    # a zero band, so an index may be the number of bands
+    padded = np.concatenate([sums, np.zeros(sums.shape[:-1] + (1,))], axis = -1)
+    result = np.add.reduceat(padded, indices, axis = -1)[..., :-1]
+    # reduceat returns the first value of empty ranges
+    result[..., np.diff(indices) == 0] = 0
+    return result
+
+
+@profiled('sel_bands')
+def sel_bands(a, edges, f = None, rate = None, duration = None, b = None,
+              units = 'decibels', chunk_length = 4096):
+    """
+    Estimate the sound exposure level (sel) of frequency bands
+    of one or many spectrograms
+
+    The power of each spectrogram is converted to watts in chunks
+    of time steps and summed over time, then the frequency bands
+    of all band edges are summed with one reduction,
+    so no full-size intermediate arrays are created.
+
+    Parameters
+    ----------
+    a: numpy float64 or float32 array, or list of arrays
+        a 3d array (channels, frequency bands, time steps)
+        representing the psd spectrogram of a wave signal in decibels,
+        a 4d array (recordings, channels, frequency bands, time steps),
+        or a list of 3d arrays (e.g. of recordings of different lengths)
+
+    edges: sequence of floats
+        edges of the bands in herz (one more than the bands),
+        each band includes the frequencies from its lower edge
+        up to (excluding) its upper edge, use numpy.inf to include
+        the highest frequency, refer to 'octave_bands',
+        edges must be increasing
+
+    f: numpy array of the frequency of each band, default = None
+        as returned by 'psd', if 'None', the frequencies are
+        evenly spaced from 0 to 'rate' / 2
+
+    rate: sample rate of the signal, required if 'f' is 'None'
+
+    duration: float or sequence of floats, default = None
+        duration of each recording in minutes, the sel is divided by it,
+        if 'None', the sel is not divided
+
+    b: numpy float64 or float32 array, or list of arrays, default = None
+        spectrograms (with ale applied) in the shape of 'a',
+        masked (or numpy.ma.masked) cells are not counted
+
+    units: string, default = 'decibels'
+        result units in 'decibels' or 'watts'
+
+    chunk_length: integer, default = 4096
+        number of time steps converted to watts at once
+
+    Returns
+    ----------
+    sel: numpy float64 array
+        a 2d array (channels, bands) for a 3d array 'a',
+        otherwise a 3d array (recordings, channels, bands)
+
+    sel_b: numpy float64 array
+        the sel of 'b' (if 'b' is not 'None')
+    """
+
+    # check parameters
+    if units not in ['decibels', 'watts']:
+        raise ValueError("'{0}' are not acceptable units".format(units))
+    single = not isinstance(a, (list, tuple)) and np.ndim(a) == 3
+    if single:
+        a = [a]
+        b = None if b is None else [b]
+    if b is not None and len(b) != len(a):
+        raise ValueError("'b' must have a spectrogram for each spectrogram of 'a'")
+    edges = np.asarray(edges, dtype = float)
+    if edges.ndim != 1 or len(edges) < 2 or not np.all(np.diff(edges) > 0):
+        raise ValueError("'edges' must be at least two increasing frequencies")
+    durations = np.broadcast_to(1. if duration is None else np.asarray(duration, dtype = float), (len(a),))
+
+    n_bands = a[0].shape[1]
+    if f is None:
+        if rate is None:
+            raise ValueError("'rate' is required if 'f' is 'None'")
+        f = np.linspace(0, rate / 2, n_bands)
+    f_delta = f[1] - f[0]
+    indices = np.searchsorted(f, edges)
+
+    sums = np.empty(shape = (len(a), a[0].shape[0], n_bands))
+    sums_b = np.empty_like(sums) if b is not None else None
+    with stage('sel_sums') as info:
+        for i in range(len(a)):
+            if a[i].shape[1] != n_bands:
+                raise ValueError("all spectrograms must have {0} frequency bands".format(n_bands))
+            s, s_b = _power_sums(a[i], None if b is None else b[i], chunk_length)
+            sums[i] = s
+            if b is not None:
+                sums_b[i] = s_b
+        info['recordings'] = len(a)
+
+    results = []
+    for s in ([sums] if b is None else [sums, sums_b]):
+        sel = _reduce_bands(s, indices) * f_delta / durations[:, np.newaxis, np.newaxis]
+        if units == 'decibels':
+            with np.errstate(divide = 'ignore'):
+                sel = 10 * np.log10(sel)
+        results.append(sel[0] if single else sel)
+    return results[0] if b is None else tuple(results)
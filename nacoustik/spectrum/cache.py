@@ -0,0 +1,166 @@
+"""
+Spectrogram cache
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+
+
+class SpectrogramCache:
+    """
+    Cache of psd spectrograms on disk
+
+    Spectrograms are stored (in watts) as uncompressed .npz files
+    named by a key of the wave content hash, the normalization
+    of the wave, the psd parameters and the dtype.
+    When the total size of the cache exceeds 'max_size',
+    the least recently used spectrograms are removed.
+    """
+
+
+    def __init__(self, directory, max_size = 10 * 2**30):
+        """
+
+        Parameters
+        ----------
+        directory: path to the cache directory, created if it does not exist
+
+        max_size: integer, default = 10 * 2**30
+            maximum total size of the cache in bytes,
+            if 'None', the size of the cache is not limited
+        """
+
+        self.directory = directory
+        self.max_size = max_size
+        self._hashes = {}
+        os.makedirs(directory, exist_ok = True)
+
+
+    def _content_hash(self, wave):
+        """Hash the samples of a wave (the file content for WAV files)"""
+
+        if hasattr(wave, 'filepath'):
+            # hashes are kept for files that have not changed
+            stat = os.stat(wave.filepath)
+            memo = (os.path.abspath(wave.filepath), stat.st_size, stat.st_mtime_ns)
+            if memo not in self._hashes:
+                h = hashlib.sha256()
+                with open(wave.filepath, 'rb') as f:
+                    for chunk in iter(lambda: f.read(2**20), b''):
+                        h.update(chunk)
+                self._hashes[memo] = h.hexdigest()
+            return self._hashes[memo]
+        samples = np.ascontiguousarray(wave.samples)
+        h = hashlib.sha256()
+        h.update(str((samples.dtype.str, samples.shape)).encode())
+        h.update(samples.data)
+        return h.hexdigest()
+
+
+    def key(self, wave, rate, window_length, window_overlap, window_shape, scaling,
+            dtype = np.float64):
+        """
+        Return the cache key of a wave and psd parameters
+
+        Parameters
+        ----------
+        wave: Wave object
+
+        rate, window_length, window_overlap, window_shape, scaling, dtype:
+            psd parameters, refer to 'psd'
+        """
+
+        # file-backed waves are hashed by the file content,
+        # so their normalization (offset, scale and dtype) is part of the key
+        normalization = getattr(wave, '_normalization', None)
+        if normalization is not None:
+            offset, scale, normalized_dtype = normalization
+            normalization = [float(offset), float(scale), np.dtype(normalized_dtype).str]
+        parameters = json.dumps([rate, window_length, window_overlap,
+                                  window_shape, scaling, np.dtype(dtype).str, normalization])
+        h = hashlib.sha256(self._content_hash(wave).encode())
+        h.update(parameters.encode())
+        return h.hexdigest()
+
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+
+    def get(self, key):
+        """
+        Return the cached (f, t, psd) of a key, or 'None' if it is not cached
+        """
+
+        path = self._path(key)
+        try:
+            with np.load(path) as entry:
+                result = entry['f'], entry['t'], entry['psd']
+        except (OSError, KeyError, ValueError):
+            return None
+        # mark as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return result
+
+
+    def put(self, key, f, t, psd):
+        """
+        Store the (f, t, psd) of a key and evict
+        the least recently used entries if the cache is full
+        """
+
+        # write to a temporary file first, so concurrent readers
+        # (e.g. batch workers) never see a partial entry
+        fd, temp = tempfile.mkstemp(suffix = '.tmp', dir = self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                np.savez(file, f = f, t = t, psd = psd)
+            os.replace(temp, self._path(key))
+        except BaseException:
+            os.remove(temp)
+            raise
+        self.evict()
+
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits 'max_size'"""
+
+        if self.max_size is None:
+            return
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npz'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        size = sum(entry[1] for entry in entries)
+        for mtime, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= entry_size
+
+
+    def clear(self):
+        """Remove all entries"""
+
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npz'):
+                os.remove(entry.path)
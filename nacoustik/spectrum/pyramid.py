@@ -0,0 +1,237 @@
+"""
+Multi-resolution psd spectrograms
+
+A pyramid computes the psd spectrogram of a wave once, at the finest
+resolution, and derives coarser time and frequency resolutions from it
+by aggregating power, rather than computing a spectrogram for each
+analysis window length.
+
+Example
+----------
+pyramid = psd_pyramid(wave, window_length = 256)
+# fine time resolution
+aci = calculate_aci(pyramid, level = 0)
+# 4 times fewer time steps (sel sums the bands of the base frequency resolution)
+anthrophony, biophony = sel(pyramid, level = (2, 0))
+# 4 times coarser in time and frequency
+plot_spectrogram(pyramid, level = 2)
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import numpy as np
+from nacoustik import Wave
+from nacoustik.spectrum.analysis import psd
+from nacoustik.profiling import profiled, stage
+
+
+def _factors(level):
+    """Return the time and frequency factors of a level,
+    an integer or a tuple of integers (time level, frequency level)"""
+
+    if np.ndim(level) == 0:
+        level = (level, level)
+    if len(level) != 2 or any(int(n) != n or n < 0 for n in level):
+        raise ValueError("'{0}' is not an acceptable level".format(level))
+    return 2**int(level[0]), 2**int(level[1])
+
+
+def _aggregate_time(a, factor):
+    """Average power over groups of 'factor' consecutive time steps,
+    a remaining partial group is summed and divided by 'factor' as well,
+    so the sum over time steps times the time delta of the level
+    is the total energy"""
+
+    if factor == 1:
+        return a
+    n_full = a.shape[2] // factor
+    result = np.empty(shape = a.shape[:2] + (-(-a.shape[2] // factor),), dtype = a.dtype)
+    a[:, :, :n_full * factor].reshape(a.shape[:2] + (n_full, factor)).mean(axis = 3, out = result[:, :, :n_full])
+    if result.shape[2] > n_full:
+        result[:, :, n_full] = a[:, :, n_full * factor:].sum(axis = 2) / factor
+    return result
+
+
+def _aggregate_frequency(a, factor):
+    """Sum power over groups of 'factor' consecutive frequency bands,
+    divided by 'factor', so the sum over bands times the band width
+    of the level is the total power"""
+
+    if factor == 1:
+        return a
+    result = np.add.reduceat(a, np.arange(0, a.shape[1], factor), axis = 1)
+    result /= factor
+    return result
+
+
+class SpectrogramPyramid:
+    """
+    Psd spectrogram at multiple time and frequency resolutions
+
+    Level (i, j) has 2**i times fewer time steps and 2**j times fewer
+    frequency bands than the base spectrogram (level 0):
+    the power of 2**i consecutive time steps is averaged (over time steps
+    2**i times as long) and the power of 2**j consecutive bands is averaged
+    (over bands 2**j times as wide), so the total energy is preserved.
+    Partial groups at the end of each axis are divided by the full factor.
+    Levels are computed from the base spectrogram when first requested
+    and kept for later requests.
+
+    Attributes
+    ----------
+    rate, duration (seconds), window_length, window_overlap, window_shape,
+    scaling, pressure_reference: parameters of the base spectrogram
+
+    f, t, psd: frequency bands, time steps, and base psd spectrogram in watts
+    """
+
+
+    def __init__(self, f, t, psd, rate, duration, window_length, window_overlap = 50,
+                 window_shape = 'hann', scaling = 'density', pressure_reference = 20.):
+        """
+
+        Parameters
+        ----------
+        f, t, psd: result of 'psd' with units = 'watts' and kind = 'spectrogram'
+
+        rate: sample rate of the signal
+
+        duration: duration of the signal in seconds
+
+        window_length, window_overlap, window_shape, scaling, pressure_reference:
+            parameters of the spectrogram, refer to 'psd'
+        """
+
+        self.f = f
+        self.t = t
+        self.psd = psd
+        self.rate = rate
+        self.duration = duration
+        self.window_length = window_length
+        self.window_overlap = window_overlap
+        self.window_shape = window_shape
+        self.scaling = scaling
+        self.pressure_reference = pressure_reference
+        self._levels = {(1, 1): (f, t, psd)}
+
+
+    @property
+    def n_channels(self):
+        return self.psd.shape[0]
+
+
+    def time_delta(self, level = 0):
+        """Return the time in seconds represented by each time step of a level"""
+
+        # from the parameters, a spectrogram may have a single time step
+        noverlap = int(self.window_length * (self.window_overlap / 100.))
+        return (self.window_length - noverlap) / float(self.rate) * _factors(level)[0]
+
+
+    def frequency_delta(self, level = 0):
+        """Return the width in herz of the frequency bands of a level"""
+
+        return self.rate / float(self.window_length) * _factors(level)[1]
+
+
+    def level(self, level = 0, units = 'decibels'):
+        """
+        Return the psd spectrogram of a level
+
+        Parameters
+        ----------
+        level: integer or tuple of integers (time level, frequency level), default = 0
+            the spectrogram has 2**time level fewer time steps
+            and 2**frequency level fewer frequency bands,
+            an integer selects the same level of both
+
+        units: string, default = 'decibels'
+            result units in 'decibels' or 'watts'
+
+        Returns
+        ----------
+        f: numpy array of the lowest frequency of each band
+
+        t: numpy array of the mean time of each time step
+
+        a: numpy float array
+            a 3d array (channels, frequency bands, time steps)
+            representing the psd spectrogram of the level,
+            arrays in watts are shared with the pyramid, do not modify them
+        """
+
+        # check units
+        if units not in ['decibels', 'watts']:
+            raise ValueError("'{0}' are not acceptable units".format(units))
+
+        factors = _factors(level)
+        if factors not in self._levels:
+            time_factor, frequency_factor = factors
+            with stage('pyramid_level') as info:
+                # aggregate time steps first (usually the longer axis),
+                # so the intermediate array is smaller
+                a = _aggregate_frequency(_aggregate_time(self.psd, time_factor), frequency_factor)
+                f = self.f[::frequency_factor]
+                t = self.t[:len(self.t) - (len(self.t) % time_factor)]
+                t = np.append(t.reshape(-1, time_factor).mean(axis = 1),
+                              self.t[len(t):].mean() if len(t) < len(self.t) else [])
+                info['shape'] = a.shape
+            self._levels[factors] = (f, t, a)
+        f, t, a = self._levels[factors]
+
+        if units == 'decibels':
+            return f, t, 10 * np.log10(a / (self.pressure_reference**2))
+        return f, t, a
+
+
+    def mean(self, level = 0, units = 'decibels'):
+        """Return the psd mean over time of each channel and frequency band of a level"""
+
+        frequency_level = level if np.ndim(level) == 0 else level[1]
+        f, t, a = self.level((0, frequency_level), units = 'watts')
+        a_mean = (a.sum(axis = 2, dtype = np.float64) / a.shape[2]).astype(a.dtype)
+        if units == 'decibels':
+            return 10 * np.log10(a_mean / (self.pressure_reference**2))
+        return a_mean
+
+
+@profiled('psd_pyramid')
+def psd_pyramid(wave, rate = None, scaling = 'density', window_length = 256,
+                window_overlap = 50, window_shape = 'hann', pressure_reference = 20.,
+                cache = None, dtype = np.float64):
+    """
+    Estimate the power spectral density (psd) spectrogram of a wave once
+    and return it as a pyramid of time and frequency resolutions
+
+    The base spectrogram should have the finest time resolution required
+    (e.g. for 'calculate_aci'), level j of the frequency axis has about
+    the frequency resolution of an analysis window 2**j times as long.
+
+    Parameters
+    ----------
+    wave: Wave object, file path to an audio file, or numpy array of WAV signal samples
+
+    rate, scaling, window_length, window_overlap, window_shape,
+    pressure_reference, cache, dtype:
+        parameters of the base spectrogram, refer to 'psd'
+
+    Returns
+    ----------
+    pyramid: SpectrogramPyramid object
+    """
+
+    if type(wave) is not Wave:
+        wave = Wave(wave)
+    if rate is None:
+        rate = wave.rate
+    f, t, a = psd(wave, rate, units = 'watts', scaling = scaling, kind = 'spectrogram',
+                  window_length = window_length, window_overlap = window_overlap,
+                  window_shape = window_shape, pressure_reference = pressure_reference,
+                  cache = cache, dtype = dtype)
+    return SpectrogramPyramid(f, t, a, rate, wave.n_samples / float(rate), window_length,
+                              window_overlap = window_overlap, window_shape = window_shape,
+                              scaling = scaling, pressure_reference = pressure_reference)
@@ -0,0 +1,158 @@
+"""
+Batched short-time Fourier transform
+
+The psd spectrogram of all channels is computed with one batched
+real FFT per chunk of analysis windows (threaded by scipy.fft),
+into a preallocated output array, which is converted to decibels in place.
+Windows and band scale factors are cached for each set of parameters,
+so they are not recomputed for every file (scipy.fft caches its FFT plans).
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+from functools import lru_cache
+import numpy as np
+import scipy.fft
+from scipy.signal import get_window
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+@lru_cache(maxsize = 32)
+def _window(window_shape, window_length, rate, scaling):
+    """
+    Return the analysis window and the scale factor of each frequency band
+    (as 'scipy.signal.spectrogram': one-sided, 'density' or 'spectrum' scaling)
+
+    The arrays are cached and read-only
+    """
+
+    window = get_window(window_shape, window_length)
+    if scaling == 'density':
+        scale = 1.0 / (rate * (window * window).sum())
+    elif scaling == 'spectrum':
+        scale = 1.0 / window.sum()**2
+    else:
+        raise ValueError("'{0}' is not an acceptable scaling".format(scaling))
+    scales = np.full(window_length // 2 + 1, scale)
+    # double the power of the bands folded from negative frequencies
+    if window_length % 2:
+        scales[1:] *= 2
+    else:
+        scales[1:-1] *= 2
+    window.flags.writeable = False
+    scales.flags.writeable = False
+    return window, scales
+
+
+def _window_times(n_samples, rate, window_length, window_overlap):
+    """Return the time of each analysis window of a signal of 'n_samples' samples
+    (the center of the window, as 'scipy.signal.spectrogram')"""
+
+    noverlap = int(window_length * (window_overlap / 100.))
+    hop = window_length - noverlap
+    n_windows = max((n_samples - noverlap) // hop, 0)
+    return np.arange(window_length / 2, window_length / 2 + n_windows * hop, hop)[:n_windows] / float(rate)
+
+
+def stft_psd(samples, rate, window_length = 1024, window_overlap = 50, window_shape = 'hann',
+             scaling = 'density', units = 'watts', pressure_reference = 20., out = None,
+             dtype = np.float64, workers = None, chunk_size = 2**22):
+    """
+    Estimate the power spectral density (psd) spectrogram of all channels
+    of a signal, equal to 'scipy.signal.spectrogram' of each channel
+    (with constant detrending)
+
+    Parameters
+    ----------
+    samples: numpy array of samples in the shape (n_samples, n_channels),
+        e.g. the memory-mapped samples of a Wave object
+
+    rate: sample rate of the signal
+
+    window_length, window_overlap, window_shape, scaling, units, pressure_reference:
+        refer to 'psd'
+
+    out: numpy float array, default = None
+        array to write the result into, in the shape
+        (channels, frequency bands, time steps),
+        if 'None', an array of 'dtype' is allocated
+
+    dtype: numpy float dtype, default = numpy.float64
+        dtype of the result if 'out' is 'None'
+
+    workers: integer, default = None
+        number of threads of the FFT, if 'None', all CPUs are used
+
+    chunk_size: integer, default = 4194304
+        approximate number of samples (of all windows and channels)
+        transformed at once, which bounds the temporary memory
+
+    Returns
+    ----------
+    f: numpy array of the frequency of each band
+
+    t: numpy array of the time of each analysis window
+
+    a: numpy float array 'out'
+        a 3d array (channels, frequency bands, time steps)
+        representing the psd spectrogram in 'units'
+    """
+
+    # check parameters
+    if units not in ['decibels', 'watts']:
+        raise ValueError("'{0}' are not acceptable units".format(units))
+    samples = np.asarray(samples)
+    if samples.ndim == 1:
+        samples = samples[:, np.newaxis]
+    n_samples, n_channels = samples.shape
+
+    # number of overlapping samples and samples between analysis windows
+    noverlap = int(window_length * (window_overlap / 100.))
+    hop = window_length - noverlap
+    n_windows = max((n_samples - noverlap) // hop, 0)
+    n_bands = window_length // 2 + 1
+
+    if out is None:
+        out = np.empty(shape = (n_channels, n_bands, n_windows), dtype = dtype)
+    elif out.shape != (n_channels, n_bands, n_windows):
+        raise ValueError("'out' must be in the shape {0}".format((n_channels, n_bands, n_windows)))
+
+    f = np.fft.rfftfreq(window_length, 1. / rate)
+    t = _window_times(n_samples, rate, window_length, window_overlap)
+    if n_windows == 0:
+        return f, t, out
+
+    window, scales = _window(window_shape, window_length, rate, scaling)
+    # float32 samples are transformed in float32, others in float64
+    work_dtype = np.float32 if samples.dtype == np.float32 else np.float64
+    window = window.astype(work_dtype)
+    workers = -1 if workers is None else workers
+
+    # analysis windows of all channels, as a view of the samples
+    frames = sliding_window_view(samples, window_length, axis = 0)[::hop]
+    chunk_length = max(1, chunk_size // (window_length * n_channels))
+    buffer = np.empty(shape = (min(chunk_length, n_windows), n_channels, window_length), dtype = work_dtype)
+    for start in range(0, n_windows, chunk_length):
+        stop = min(start + chunk_length, n_windows)
+        segments = buffer[:stop - start]
+        # detrend (subtract the mean of each window) and apply the window
+        segments[...] = frames[start:stop]
+        segments -= segments.mean(axis = 2, keepdims = True)
+        segments *= window
+        spectrum = scipy.fft.rfft(segments, axis = 2, workers = workers)
+        # power of each band, (windows, channels, bands) to (channels, bands, windows)
+        power = np.square(spectrum.real)
+        power += np.square(spectrum.imag)
+        power *= scales
+        out[:, :, start:stop] = power.transpose(1, 2, 0)
+
+    # convert to decibels in place
+    if units == 'decibels':
+        np.log10(out, out = out)
+        out *= 10
+        out -= 10 * np.log10(pressure_reference**2)
+    return f, t, out
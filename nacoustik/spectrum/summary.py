@@ -0,0 +1,152 @@
+"""
+Streaming summary of psd spectrograms
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import numpy as np
+
+
+class SpectrumSummary:
+    """
+    Mean and percent exceedance levels (e.g. L10, L50, L90) of the psd
+    of each channel and frequency band, accumulated from blocks of time steps
+
+    The power of each band is summed, and its level in decibels is counted
+    in a histogram with fixed edges, so memory use depends on the number
+    of bands and histogram bins, but not on the number of time steps.
+    Levels are interpolated within the histogram bins, so their error
+    is below 'bin_width'. The histogram bins of the added blocks are counted
+    together (with 'numpy.bincount') once they outnumber the histogram cells,
+    and the counts are 32-bit (up to 2**32 - 1 time steps).
+    """
+
+
+    def __init__(self, n_channels, n_bands, pressure_reference = 20., levels = True,
+                 db_range = (-200., 200.), bin_width = 0.25):
+        """
+
+        Parameters
+        ----------
+        n_channels, n_bands: integers
+            shape of the spectrogram blocks
+
+        pressure_reference: float, default = 20.
+            reference pressure of the decibel levels in micropascals
+
+        levels: boolean, default = True
+            count the histograms of levels (required for 'levels')
+
+        db_range: tuple of floats, (low, high), default = (-200., 200.)
+            range of the histograms in decibels,
+            values outside the range are counted in the first or last bin
+
+        bin_width: float, default = 0.25
+            width of the histogram bins in decibels
+        """
+
+        self.pressure_reference = pressure_reference
+        self.n_steps = 0
+        self._sum = np.zeros(shape = (n_channels, n_bands))
+        self._histograms = None
+        if levels:
+            n_bins = int(np.ceil((db_range[1] - db_range[0]) / bin_width))
+            self._low = db_range[0]
+            self._bin_width = bin_width
+            self._histograms = np.zeros(shape = (n_channels, n_bands, n_bins), dtype = np.uint32)
+        # flattened histogram indices of the values not yet counted
+        self._pending = []
+        self._n_pending = 0
+
+
+    def add(self, a):
+        """
+        Add a block of time steps
+
+        Parameters
+        ----------
+        a: numpy float array
+            a 3d array (channels, frequency bands, time steps)
+            representing a block of a psd spectrogram in watts
+        """
+
+        self._sum += a.sum(axis = 2, dtype = np.float64)
+        self.n_steps += a.shape[2]
+        if self._histograms is not None and a.shape[2]:
+            n_bins = self._histograms.shape[2]
+            bins = 10 * np.log10(a / (self.pressure_reference**2))
+            bins -= self._low
+            bins /= self._bin_width
+            bins = np.clip(bins, 0, n_bins - 1, out = bins).astype(np.intp)
+            # offset the bins of each channel and band into one histogram array
+            bins += (np.arange(bins.shape[0] * bins.shape[1]) * n_bins).reshape(bins.shape[:2] + (1,))
+            self._pending.append(bins.ravel())
+            self._n_pending += bins.size
+            # count once the dense counts of 'bincount' cost less than the values
+            if self._n_pending >= self._histograms.size:
+                self._count()
+
+
+    def _count(self):
+        # add the pending values to the histograms
+        if self._pending:
+            counts = np.bincount(np.concatenate(self._pending), minlength = self._histograms.size)
+            histograms = self._histograms.reshape(-1)
+            np.add(histograms, counts, out = histograms, casting = 'unsafe')
+            self._pending = []
+            self._n_pending = 0
+
+
+    @property
+    def histograms(self):
+        """Counts of the levels in the histogram bins (channels, frequency bands, bins)"""
+
+        if self._histograms is None:
+            raise ValueError("levels are not counted, refer to 'levels' of 'SpectrumSummary'")
+        self._count()
+        return self._histograms
+
+
+    def mean(self, units = 'decibels'):
+        """Return the psd mean of each channel and frequency band in 'units'"""
+
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            psd_mean = self._sum / self.n_steps
+        if units == 'decibels':
+            return 10 * np.log10(psd_mean / (self.pressure_reference**2))
+        return psd_mean
+
+
+    def levels(self, percents = (10, 50, 90)):
+        """
+        Return the percent exceedance levels of each channel and frequency band
+
+        Parameters
+        ----------
+        percents: sequence of floats, default = (10, 50, 90)
+            percent of the time steps exceeding each level, e.g. 90 for L90
+
+        Returns
+        ----------
+        levels: numpy float64 array
+            a 3d array (channels, frequency bands, percents) in decibels
+        """
+
+        histograms = self.histograms
+        cumulative = np.cumsum(histograms, axis = 2, dtype = np.int64)
+        levels = np.empty(shape = histograms.shape[:2] + (len(percents),))
+        for i, percent in enumerate(percents):
+            # rank of the level in the sorted values of each band
+            rank = (1 - percent / 100.) * self.n_steps
+            index = np.minimum((cumulative < rank).sum(axis = 2), cumulative.shape[2] - 1)
+            above = np.take_along_axis(cumulative, index[:, :, np.newaxis], axis = 2)[:, :, 0]
+            count = np.take_along_axis(histograms, index[:, :, np.newaxis], axis = 2)[:, :, 0]
+            # interpolate within the bin
+            with np.errstate(divide = 'ignore', invalid = 'ignore'):
+                fraction = np.where(count > 0, 1 - (above - rank) / count, 0.5)
+            levels[:, :, i] = self._low + (index + fraction) * self._bin_width
+        return levels
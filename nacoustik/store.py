@@ -0,0 +1,359 @@
+"""
+Columnar store of results
+
+Results (e.g. the indices of each file or time window) are appended
+to a directory in chunks. Each chunk is a directory holding one .npy file
+per column and a JSON file with the number of rows and the dtype, shape,
+minimum and maximum of each column. Reads load only the requested columns
+(memory-mapped) of the chunks whose minimum and maximum match the filters.
+
+Example
+----------
+store = ResultStore('results')
+store.append({'site': ['A', 'A'],
+              'time': np.array(['2024-01-01T06:00', '2024-01-01T06:01'], dtype = 'datetime64'),
+              'aci': [101.2, 98.7], 'aci_bands': np.ones((2, 513))})
+results = store.read(['time', 'aci'], site = 'A', start = '2024-01-01')
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import datetime
+import json
+import numbers
+import os
+import shutil
+import time
+import uuid
+import numpy as np
+
+
+def _column(values):
+    """Convert the values of a column to a numpy array
+    (numbers with missing values to floats, datetimes to datetime64)"""
+
+    values = np.asarray(values)
+    if values.dtype == object:
+        present = [value for value in values.ravel() if value is not None]
+        if all(isinstance(value, numbers.Number) for value in present):
+            values = values.astype(np.float64)
+        elif all(isinstance(value, (datetime.datetime, np.datetime64)) for value in present):
+            values = values.astype('datetime64[ns]')
+        else:
+            values = values.astype(str)
+    elif values.dtype.kind == 'M':
+        values = values.astype('datetime64[ns]')
+    return values
+
+
+def _statistic(value):
+    # json value of a column minimum or maximum
+    if isinstance(value, np.datetime64):
+        return None if np.isnat(value) else str(value)
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+
+def _statistics(values):
+    """Return the minimum and maximum of a 1d column, or 'None'"""
+
+    if values.ndim != 1 or len(values) == 0:
+        return None, None
+    if values.dtype.kind == 'M':
+        valid = values[~np.isnat(values)]
+    elif values.dtype.kind == 'f':
+        valid = values[~np.isnan(values)]
+    elif values.dtype.kind in 'iub':
+        valid = values
+    elif values.dtype.kind == 'U':
+        # numpy has no minimum of strings
+        return min(values.tolist()), max(values.tolist())
+    else:
+        return None, None
+    if len(valid) == 0:
+        return None, None
+    return _statistic(valid.min()), _statistic(valid.max())
+
+
+def _value(value, dtype):
+    # convert a filter value to the type of a column
+    if np.dtype(dtype).kind == 'M':
+        return np.datetime64(value, 'ns')
+    return value
+
+
+def _concatenate(values):
+    """Concatenate the values of a column read from chunks,
+    padding vectors of different lengths with nan"""
+
+    if not values:
+        return np.empty(0)
+    shape = np.max([value.shape for value in values], axis = 0)
+    if any(value.shape[1:] != tuple(shape[1:]) for value in values):
+        if any(value.dtype.kind != 'f' for value in values):
+            raise ValueError("vectors of different lengths can only be read for float columns")
+        values = [np.pad(value, [(0, 0)] + [(0, n - m) for n, m in zip(shape[1:], value.shape[1:])],
+                         constant_values = np.nan) for value in values]
+    return np.concatenate(values)
+
+
+class ResultStore:
+    """
+    Store of result columns on disk
+
+    Every call of 'append' writes a new chunk, which appears atomically
+    (it is renamed when complete), so processes can append concurrently.
+    """
+
+
+    def __init__(self, directory):
+        """
+
+        Parameters
+        ----------
+        directory: path to the store directory, created if it does not exist
+        """
+
+        self.directory = directory
+        os.makedirs(directory, exist_ok = True)
+
+
+    def chunks(self):
+        """Return the sorted names of the chunks
+        (without chunks replaced by a merged chunk, refer to 'compact')"""
+
+        return [chunk for chunk, metadata in self._chunks()]
+
+
+    def _chunks(self):
+        # sorted names and metadata of the chunks, without the chunks listed as
+        # replaced by a merged chunk (left if 'compact' was interrupted)
+        chunks = [(name, self.metadata(name)) for name in sorted(
+            entry.name for entry in os.scandir(self.directory)
+            if entry.is_dir() and not entry.name.startswith('.'))]
+        replaced = set(name for chunk, metadata in chunks for name in metadata.get('replaces', []))
+        return [(chunk, metadata) for chunk, metadata in chunks if chunk not in replaced]
+
+
+    def metadata(self, chunk):
+        """Return the metadata of a chunk (number of rows and columns)"""
+
+        with open(os.path.join(self.directory, chunk, 'metadata.json')) as f:
+            return json.load(f)
+
+
+    def append(self, columns):
+        """
+        Append a chunk of rows
+
+        Parameters
+        ----------
+        columns: dictionary (or pandas DataFrame) of column names and values,
+            each column has one value per row, which may be a vector
+            (e.g. the aci of each frequency band) of the same length for all rows,
+            datetime values are stored as numpy datetime64,
+            None values of numbers as nan
+
+        Returns
+        ----------
+        chunk: name of the chunk, or 'None' if there are no rows
+        """
+
+        return self._write(columns)
+
+
+    def _write(self, columns, replaces = (), time_ns = None):
+        # write a chunk, listing the names of the chunks it 'replaces' in its metadata,
+        # named by 'time_ns' (nanoseconds) or the current time
+        columns = {name: _column(columns[name]) for name in columns}
+        lengths = set(len(values) for values in columns.values())
+        if len(lengths) > 1:
+            raise ValueError("all columns must have the same number of rows")
+        if not columns or lengths == {0}:
+            return None
+
+        # chunks are named by time, process, and a random suffix,
+        # so names of concurrent writers never collide and sort by time
+        if time_ns is None:
+            time_ns = time.time_ns()
+        chunk = '{0:016x}-{1}-{2}'.format(time_ns, os.getpid(), uuid.uuid4().hex[:8])
+        temp = os.path.join(self.directory, '.' + chunk)
+        os.makedirs(temp)
+        try:
+            metadata = {'n_rows': lengths.pop(), 'columns': {}}
+            if replaces:
+                metadata['replaces'] = list(replaces)
+            for name, values in columns.items():
+                np.save(os.path.join(temp, name + '.npy'), values, allow_pickle = False)
+                minimum, maximum = _statistics(values)
+                metadata['columns'][name] = {'dtype': values.dtype.str,
+                                             'shape': list(values.shape[1:]),
+                                             'min': minimum, 'max': maximum}
+            with open(os.path.join(temp, 'metadata.json'), 'w') as f:
+                json.dump(metadata, f)
+            os.rename(temp, os.path.join(self.directory, chunk))
+        except BaseException:
+            shutil.rmtree(temp, ignore_errors = True)
+            raise
+        return chunk
+
+
+    def append_rows(self, rows):
+        """
+        Append a chunk of rows given as dictionaries with the same keys
+
+        Returns
+        ----------
+        chunk: name of the chunk, refer to 'append'
+        """
+
+        rows = list(rows)
+        if not rows:
+            return None
+        return self.append({name: [row[name] for row in rows] for name in rows[0]})
+
+
+    def _matches(self, metadata, filters):
+        # whether the minimum and maximum of the chunk columns may match the filters
+        for name, (low, high) in filters.items():
+            column = metadata['columns'].get(name)
+            if column is None:
+                return False
+            if column['min'] is None:
+                continue
+            minimum = _value(column['min'], column['dtype'])
+            maximum = _value(column['max'], column['dtype'])
+            if (low is not None and maximum < _value(low, column['dtype'])) or \
+               (high is not None and minimum > _value(high, column['dtype'])):
+                return False
+        return True
+
+
+    def read(self, columns = None, site = None, start = None, end = None, where = None):
+        """
+        Read the rows matching filters
+
+        Parameters
+        ----------
+        columns: list of strings, default = None
+            names of the columns to read,
+            if 'None', the columns of all matching chunks are read
+
+        site: string, default = None
+            value of the 'site' column
+
+        start, end: datetime, numpy datetime64, or string, default = None
+            range of the 'time' column (start <= time < end)
+
+        where: dictionary, default = None
+            column names and (low, high) ranges of their values
+            (low <= value <= high, 'None' for an open end)
+
+        Returns
+        ----------
+        results: dictionary of column names and numpy arrays,
+            only chunks having all columns (read or filtered) are read,
+            vectors shorter than those of other chunks are padded with nan
+        """
+
+        filters = dict(where or {})
+        if site is not None:
+            filters['site'] = (site, site)
+        if start is not None or end is not None:
+            filters['time'] = (start, end)
+
+        # chunks that may match the filters
+        selected = []
+        for chunk, metadata in self._chunks():
+            if not self._matches(metadata, filters):
+                continue
+            if columns is not None and not all(name in metadata['columns'] for name in columns):
+                continue
+            selected.append((chunk, metadata))
+        if columns is None:
+            names = [set(metadata['columns']) for chunk, metadata in selected]
+            columns = sorted(set.intersection(*names)) if names else []
+
+        results = {name: [] for name in columns}
+        for chunk, metadata in selected:
+            path = os.path.join(self.directory, chunk)
+            load = lambda name: np.load(os.path.join(path, name + '.npy'), mmap_mode = 'r')
+            rows = np.ones(metadata['n_rows'], dtype = bool)
+            for name, (low, high) in filters.items():
+                values = load(name)
+                dtype = metadata['columns'][name]['dtype']
+                if name == 'time':
+                    if low is not None:
+                        rows &= values >= _value(low, dtype)
+                    if high is not None:
+                        rows &= values < _value(high, dtype)
+                else:
+                    if low is not None:
+                        rows &= values >= _value(low, dtype)
+                    if high is not None:
+                        rows &= values <= _value(high, dtype)
+            if not rows.any():
+                continue
+            for name in columns:
+                results[name].append(np.asarray(load(name)[rows]))
+        return {name: _concatenate(values) for name, values in results.items()}
+
+
+    def compact(self, chunk_size = 100000):
+        """
+        Merge chunks with the same columns into chunks of up to 'chunk_size' rows
+
+        Compact a store only while no other process writes to or reads from it.
+        A merged chunk lists the chunks it replaces, which are skipped
+        (and removed by the next 'compact') if they are not removed,
+        so an interrupted compaction never duplicates rows.
+        A merged chunk is named by the time of its first chunk,
+        so the rows of chunks with the same columns keep their order.
+        """
+
+        # remove chunks replaced by a merged chunk in an interrupted compaction
+        chunks = self._chunks()
+        names = set(chunk for chunk, metadata in chunks)
+        for entry in list(os.scandir(self.directory)):
+            if entry.is_dir() and not entry.name.startswith('.') and entry.name not in names:
+                self._remove(entry.name)
+
+        groups = {}
+        for chunk, metadata in chunks:
+            # strings of different lengths can be merged
+            schema = tuple(sorted((name, np.dtype(column['dtype']).kind, tuple(column['shape']))
+                                  for name, column in metadata['columns'].items()))
+            groups.setdefault(schema, []).append((chunk, metadata['n_rows']))
+
+        for schema, chunks in groups.items():
+            if len(chunks) < 2:
+                continue
+            names = [name for name, kind, shape in schema]
+            batch, n_rows = [], 0
+            for i, (chunk, n) in enumerate(chunks):
+                batch.append(chunk)
+                n_rows += n
+                if n_rows >= chunk_size or i == len(chunks) - 1:
+                    if len(batch) > 1:
+                        columns = {name: np.concatenate(
+                            [np.load(os.path.join(self.directory, c, name + '.npy'))
+                             for c in batch]) for name in names}
+                        self._write(columns, replaces = batch,
+                                    time_ns = int(batch[0].split('-')[0], 16))
+                        for c in batch:
+                            self._remove(c)
+                    batch, n_rows = [], 0
+
+
+    def _remove(self, chunk):
+        # hide a chunk (atomically) before removing its files
+        hidden = os.path.join(self.directory, '.' + chunk)
+        os.rename(os.path.join(self.directory, chunk), hidden)
+        shutil.rmtree(hidden)
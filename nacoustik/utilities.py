@@ -8,9 +8,16 @@ License: MIT
 """
 
 
+import os
+import re
+from datetime import datetime
 import numpy as np
 
 
+# date and time in file names of recorders (e.g. SITE_20240101_060000.wav)
+_TIME_PATTERN = re.compile(r'(\d{8})[_T-]?(\d{6})')
+
+
 def sum_decibels(x):
 	"""Sum an array of decibels
 	
@@ -20,4 +27,54 @@ def sum_decibels(x):
 		array of decibel values to sum
 	"""
 	
-	return 10 * np.log10(np.sum(10**(x / 10)))
\ No newline at end of file
+	return 10 * np.log10(np.sum(10**(x / 10)))
+
+
+def recording_time(filepath):
+	"""Return the start time of a recording from its file name 
+	(a date and time 'YYYYMMDD_HHMMSS'), or 'None'
+	
+	Parameters
+	----------
+	filepath: string
+		file path to a recording
+	"""
+	
+	match = _TIME_PATTERN.search(os.path.basename(filepath))
+	if match is None:
+		return None
+	try:
+		return datetime.strptime(match.group(1) + match.group(2), '%Y%m%d%H%M%S')
+	except ValueError:
+		return None
+
+
+def warmup(dtypes = (np.float64, np.float32)):
+	"""Compile (or load from the cache) the numba kernels of nacoustik
+	
+	Kernels are compiled on their first call and cached on disk, 
+	so later processes load them instead of compiling them again. 
+	Calling 'warmup' (in a separate process, as parallel kernels 
+	must not run before forking) before starting worker processes 
+	avoids each worker compiling the kernels.
+	
+	Parameters
+	----------
+	dtypes: sequence of numpy float dtypes, default = (numpy.float64, numpy.float32)
+		dtypes of the spectrograms to compile the kernels for
+	"""
+	
+	from nacoustik.noise import remove_background_noise
+	from nacoustik.index import calculate_aci
+	
+	a = np.random.default_rng(0).normal(-60., 10., size = (1, 16, 32))
+	for dtype in dtypes:
+		remove_background_noise(a.astype(dtype))
+		calculate_aci(10**(a.astype(dtype) / 10), 0.1)
+
+
+def _init_worker():
+	# initializer of worker processes, which limits the numba parallel kernels
+	# to one thread, as the worker processes already use the CPUs
+	import numba
+	numba.set_num_threads(1)
@@ -10,9 +10,53 @@ License: MIT
 
 from sys import stderr
 from os import path
-from sox import file_info
 import numpy as np
-from scipy.io import wavfile
+from nacoustik.readers import open_reader
+from nacoustik.profiling import stage
+
+
+def _full_scale(dtype, bit_depth = None):
+	"""
+	Return the offset and full scale of samples of a dtype
+	
+	Integer samples are scaled by 2**(bit_depth - 1)
+	(e.g. 24-bit samples stored in 32-bit integers),
+	unsigned (8-bit WAV) samples are centered on zero,
+	float samples are already normalized
+	"""
+	
+	dtype = np.dtype(dtype)
+	if dtype.kind == 'f':
+		return 0., 1.
+	bits = dtype.itemsize * 8
+	if dtype.kind == 'u':
+		return 2.**(bits - 1), 2.**(bits - 1)
+	if bit_depth is not None and 0 < bit_depth <= bits:
+		bits = bit_depth
+	return 0., 2.**(bits - 1)
+
+
+def _normalize(samples, offset, scale, dtype, out = None, block_size = 2**16):
+	"""
+	Normalize samples, in place if they are a writable array of 'dtype',
+	otherwise block by block into 'out' (allocated if 'None'),
+	so no full-size temporary arrays are created
+	"""
+	
+	if out is None:
+		if isinstance(samples, np.ndarray) and samples.dtype == dtype \
+		   and samples.flags.writeable and type(samples) is not np.memmap:
+			out = samples
+		else:
+			out = np.empty(shape = samples.shape, dtype = dtype)
+	for start in range(0, len(samples), block_size):
+		block = out[start:start + block_size]
+		if out is not samples:
+			block[...] = samples[start:start + block_size]
+		if offset:
+			block -= offset
+		block /= scale
+	return out
 
 
 class Wave:
@@ -24,57 +68,226 @@ class Wave:
 		
 		Parameters
 		----------
-		wave: file path to WAV file or numpy array of a WAV signal samples
+		wave: file path to an audio file (WAV, FLAC, or a format
+			added with 'readers.register_reader')
+			or numpy array of a WAV signal samples
 			array must be in the shape (n_samples, n_channels)
-
+		
 		"""
 		
+		self._samples = None
 		if type(wave) is str:
 			self.filepath = wave
 			self.basename = path.basename(wave)
 			
-			# properties
-			self.bit_depth = file_info.bitrate(wave)		# bit depth
-			self.n_samples = file_info.num_samples(wave)	# number of samples
-			self.n_channels = file_info.channels(wave)		# number of channels
-			self.duration = file_info.duration(wave)		# duration
+			# properties (read once from the file header)
+			with stage('read_header', file = wave):
+				self.reader = open_reader(wave)
+			self.rate = self.reader.rate						# sample rate
+			self.bit_depth = self.reader.bit_depth				# bit depth
+			self.n_channels = self.reader.n_channels			# number of channels
+			self.n_samples = self.reader.n_samples				# number of samples
+			self.duration = self.n_samples / float(self.rate)	# duration
 		else:
 			self.samples = wave
 			self.n_samples = len(wave)						# number of samples
 			self.n_channels = wave.shape[1]					# number of channels
 		self.channels = np.arange(self.n_channels)			# channels
 		self.normalized = False								# normalized
-
+		self._normalization = None							# offset, scale and dtype
+		
 		# def __str__():
-
-
-	def normalize(self, value = None):
+	
+	
+	@property
+	def samples(self):
+		"""
+		Samples of the wave in the shape (n_samples, n_channels)
+		
+		For WAV files the samples are a read-only memory-mapped view
+		of the data chunk, so slicing reads only the accessed pages,
+		samples of other formats (e.g. FLAC or 24-bit WAV) are decoded
+		when first accessed, use 'blocks' to decode them in chunks
+		
+		Samples of normalized waves are decoded into a float array
+		"""
+		
+		if self._samples is None:
+			if not hasattr(self, 'filepath'):
+				raise AttributeError("'Wave' object has no samples")
+			if self.normalized:
+				self._samples = self._read_normalized()
+			else:
+				self._samples = self._memmap()
+		return self._samples
+	
+	
+	@samples.setter
+	def samples(self, value):
+		self._samples = value
+	
+	
+	def _memmap(self):
+		"""Memory-map the samples of the wave file
+		(samples that can not be memory-mapped are decoded)"""
+		
+		return self.reader.samples()
+	
+	
+	def _read_normalized(self, block_size = 2**16):
+		"""Decode and normalize the samples of the wave file block by block"""
+		
+		offset, scale, dtype = self._normalization
+		samples = np.empty(shape = (self.n_samples, self.n_channels), dtype = dtype)
+		for start in range(0, self.n_samples, block_size):
+			_normalize(self.reader.read(start, start + block_size), offset, scale, dtype,
+					   out = samples[start:start + block_size])
+		return samples
+	
+	
+	def read_samples(self, start = 0, stop = None):
+		"""
+		Read the samples from 'start' to 'stop' (sample indices)
+		
+		Samples of files that are not read (or memory-mapped) yet
+		are decoded from the file, without reading the rest of it
+		
+		Returns
+		----------
+		samples: numpy array in the shape (stop - start, n_channels)
+		"""
+		
+		if self._samples is None and hasattr(self, 'filepath'):
+			samples = self.reader.read(start, stop)
+			if self.normalized:
+				samples = _normalize(samples, *self._normalization)
+			return samples
+		return self.samples[start:stop]
+	
+	
+	def blocks(self, block_size = 2**16, channels = None):
+		"""
+		Read the wave in consecutive blocks of samples
+		
+		Parameters
+		----------
+		block_size: integer, default = 65536
+			number of samples in each block
+		
+		channels: integer or list of integers, default = None
+			channels to select,
+			if 'None', all channels are selected
+		
+		Yields
+		----------
+		samples: numpy array in the shape (block_size, n_channels),
+			the last block may be shorter
+		"""
+		
+		for start in range(0, self.n_samples, block_size):
+			block = self.read_samples(start, start + block_size)
+			yield block if channels is None else block[:, channels]
+	
+	
+	def segment(self, start = None, end = None, channels = None):
+		"""
+		Select a segment of the wave samples
+		
+		Only the selected samples are read (and decoded, e.g. 24-bit
+		or FLAC samples) from files whose samples are not read yet
+		
+		Parameters
+		----------
+		start: float, default = None
+			start time of the segment in seconds,
+			if 'None', the segment starts at the beginning of the wave
+		
+		end: float, default = None
+			end time of the segment in seconds,
+			if 'None', the segment ends at the end of the wave
+		
+		channels: integer or list of integers, default = None
+			channels to select,
+			if 'None', all channels are selected
+		"""
+		
+		start = 0 if start is None else int(round(start * self.rate))
+		end = self.n_samples if end is None else int(round(end * self.rate))
+		samples = self.read_samples(start, end)
+		if channels is None:
+			return samples
+		return samples[:, channels]
+	
+	
+	def normalize(self, value = None, dtype = np.float64):
 		"""
 		Normalize wave file
 		
+		Samples of a wave file that are not read yet are normalized
+		as they are read (by 'read', 'samples', 'read_samples' or 'blocks'),
+		so the integer samples are never held in memory with the float samples,
+		float samples in memory are normalized in place
+		
 		Parameters
 		----------
 		value: float, default = None
 			normalize the wave signal
 			If 'None', the wave will be normalized
 			based on the potential maximum value
-			that is determined by the bit depth of each sample
+			that is determined by the dtype of the samples
+			and the bit depth of the wave file (float samples are not scaled),
+			otherwise the samples are divided by 'value'
+		
+		dtype: numpy float dtype, default = numpy.float64
+			dtype of the normalized samples
 		"""
 		
-		try:
-			self.samples = self.samples / (2.**(self.bit_depth - 1))
-			self.normalized = True
-		except AttributeError as error:
-			print(error, file = stderr)
-
-
-	def read(self):
+		# check parameters
+		dtype = np.dtype(dtype)
+		if dtype.kind != 'f':
+			raise ValueError("'{0}' is not a float dtype".format(dtype))
+		if self.normalized:
+			return
+		
+		if self._samples is None:
+			if not hasattr(self, 'filepath'):
+				raise AttributeError("'Wave' object has no samples")
+			offset, scale = _full_scale(self.reader.dtype, self.bit_depth)
+		else:
+			offset, scale = _full_scale(self._samples.dtype, getattr(self, 'bit_depth', None))
+		if value is not None:
+			if value <= 0:
+				raise ValueError("'value' must be positive")
+			offset, scale = 0., float(value)
+		self._normalization = (offset, scale, dtype)
+		self.normalized = True
+		if self._samples is not None:
+			with stage('normalize') as info:
+				info['shape'] = self._samples.shape
+				self._samples = _normalize(self._samples, offset, scale, dtype)
+	
+	
+	def read(self, mmap = False):
 		"""
 		Read wave file
-
+		
+		Parameters
+		----------
+		mmap: boolean, default = False
+			memory-map the samples instead of loading them into memory,
+			only the pages of the file that are accessed will be read
+			(normalized samples are always loaded)
+		
 		"""
 		
 		try:
-			self.rate, self.samples = wavfile.read(self.filepath)
+			with stage('read', mmap = mmap) as info:
+				if self.normalized:
+					self.samples = self._read_normalized()
+				elif mmap:
+					self.samples = self._memmap()
+				else:
+					self.samples = np.array(self._memmap())
+				info['shape'] = self.samples.shape
 		except AttributeError as error:
-			print(error, file = stderr)
\ No newline at end of file
+			print(error, file = stderr)
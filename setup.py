@@ -15,6 +15,10 @@ setup(	name='nacoustik',
 		author_email='jake@jacobdein.com',
 		url='https://github.com/jacobdein/nacoustik',
 		packages=find_packages(),
+		extras_require={
+		  'flac': ['soundfile']},
+		entry_points={
+		  'console_scripts': ['nacoustik-batch=nacoustik.batch:main']},
 		license='MIT',
 		platforms='any',
 		classifiers=[
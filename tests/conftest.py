@@ -0,0 +1,42 @@
+"""
+Fixtures shared by the tests, audio files of random noise written with soundfile
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import os
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def write_audio(tmp_path):
+    """Factory of audio files in the temporary directory; writes the 'signal'
+    or, without one, normal random noise of 'n_samples' samples, clipped to [-1, 1],
+    and returns the path of the file"""
+
+    soundfile = pytest.importorskip('soundfile')
+
+    def write(name, rate, n_samples = None, n_channels = 2, subtype = 'PCM_16',
+              scale = 0.1, seed = 0, signal = None):
+        filepath = os.path.join(str(tmp_path), name)
+        directory = os.path.dirname(filepath)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        if signal is None:
+            rng = np.random.default_rng(seed)
+            signal = np.clip(rng.normal(0, scale, size = (n_samples, n_channels)), -1, 1)
+        soundfile.write(filepath, signal, rate, subtype = subtype)
+        return filepath
+
+    return write
+
+
+@pytest.fixture
+def wav_file(write_audio):
+    """One second of 16-bit stereo noise at 22050 Hz"""
+    return write_audio('test.wav', 22050, 22050)
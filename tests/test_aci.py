@@ -0,0 +1,57 @@
+"""
+Tests of the acoustic complexity index against a naive implementation
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import numpy as np
+import pytest
+from nacoustik.index import calculate_aci
+
+
+def naive_aci_blocks(a, block_delta):
+    """ACI of each block, a remaining partial block with at least two time steps is included"""
+
+    n_channels, n_bands, n_steps = a.shape
+    starts = list(range(0, n_steps - 1, block_delta))
+    if n_steps - starts[-1] < 2:
+        starts = starts[:-1]
+    aci = np.empty(shape = (n_channels, n_bands, len(starts)))
+    for channel in range(n_channels):
+        for band in range(n_bands):
+            for block, start in enumerate(starts):
+                values = a[channel, band, start:start + block_delta].astype(np.float64)
+                intensity = values.sum()
+                d = np.abs(np.diff(values)).sum()
+                aci[channel, band, block] = d / intensity if intensity > 0 else 0.
+    return aci
+
+
+@pytest.mark.parametrize('n_steps', [40, 47, 41, 9])
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_aci_blocks(n_steps, dtype):
+    # 40: whole blocks, 47: partial block, 41: 1-step remainder, 9: partial block only
+    rng = np.random.default_rng(0)
+    a = rng.exponential(1e-3, size = (2, 6, n_steps)).astype(dtype)
+    # zero-intensity bands
+    a[0, 2] = 0
+    a[1, 5] = 0
+    a[1, 3, :10] = 0
+    aci = calculate_aci(a, time_delta = 0.1, block_duration = 1., kind = 'blocks')
+    reference = naive_aci_blocks(a, 10)
+    assert aci.dtype == dtype
+    assert aci.shape == reference.shape
+    np.testing.assert_allclose(aci, reference, rtol = 1e-5 if dtype == np.float32 else 1e-12)
+    assert np.all(aci[0, 2] == 0) and np.all(aci[1, 5] == 0)
+
+
+def test_aci_mean_weights_partial_block():
+    rng = np.random.default_rng(1)
+    a = rng.exponential(1e-3, size = (1, 4, 47))
+    aci, aci_blocks = calculate_aci(a, time_delta = 0.1, kind = 'both')
+    weights = np.array([1., 1., 1., 1., 0.7])
+    np.testing.assert_allclose(aci, (aci_blocks * weights).sum(axis = 2) / weights.sum())
@@ -0,0 +1,74 @@
+"""
+Tests of resuming batch runs
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import csv
+import os
+import pytest
+from nacoustik import batch
+from nacoustik.store import ResultStore
+
+RATE = 22050
+
+
+@pytest.fixture
+def wav_files(write_audio):
+    return [write_audio(os.path.join('SITE', 'SITE_2024010{0}_060000.wav'.format(i + 1)),
+                        RATE, RATE * 2, seed = i) for i in range(3)]
+
+
+def read_rows(output):
+    with open(output, newline = '') as f:
+        return list(csv.DictReader(f))
+
+
+def test_resume_after_store_append(wav_files, tmp_path):
+    output = os.path.join(str(tmp_path), 'results.csv')
+    store = ResultStore(os.path.join(str(tmp_path), 'store'))
+    # a crash after the store append of the first file, before its output row
+    row, records = batch._process(wav_files[0], bins = True)
+    store.append_rows([batch._store_row(row, None)])
+
+    assert batch.run(wav_files, output, workers = 1, store = store) == 3
+    assert sorted(row['file'] for row in read_rows(output)) == wav_files
+    assert sorted(store.read(['file'])['file'].tolist()) == wav_files
+    assert batch.run(wav_files, output, workers = 1, store = store) == 0
+
+
+def test_resume_retries_errors(wav_files, tmp_path):
+    output = os.path.join(str(tmp_path), 'results.csv')
+    # a file which cannot be read in the first run
+    with open(wav_files[1], 'rb') as f:
+        content = f.read()
+    with open(wav_files[1], 'wb') as f:
+        f.write(b'not a wave file')
+    assert batch.run(wav_files, output, workers = 1) == 3
+    assert [row['status'] for row in read_rows(output)] == ['ok', 'error', 'ok']
+
+    with open(wav_files[1], 'wb') as f:
+        f.write(content)
+    assert batch.run(wav_files, output, workers = 1) == 1
+    rows = read_rows(output)
+    assert (rows[-1]['file'], rows[-1]['status']) == (wav_files[1], 'ok')
+    assert batch.run(wav_files, output, workers = 1) == 0
+
+
+@pytest.mark.filterwarnings('ignore::RuntimeWarning')
+def test_single_window(write_audio, tmp_path):
+    # 1500 samples, a single analysis window of 1024 samples
+    filepath = write_audio('short.wav', RATE, 1500)
+    row = batch.process_file(filepath)
+    assert (row['status'], row['channels']) == ('ok', 2)
+    assert row['anthrophony'] > 0
+    # the aci is not defined without differences between time steps
+    assert row['aci'] != row['aci']
+
+    output = os.path.join(str(tmp_path), 'results.csv')
+    assert batch.run([filepath], output, workers = 1) == 1
+    assert read_rows(output)[0]['status'] == 'ok'
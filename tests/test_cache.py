@@ -0,0 +1,92 @@
+"""
+Tests of the spectrogram cache
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import os
+import numpy as np
+import pytest
+from nacoustik import Wave
+from nacoustik.spectrum import psd, SpectrogramCache
+import nacoustik.spectrum.analysis
+
+soundfile = pytest.importorskip('soundfile')
+
+RATE = 22050
+
+
+def key(cache, wave, dtype = np.float64, window_length = 512):
+    return cache.key(wave, RATE, window_length, 50, 'hann', 'density', dtype = dtype)
+
+
+def test_psd_miss_and_hit(wav_file, tmp_path, monkeypatch):
+    cache = SpectrogramCache(os.path.join(str(tmp_path), 'cache'))
+    expected = psd(Wave(wav_file), units = 'watts', window_length = 512)
+    assert cache.get(key(cache, Wave(wav_file))) is None
+
+    # a miss computes and stores the spectrogram
+    result = psd(Wave(wav_file), units = 'watts', window_length = 512, cache = cache)
+    for array, expected_array in zip(result, expected):
+        np.testing.assert_array_equal(array, expected_array)
+    assert cache.get(key(cache, Wave(wav_file))) is not None
+
+    # a hit does not compute the spectrogram
+    def fail(*args, **kwargs):
+        raise AssertionError('the spectrogram is computed')
+    monkeypatch.setattr(nacoustik.spectrum.analysis, 'stft_psd', fail)
+    f, t, a = psd(Wave(wav_file), units = 'decibels', window_length = 512, cache = cache)
+    np.testing.assert_allclose(a, 10 * np.log10(expected[2] / 400.))
+
+
+def test_key(wav_file, tmp_path):
+    cache = SpectrogramCache(str(tmp_path))
+    wave = Wave(wav_file)
+    keys = {key(cache, wave), key(cache, Wave(wav_file))}
+    assert len(keys) == 1
+    keys.add(key(cache, wave, dtype = np.float32))
+    keys.add(key(cache, wave, window_length = 1024))
+    # the normalization (offset, scale, and dtype) of waves hashed by the file content
+    normalized = Wave(wav_file)
+    normalized.normalize()
+    keys.add(key(cache, normalized))
+    normalized = Wave(wav_file)
+    normalized.normalize(dtype = np.float32)
+    keys.add(key(cache, normalized))
+    normalized = Wave(wav_file)
+    normalized.normalize(value = 1000.)
+    keys.add(key(cache, normalized))
+    assert len(keys) == 6
+
+    # waves of samples are hashed by their samples
+    samples = np.ones((100, 2))
+    assert key(cache, Wave(samples)) == key(cache, Wave(samples.copy()))
+    assert key(cache, Wave(samples)) != key(cache, Wave(samples.astype(np.float32)))
+
+    # changed files are hashed again
+    soundfile.write(wav_file, np.zeros((RATE, 2)), RATE, subtype = 'PCM_16')
+    os.utime(wav_file, ns = (0, 0))
+    assert key(cache, Wave(wav_file)) not in keys
+
+
+def test_evict_least_recently_used(tmp_path):
+    psd_array = np.zeros((1, 100, 100))
+    cache = SpectrogramCache(str(tmp_path), max_size = None)
+    cache.put('a', np.zeros(100), np.zeros(100), psd_array)
+    size = os.path.getsize(os.path.join(str(tmp_path), 'a.npz'))
+    cache.max_size = 2 * size
+    for i, name in enumerate(['a', 'b']):
+        cache.put(name, np.zeros(100), np.zeros(100), psd_array)
+        os.utime(os.path.join(str(tmp_path), name + '.npz'), (i, i))
+    # 'a' becomes the most recently used
+    assert cache.get('a') is not None
+    cache.put('c', np.zeros(100), np.zeros(100), psd_array)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert sorted(os.listdir(str(tmp_path))) == ['a.npz', 'c.npz']
+    cache.clear()
+    assert os.listdir(str(tmp_path)) == []
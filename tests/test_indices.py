@@ -0,0 +1,162 @@
+"""
+Tests of the acoustic index suite against per-channel implementations
+and known values
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import numpy as np
+import pytest
+from nacoustik.index import calculate_aci, calculate_indices, calculate_windows
+from nacoustik.spectrum import sel
+
+RATE = 22050
+
+
+def spectrogram(n_channels = 2, n_steps = 200, seed = 0):
+    # decibel spectrogram of 257 bands with a noise floor and louder events
+    rng = np.random.default_rng(seed)
+    f = np.linspace(0, RATE / 2, 257)
+    t = (np.arange(n_steps) + 0.5) * 0.02
+    a = rng.normal(-80., 5., size = (n_channels, len(f), n_steps))
+    a[:, 40:120, ::7] += rng.uniform(10., 40., size = (n_channels, 80, len(range(0, n_steps, 7))))
+    return f, t, a
+
+
+def entropy(p):
+    p = p / p.sum()
+    p = p[p > 0]
+    return -(p * np.log(p)).sum()
+
+
+def reference_indices(channel, f, t):
+    """Indices of a 2d spectrogram (frequency bands, time steps) in decibels,
+    with the default parameters of 'calculate_indices'"""
+
+    watts = 10**(channel / 10)
+    spectrum = watts.mean(axis = 1)
+    envelope = watts.sum(axis = 0)
+    threshold = channel.max() - 50.
+    occupancy = []
+    for low in range(0, 10000, 1000):
+        band = (f >= low) & (f < low + 1000)
+        occupancy.append((channel[band] > threshold).mean())
+    occupancy = np.array(occupancy)
+
+    n = len(occupancy)
+    x = np.sort(occupancy)
+    gini = (2 * np.arange(1, n + 1) * x).sum() / (n * x.sum()) - (n + 1) / n
+
+    bi_band = (f >= 2000) & (f < 8000)
+    bi_spectrum = 10 * np.log10(spectrum[bi_band])
+    anthrophony = spectrum[(f >= 1000) & (f < 2000)].sum()
+    biophony = spectrum[(f >= 2000) & (f < 11000)].sum()
+
+    decibels = 10 * np.log10(envelope)
+    above = decibels > np.median(decibels) + 3.
+    events = sum(1 for i in range(len(above)) if above[i] and (i == 0 or not above[i - 1]))
+
+    hs = entropy(spectrum) / np.log(len(spectrum))
+    ht = entropy(envelope) / np.log(len(envelope))
+    return {'aci': calculate_aci(watts[np.newaxis], t[1] - t[0])[0].sum(),
+            'adi': entropy(occupancy),
+            'aei': gini,
+            'bi': (bi_spectrum - bi_spectrum.min()).sum() * (f[1] - f[0]) / 1000,
+            'ndsi': (biophony - anthrophony) / (biophony + anthrophony),
+            'hs': hs, 'ht': ht, 'h': hs * ht,
+            'events': events}
+
+
+@pytest.mark.parametrize('n_channels', [1, 2])
+def test_indices(n_channels):
+    f, t, a = spectrogram(n_channels)
+    indices = calculate_indices(a, f, t)
+    for channel in range(n_channels):
+        reference = reference_indices(a[channel], f, t)
+        assert sorted(indices) == sorted(reference)
+        for name, value in reference.items():
+            assert indices[name][channel] == pytest.approx(value, rel = 1e-9), name
+
+
+def test_indices_known_values():
+    f = np.linspace(0, RATE / 2, 257)
+    t = (np.arange(100) + 0.5) * 0.02
+    # constant spectrogram: all bins occupied evenly, flat spectrum and envelope
+    a = np.full(shape = (1, len(f), len(t)), fill_value = -60.)
+    indices = calculate_indices(a, f, t)
+    assert indices['adi'][0] == pytest.approx(np.log(10))
+    assert indices['aei'][0] == pytest.approx(0, abs = 1e-12)
+    assert indices['hs'][0] == pytest.approx(1)
+    assert indices['ht'][0] == pytest.approx(1)
+    assert indices['bi'][0] == pytest.approx(0)
+    assert indices['aci'][0] == pytest.approx(0)
+    assert indices['events'][0] == 0
+    # power only in the biophony range, and three events
+    a[:, (f < 2000) | (f >= 11000)] = -200.
+    a[:, :, [10, 11, 40, 90]] += 20.
+    indices = calculate_indices(a, f, t, indices = ['ndsi', 'events'])
+    assert sorted(indices) == ['events', 'ndsi']
+    assert indices['ndsi'][0] == pytest.approx(1)
+    assert indices['events'][0] == 3
+    with pytest.raises(ValueError):
+        calculate_indices(a, f, t, indices = ['unknown'])
+
+
+def test_indices_single_window():
+    f, t, a = spectrogram(n_steps = 1)
+    # the spectrum indices of a single analysis window equal those of the window repeated
+    names = ['adi', 'aei', 'bi', 'ndsi', 'hs']
+    indices = calculate_indices(a, f, t, indices = names)
+    expected = calculate_indices(np.repeat(a, 2, axis = 2), f, np.array([0.01, 0.03]),
+                                 indices = names)
+    for name in names:
+        np.testing.assert_allclose(indices[name], expected[name], rtol = 1e-12, err_msg = name)
+    with pytest.raises(ValueError, match = 'two time steps'):
+        calculate_indices(a, f, t, indices = ['aci'])
+
+
+@pytest.mark.parametrize('step', [None, 1.5])
+@pytest.mark.parametrize('with_b', [False, True])
+def test_windows_equal_indices_of_each_window(step, with_b):
+    pytest.importorskip('pandas')
+    rng = np.random.default_rng(3)
+    f = np.linspace(0, RATE / 2, 129)
+    t = (np.arange(317) + 0.5) * 0.05
+    a = rng.normal(-70., 8., size = (2, len(f), len(t)))
+    b = None
+    if with_b:
+        b = np.ma.masked_array(a, mask = rng.random(size = a.shape) < 0.3)
+
+    # windows of 60 time steps, aci blocks of 10, chunks smaller than a window
+    windows = calculate_windows(a, f, t, window_duration = 3., step = step, b = b,
+                                block_duration = 0.5, chunk_length = 25)
+    window_length, step_length = 60, 60 if step is None else 30
+    starts = np.arange(0, len(t) - window_length + 1, step_length)
+    np.testing.assert_allclose(windows.index, starts * 0.05)
+    for start, (index, row) in zip(starts, windows.iterrows()):
+        window = a[:, :, start:start + window_length]
+        window_b = None if b is None else b[:, :, start:start + window_length]
+        minutes = window_length * 0.05 / 60
+        anthrophony, biophony = sel(window, RATE, minutes, b = window_b)
+        assert row['anthrophony'] == pytest.approx(anthrophony, rel = 1e-9)
+        assert row['biophony'] == pytest.approx(biophony, rel = 1e-9)
+        bins, anthrophony, biophony = sel(window, RATE, minutes, return_bins = True)
+        assert row['sel'] == pytest.approx(10 * np.log10((10**(bins / 10)).sum()), rel = 1e-9)
+        watts = 10**(window / 10)
+        if b is not None:
+            watts[np.ma.getmaskarray(window_b)] = 0
+        aci = calculate_aci(watts, 0.05, block_duration = 0.5, kind = 'blocks')
+        assert row['aci'] == pytest.approx(aci.mean(axis = 2).sum(axis = 1).mean(), rel = 1e-9)
+        assert row['psd_mean'] == pytest.approx(
+            10 * np.log10((10**(window / 10)).mean()), rel = 1e-9)
+
+
+def test_windows_single_window():
+    pytest.importorskip('pandas')
+    f, t, a = spectrogram(n_steps = 1)
+    with pytest.raises(ValueError, match = 'two time steps'):
+        calculate_windows(a, f, t, window_duration = 0.02)
@@ -0,0 +1,93 @@
+"""
+Tests of the long-term spectral average
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import os
+import numpy as np
+import pytest
+from nacoustik.ltsa import LTSA, build_ltsa
+
+RATE = 8000
+
+
+@pytest.fixture
+def wav_files(write_audio):
+    # three 10 second files, one every minute, with 2 second slices
+    return [write_audio('SITE_20240601_060{0}00.wav'.format(minute), RATE, RATE * 10,
+                        n_channels = 1, seed = minute) for minute in range(3)]
+
+
+def build(filepaths, directory, **parameters):
+    return build_ltsa(filepaths, directory, slice_duration = 2., window_length = 256, **parameters)
+
+
+def test_build_ltsa_sorts_files(wav_files, tmp_path):
+    ltsa = build(wav_files[::-1], os.path.join(str(tmp_path), 'ltsa'))
+    times = ltsa.times()
+    assert [filepath for filepath, n_columns, end_time in ltsa.files()] == wav_files
+    assert np.all(np.diff(times) > np.timedelta64(0, 'ns'))
+    times, values = ltsa.read(start = '2024-06-01T06:01', end = '2024-06-01T06:02')
+    assert len(times) == 5
+    assert np.all(times.astype('datetime64[m]') == np.datetime64('2024-06-01T06:01'))
+
+
+def test_extend_with_earlier_file_raises(wav_files, tmp_path):
+    directory = os.path.join(str(tmp_path), 'ltsa')
+    build(wav_files[1:], directory)
+    n_columns = LTSA(directory).n_columns
+    with pytest.raises(ValueError):
+        build(wav_files[:1], directory)
+    ltsa = LTSA(directory)
+    assert ltsa.n_columns == n_columns
+    assert len(ltsa.files()) == 2
+
+
+def assert_equal_ltsa(ltsa, expected):
+    np.testing.assert_array_equal(ltsa.times(), expected.times())
+    np.testing.assert_array_equal(ltsa.values(), expected.values())
+    assert ltsa.files() == expected.files()
+
+
+def test_extend(wav_files, tmp_path):
+    expected = build(wav_files, os.path.join(str(tmp_path), 'expected'))
+    directory = os.path.join(str(tmp_path), 'ltsa')
+    build(wav_files[:2], directory)
+    assert_equal_ltsa(build(wav_files, directory), expected)
+    assert len(expected.files()) == 3 and expected.n_columns == 15
+
+
+def test_repair_interrupted_append(wav_files, tmp_path):
+    expected = build(wav_files, os.path.join(str(tmp_path), 'expected'))
+    directory = os.path.join(str(tmp_path), 'ltsa')
+    ltsa = build(wav_files[:2], directory)
+    # columns of the third file written, but the file not recorded
+    with open(os.path.join(directory, 'values.f32'), 'ab') as f:
+        f.write(np.zeros(3 * ltsa._column_size() // 4 + 1, dtype = '<f4').tobytes())
+    with open(os.path.join(directory, 'times.i8'), 'ab') as f:
+        f.write(np.zeros(2, dtype = '<i8').tobytes())
+    ltsa = LTSA(directory)
+    assert ltsa.n_columns == 10
+    assert os.path.getsize(os.path.join(directory, 'values.f32')) == 10 * ltsa._column_size()
+    assert_equal_ltsa(build(wav_files, directory), expected)
+
+
+def test_extend_files_without_start_times(wav_files, tmp_path):
+    # files without a time in their name follow the end of the previous file
+    filepaths = []
+    for i, filepath in enumerate(wav_files):
+        filepaths.append(os.path.join(str(tmp_path), 'recording-{0}.wav'.format(chr(97 + i))))
+        os.rename(filepath, filepaths[-1])
+    expected = build(filepaths, os.path.join(str(tmp_path), 'expected'))
+    times = expected.times()
+    assert times[0] == np.datetime64(0, 'ns')
+    assert times[5] == np.datetime64(10, 's')
+    directory = os.path.join(str(tmp_path), 'ltsa')
+    build(filepaths[:2], directory)
+    # the skipped files carry their end time to the new file
+    assert_equal_ltsa(build(filepaths, directory), expected)
@@ -0,0 +1,60 @@
+"""
+Tests of the Monitor with a file standing in for the live source
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import io
+import numpy as np
+import pytest
+from nacoustik.monitor import Monitor, read_blocks, wave_blocks
+from nacoustik.spectrum import psd
+
+RATE = 22050
+
+
+@pytest.fixture
+def wav_file(write_audio):
+    rng = np.random.default_rng(0)
+    signal = np.clip(rng.normal(0, 0.1, size = (int(RATE * 5.3), 2)), -1, 1)
+    # a tone in the second channel
+    signal[:, 1] += 0.3 * np.sin(2 * np.pi * 3000. * np.arange(len(signal)) / RATE)
+    return write_audio('stream.wav', RATE, signal = signal / 2)
+
+
+def test_monitor_intervals_equal_psd(wav_file):
+    monitor = Monitor(RATE, 2, interval = 1., window_length = 512)
+    results = list(monitor.run(wave_blocks(wav_file, block_size = 1001)))
+    f, t, a = psd(wav_file, units = 'watts', window_length = 512)
+
+    n_interval = monitor._n_interval
+    assert len(results) == -(-a.shape[2] // n_interval)
+    for i, result in enumerate(results):
+        start = i * n_interval
+        interval = a[:, :, start:start + n_interval]
+        assert result['start'] == pytest.approx(start * monitor.time_delta)
+        assert result['duration'] == pytest.approx(interval.shape[2] * monitor.time_delta)
+        expected = 10 * np.log10(interval.mean(axis = 2) / (20.**2))
+        np.testing.assert_allclose(result['psd_mean'], expected, rtol = 1e-9)
+
+
+class PartialReader(io.RawIOBase):
+    """A pipe returning at most 'size' bytes per read, splitting frames"""
+
+    def __init__(self, data, size):
+        self._data = io.BytesIO(data)
+        self._size = size
+
+    def read(self, n = -1):
+        return self._data.read(min(n, self._size) if n >= 0 else self._size)
+
+
+def test_read_blocks_partial_frames():
+    samples = np.arange(3 * 1000, dtype = np.int16).reshape(1000, 3)
+    blocks = list(read_blocks(PartialReader(samples.tobytes(), 7), n_channels = 3, block_size = 64))
+    assert all(block.shape[1] == 3 for block in blocks)
+    np.testing.assert_array_equal(np.concatenate(blocks), samples)
@@ -0,0 +1,207 @@
+"""
+Tests of the noise profile against the previous pandas implementation
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import numpy as np
+import pytest
+from nacoustik.noise import remove_anthrophony, ROI_DTYPE
+from nacoustik.noise.noise import _noise_profile, _denoise, _sliding_sum
+
+pd = pytest.importorskip('pandas')
+
+
+def _find_cutoff_index(histogram, cutoff_count):
+    cumsum = 0.0
+    for index, value in histogram.items():
+        cumsum += value
+        if cumsum >= cutoff_count:
+            break
+    return index
+
+
+def pandas_noise_profile(histograms, edges, N):
+    """The per-band pandas loop of 'remove_background_noise' before vectorization
+    (with 'iteritems' and 'np.NaN' replaced for current pandas and numpy)"""
+
+    cutoffs = np.empty(shape = (histograms.shape[0], histograms.shape[1]))
+    modals = np.empty(shape = (histograms.shape[0], histograms.shape[1]))
+    for channel in range(histograms.shape[0]):
+        modal_minimum = 0
+        for f_band in range(histograms.shape[1]):
+            histogram = pd.Series(histograms[channel, f_band])
+            histogram = histogram.rolling(center = False, window = 5).mean()
+            histogram = histogram.fillna(0)
+            modal_index = histogram.idxmax()
+            modal = edges[channel, f_band, modal_index]
+            if modal > modal_minimum:
+                modals[channel, f_band] = modal_minimum
+            else:
+                modal_minimum = modal
+                modals[channel, f_band] = modal_minimum
+            cutoff_count = histogram[0:modal_index].sum() * 0.68 * N
+            cutoffs[channel, f_band] = edges[channel, f_band, _find_cutoff_index(histogram, cutoff_count)]
+
+    for channel in range(histograms.shape[0]):
+        smoothed = pd.Series(cutoffs[channel]).rolling(center = False, window = 5).mean()
+        smoothed = smoothed.fillna(smoothed.max())
+        cutoffs[channel] = smoothed.values
+    return modals, cutoffs
+
+
+def histograms_of(a, n_bins):
+    histograms = np.empty(shape = a.shape[:2] + (n_bins,))
+    edges = np.empty(shape = a.shape[:2] + (n_bins + 1,))
+    for channel in range(a.shape[0]):
+        for f_band in range(a.shape[1]):
+            histograms[channel, f_band], edges[channel, f_band] = np.histogram(a[channel, f_band], n_bins)
+    return histograms, edges
+
+
+@pytest.mark.parametrize('n_channels', [1, 2, 4])
+@pytest.mark.parametrize('n_bands', [3, 4, 5, 65])
+def test_noise_profile(n_channels, n_bands):
+    rng = np.random.default_rng(n_channels * 100 + n_bands)
+    # decibel spectrogram with a noise floor and louder events
+    a = rng.normal(-60., 6., size = (n_channels, n_bands, 400))
+    a[:, :, rng.integers(0, 400, 40)] += rng.uniform(10., 40., size = (n_channels, n_bands, 40))
+    histograms, edges = histograms_of(a, 32)
+
+    modals, cutoffs = _noise_profile(histograms, edges, 0.1)
+    reference_modals, reference_cutoffs = pandas_noise_profile(histograms, edges, 0.1)
+    np.testing.assert_array_equal(modals, reference_modals)
+    np.testing.assert_allclose(cutoffs, reference_cutoffs, rtol = 1e-12)
+    if n_bands < 5:
+        # no band has a complete smoothing window
+        assert np.isnan(cutoffs).all()
+
+
+def naive_denoise(a, f_size, t_size, threshold):
+    """Neighborhood mean and minimum of every cell with a complete neighborhood,
+    computed directly from the neighborhood values (in float64)"""
+
+    b = np.zeros_like(a)
+    means = np.empty(shape = (a.shape[0], 0, 0))
+    n_f = a.shape[1] - f_size + 1
+    n_t = a.shape[2] - t_size + 1
+    if n_f < 1 or n_t < 1:
+        return b, means
+    windows = np.lib.stride_tricks.sliding_window_view(
+        a.astype(np.float64), (f_size, t_size), axis = (1, 2))
+    means = windows.mean(axis = (3, 4))
+    center = a[:, f_size // 2:f_size // 2 + n_f, t_size // 2:t_size // 2 + n_t]
+    b[:, f_size // 2:f_size // 2 + n_f, t_size // 2:t_size // 2 + n_t] = \
+        np.where(means < threshold, windows.min(axis = (3, 4)), center)
+    return b, means
+
+
+def denoise_input(rng, shape, dtype):
+    # decibels above the cutoff, quantized to quarters,
+    # so the neighborhood sums are exact in float32 and float64
+    a = np.round(rng.exponential(8., size = shape) * 4) / 4
+    a[rng.random(size = shape) < 0.5] = 0
+    return a.astype(dtype)
+
+
+@pytest.mark.parametrize('n_channels', [1, 2, 4])
+@pytest.mark.parametrize('neighborhood', [(9, 3), (1, 1), (3, 5), (5, 1), (1, 7)])
+@pytest.mark.parametrize('shape', [(40, 150), (9, 3), (8, 100), (40, 2), (3, 1)])
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_denoise(n_channels, neighborhood, shape, dtype):
+    # shapes include arrays the size of the default neighborhood and smaller
+    rng = np.random.default_rng(n_channels * 1000 + shape[0] + shape[1])
+    a = denoise_input(rng, (n_channels,) + shape, dtype)
+    b = np.full_like(a, np.nan)
+    _denoise(a, b, neighborhood[0], neighborhood[1], 10.)
+    reference, means = naive_denoise(a, neighborhood[0], neighborhood[1], 10.)
+    assert b.dtype == dtype
+    np.testing.assert_array_equal(b, reference)
+
+
+@pytest.mark.parametrize('size', [3, 9, 27])
+def test_sliding_sum_float32_long_rows(size):
+    rng = np.random.default_rng(size)
+    x = rng.uniform(0., 100., size = 1000000).astype(np.float32)
+    sums = np.empty(len(x) - size + 1, dtype = np.float32)
+    _sliding_sum(x, size, sums)
+    cumsum = np.concatenate([[0.], np.cumsum(x, dtype = np.float64)])
+    np.testing.assert_allclose(sums, cumsum[size:] - cumsum[:-size], rtol = 1e-6)
+
+
+def test_denoise_float32_long_rows():
+    rng = np.random.default_rng(2)
+    a = (rng.exponential(8., size = (2, 12, 200000)) *
+         (rng.random(size = (2, 12, 200000)) < 0.5)).astype(np.float32)
+    b = np.empty_like(a)
+    _denoise(a, b, 9, 3, 10.)
+    reference, means = naive_denoise(a, 9, 3, 10.)
+    # cells with a neighborhood mean at the threshold may be decided either way
+    decided = np.ones(a.shape, dtype = bool)
+    decided[:, 4:-4, 1:-1] = np.abs(means - 10.) > 1e-4
+    assert decided.mean() > 0.99
+    np.testing.assert_array_equal(b[decided], reference[decided])
+
+
+def baseline_remove_anthrophony(ale, freq_delta, cutoffs):
+    """The per-channel, per-roi selection of 'remove_anthrophony' before the roi table
+    (for any number of channels), returns the result and the roi windows"""
+
+    from scipy.ndimage import label, find_objects, generate_binary_structure
+    s = generate_binary_structure(2, 2)
+    windows = []
+    for channel in range(ale.shape[0]):
+        labels, n_features = label(ale[channel], structure = s)
+        rois = np.array([[w[0].start, w[0].stop, w[1].start, w[1].stop]
+                         for w in find_objects(labels)], dtype = np.int32).reshape(-1, 4)
+        windows.append(rois)
+        n_low = np.searchsorted(rois[:, 0], np.ceil(cutoffs[0] / freq_delta).astype(np.int32))
+        high = np.where(rois[:, 1] >= np.ceil(cutoffs[1] / freq_delta).astype(np.int32))[0]
+        for i in list(range(n_low)) + list(high):
+            f0, f1, t0, t1 = rois[i]
+            mask = labels[f0:f1, t0:t1] != (i + 1)
+            ale[channel, f0:f1, t0:t1] *= mask
+    return ale, windows
+
+
+@pytest.mark.parametrize('n_channels', [1, 2, 4])
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_remove_anthrophony(n_channels, dtype):
+    rng = np.random.default_rng(n_channels)
+    # sparse regions of interest, many straddle the cutoff bands (10 and 30)
+    ale = rng.uniform(1., 30., size = (n_channels, 40, 300)) * \
+        (rng.random(size = (n_channels, 40, 300)) < 0.3)
+    # rois across each cutoff, and one spanning both
+    ale[0, 8:13, 10:20] = 5.
+    ale[0, 28:33, 40:50] = 5.
+    ale[-1, 5:36, 100:103] = 5.
+    ale = ale.astype(dtype)
+    reference, windows = baseline_remove_anthrophony(ale.copy(), 100., (1000, 3000))
+
+    result, rois = remove_anthrophony(ale.copy(), 0.1, 100., cutoffs = (1000, 3000),
+                                      return_rois = True)
+    assert result.dtype == dtype
+    np.testing.assert_array_equal(result, reference)
+    assert 0 < np.count_nonzero(result) < np.count_nonzero(ale)
+
+    # roi table, ordered by channel and by label within each channel
+    assert rois.dtype == ROI_DTYPE
+    assert list(rois.dtype.names) == ['channel', 'f_start', 'f_stop', 't_start', 't_stop',
+                                      'area', 'energy']
+    assert len(rois) == sum(len(w) for w in windows)
+    for channel in range(n_channels):
+        table = rois[rois['channel'] == channel]
+        np.testing.assert_array_equal(
+            np.stack([table[name] for name in ['f_start', 'f_stop', 't_start', 't_stop']], axis = 1),
+            windows[channel])
+        for roi in table[:20]:
+            values = ale[channel, roi['f_start']:roi['f_stop'], roi['t_start']:roi['t_stop']]
+            assert roi['area'] <= np.count_nonzero(values)
+    assert rois['area'].sum() == np.count_nonzero(ale)
+    np.testing.assert_allclose(rois['energy'].sum(),
+                               (10**(ale[ale != 0].astype(np.float64) / 10)).sum(),
+                               rtol = 1e-6 if dtype == np.float32 else 1e-12)
@@ -0,0 +1,199 @@
+"""
+Tests of the spectrogram figures, tiles and LTSA plots
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import io
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+
+pytest.importorskip('matplotlib')
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.image import imread
+from nacoustik import Wave
+from nacoustik.ltsa import build_ltsa
+from nacoustik.plot import (SpectrogramFigure, decimate, plot_spectrogram, plot_ltsa,
+                            render_spectrograms, render_tiles)
+from nacoustik.plot.plot import _pool_pairs
+from nacoustik.spectrum import psd
+
+RATE = 22050
+
+
+@pytest.mark.parametrize('shape, n_rows, n_columns, expected', [
+    ((257, 1000), 100, 300, (86, 250)),
+    ((257, 1000), 300, 2000, (257, 1000)),
+    ((64, 4096), 64, 1024, (64, 1024)),
+    ((10, 7), 3, 2, (3, 2))])
+def test_decimate_shape(shape, n_rows, n_columns, expected):
+    a = np.zeros(shape)
+    for pooling in ['max', 'mean']:
+        pixels = decimate(a, n_rows, n_columns, pooling)
+        assert pixels.shape == expected
+        assert pixels.shape[0] <= max(n_rows, 1) and pixels.shape[1] <= n_columns
+
+
+def reduce_blocks(a, row_factor, column_factor, reduce):
+    # reduce blocks of a 2d array with numpy, the incomplete blocks padded with nan
+    rows = -(-a.shape[0] // row_factor) * row_factor
+    columns = -(-a.shape[1] // column_factor) * column_factor
+    padded = np.full((rows, columns), np.nan)
+    padded[:a.shape[0], :a.shape[1]] = a
+    blocks = padded.reshape(rows // row_factor, row_factor, columns // column_factor, column_factor)
+    return reduce(blocks, axis = (1, 3))
+
+
+@pytest.mark.parametrize('chunk_length', [8192, 10, 3])
+def test_decimate_pooling(chunk_length):
+    # 4 bands and 3 steps in each pixel, the last row and column incomplete
+    a = np.random.default_rng(0).uniform(-150, -50, size = (257, 100))
+    pixels = decimate(a, 65, 34, 'max', chunk_length = chunk_length)
+    np.testing.assert_array_equal(pixels, reduce_blocks(a, 4, 3, np.nanmax))
+    # means of the power in watts
+    pixels = decimate(a, 65, 34, 'mean', chunk_length = chunk_length)
+    watts = reduce_blocks(10**(a / 10), 4, 3, np.nanmean)
+    np.testing.assert_allclose(pixels, 10 * np.log10(watts), rtol = 1e-12)
+    with pytest.raises(ValueError):
+        decimate(a, 65, 34, 'median')
+
+
+def test_figure_agg(wav_file, caplog):
+    # the default font of the rcParams, without missing font warnings
+    figure = plot_spectrogram(Wave(wav_file))
+    assert isinstance(figure.figure.canvas, FigureCanvasAgg)
+    with caplog.at_level('WARNING', logger = 'matplotlib.font_manager'):
+        figure.save(io.BytesIO())
+    assert not [record for record in caplog.records if 'findfont' in record.getMessage()]
+    # the pixels of the spectrogram are the decimated psd
+    f, t, a = psd(Wave(wav_file), window_length = 1000)
+    np.testing.assert_array_equal(figure.images[0].get_array(),
+                                  decimate(a[0], figure.n_rows, figure.n_columns))
+
+
+def test_figure_reuse(write_audio):
+    figure = SpectrogramFigure(2)
+    quiet = write_audio('quiet.wav', RATE, RATE, scale = 0.01)
+    loud = write_audio('loud.wav', RATE, RATE * 2, scale = 0.5, seed = 1)
+
+    assert plot_spectrogram(Wave(quiet), figure = figure) is figure
+    quiet_pixels = figure.images[0].get_array().copy()
+    assert plot_spectrogram(Wave(loud), figure = figure) is figure
+    loud_pixels = figure.images[0].get_array()
+    # the layout is kept, the data replaced
+    assert len(figure.figure.axes) == 4
+    assert np.all(loud_pixels > quiet_pixels.max())
+    assert figure.axes[0][0].get_xlim() == (0, 2.)
+
+    # the same pixels as a new figure
+    expected = plot_spectrogram(Wave(loud)).images[0].get_array()
+    np.testing.assert_array_equal(loud_pixels, expected)
+
+    with pytest.raises(ValueError):
+        figure.update(*psd(Wave(quiet).samples[:, :1].copy(), RATE, kind = 'both'),
+                      rate = RATE, duration = 1.)
+
+
+def test_figure_png(wav_file):
+    figure = plot_spectrogram(Wave(wav_file))
+    buffer = io.BytesIO()
+    figure.save(buffer)
+    assert buffer.getvalue().startswith(b'\x89PNG')
+    assert figure._repr_png_() == buffer.getvalue()
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_render_spectrograms(write_audio, tmp_path, workers):
+    filepaths = [write_audio('{0}.wav'.format(i), RATE, RATE, n_channels = 1 + i % 2, seed = i)
+                 for i in range(3)]
+    broken = os.path.join(str(tmp_path), 'broken.wav')
+    with open(broken, 'wb') as f:
+        f.write(b'not a wave file')
+    directory = os.path.join(str(tmp_path), 'figures')
+
+    results = dict(render_spectrograms(filepaths + [broken], directory, workers = workers))
+    assert sorted(results) == sorted(filepaths + [broken])
+    for i, filepath in enumerate(filepaths):
+        assert results[filepath] == os.path.join(directory, '{0}.png'.format(i))
+        image = imread(results[filepath])
+        # a row of 230 pixels for each channel
+        assert image.shape[:2] == (230 * (1 + i % 2), 920)
+    assert not os.path.exists(results[broken])
+
+
+def test_render_spectrograms_after_parallel_kernels(tmp_path, wav_file):
+    # worker processes are not forked from a process running numba threads
+    script = ("from nacoustik import warmup\n"
+              "from nacoustik.plot import render_spectrograms\n"
+              "if __name__ == '__main__':\n"
+              "    warmup()\n"
+              "    print(render_spectrograms([{0!r}], {1!r}, workers = 2))\n")
+    script_path = os.path.join(str(tmp_path), 'render.py')
+    with open(script_path, 'w') as f:
+        f.write(script.format(wav_file, os.path.join(str(tmp_path), 'figures')))
+    # the script imports the tested package
+    environment = dict(os.environ, PYTHONPATH = os.pathsep.join(sys.path))
+    completed = subprocess.run([sys.executable, script_path], env = environment, timeout = 120,
+                               stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+    assert completed.returncode == 0, completed.stderr.decode()
+    assert os.path.exists(os.path.join(str(tmp_path), 'figures', 'test.png'))
+
+
+def test_pool_pairs():
+    pixels = np.random.default_rng(0).uniform(-150, -50, size = (4, 7))
+    padded = np.concatenate([pixels, np.full((4, 1), np.nan)], axis = 1).reshape(4, 4, 2)
+    np.testing.assert_array_equal(_pool_pairs(pixels, 'max'), np.nanmax(padded, axis = 2))
+    watts = np.nanmean(10**(padded / 10), axis = 2)
+    np.testing.assert_allclose(_pool_pairs(pixels, 'mean'), 10 * np.log10(watts), rtol = 1e-12)
+
+
+def test_render_tiles(wav_file, tmp_path):
+    directory = os.path.join(str(tmp_path), 'tiles')
+    # 43 analysis windows, tiles of 16 columns
+    n_levels = render_tiles(wav_file, directory, tile_width = 16, tile_height = 8)
+    assert n_levels == 3
+    with open(os.path.join(directory, 'tiles.json')) as f:
+        parameters = json.load(f)
+    assert (parameters['n_windows'], parameters['n_levels']) == (43, 3)
+
+    # each level pools pairs of columns of the level below
+    widths = {2: [16, 16, 11], 1: [16, 6], 0: [11]}
+    for channel in range(2):
+        for level, level_widths in widths.items():
+            path = os.path.join(directory, str(channel), str(level))
+            assert sorted(os.listdir(path)) == ['{0}.png'.format(i)
+                                                for i in range(len(level_widths))]
+            for i, width in enumerate(level_widths):
+                image = imread(os.path.join(path, '{0}.png'.format(i)))
+                assert image.shape[:2] == (8, width)
+
+
+def test_plot_ltsa(write_audio, tmp_path):
+    filepaths = [write_audio('SITE_20240601_060{0}00.wav'.format(minute), 8000, 8000 * 10,
+                             n_channels = 1, seed = minute) for minute in range(3)]
+    ltsa = build_ltsa(filepaths, os.path.join(str(tmp_path), 'ltsa'), slice_duration = 2.,
+                      window_length = 256)
+
+    buffer = io.BytesIO()
+    figure = plot_ltsa(ltsa, size = (400, 200), filepath = buffer)
+    assert buffer.getvalue().startswith(b'\x89PNG')
+    image = figure.axes[0].images[0]
+    # one pixel column for each of the 15 columns, the bands pooled to the axes height
+    times, values = ltsa.read()
+    assert image.get_array().shape[1] == len(times) == 15
+    assert image.get_array().shape[0] <= 200
+
+    # a time range of the second file
+    figure = plot_ltsa(ltsa, start = '2024-06-01T06:01', end = '2024-06-01T06:02')
+    assert figure.axes[0].images[0].get_array().shape[1] == 5
+    with pytest.raises(ValueError):
+        plot_ltsa(ltsa, start = '2025-01-01')
@@ -0,0 +1,137 @@
+"""
+Tests of the profiling of stages
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import json
+import os
+import threading
+import numpy as np
+import pytest
+from nacoustik.profiling import (Profile, add_callback, remove_callback, is_active,
+                                 stage, profiled)
+
+
+def test_nested_stage_paths():
+    with Profile(file = 'test.wav') as profile:
+        with stage('outer', n = 1) as info:
+            with stage('inner'):
+                pass
+            with stage('inner'):
+                pass
+            info['n'] = 2
+        with stage('other'):
+            pass
+    # records are added as the stages end
+    assert [record['path'] for record in profile.records] == \
+        ['outer/inner', 'outer/inner', 'outer', 'other']
+    assert [record['stage'] for record in profile.records] == \
+        ['inner', 'inner', 'outer', 'other']
+    outer = profile.records[2]
+    assert (outer['n'], outer['file'], outer['peak_memory']) == (2, 'test.wav', None)
+    assert outer['wall_time'] >= profile.records[0]['wall_time'] + profile.records[1]['wall_time']
+
+    summary = profile.summary()
+    assert summary['outer/inner']['count'] == 2
+    assert sorted(summary) == ['other', 'outer', 'outer/inner']
+
+
+def test_inactive_stages_are_not_recorded():
+    assert not is_active()
+    with Profile() as profile:
+        assert is_active()
+    with stage('unmeasured') as info:
+        info['shape'] = (1, 2)
+    assert profile.records == []
+    assert not is_active()
+
+
+def test_callbacks():
+    records = []
+    add_callback(records.append)
+    try:
+        assert is_active()
+        with stage('first'):
+            pass
+    finally:
+        remove_callback(records.append)
+    with stage('second'):
+        pass
+    assert [record['stage'] for record in records] == ['first']
+    assert not is_active()
+    with pytest.raises(ValueError):
+        remove_callback(records.append)
+
+
+def test_peak_memory():
+    with Profile(memory = True) as profile:
+        with stage('outer'):
+            with stage('inner'):
+                a = np.ones(10**6)
+                del a
+            b = np.ones(10**5)
+            del b
+    inner, outer = profile.records
+    assert 8 * 10**6 <= inner['peak_memory'] < 9 * 10**6
+    # the peak of the enclosing stage includes the peaks of its stages
+    assert outer['peak_memory'] >= inner['peak_memory']
+
+
+def test_profiled():
+    @profiled('double')
+    def double(a, factor = 2):
+        """Double an array"""
+        return a * factor, np.sum(a)
+
+    assert (double.__name__, double.__doc__) == ('double', 'Double an array')
+    a = np.ones((3, 4))
+    with Profile() as profile:
+        result, total = double(a)
+        double(5)
+    np.testing.assert_array_equal(result, a * 2)
+    first, second = profile.records
+    assert first['stage'] == 'double'
+    assert (first['input_shapes'], first['output_shapes']) == ([[3, 4]], [[3, 4], []])
+    # scalars without shapes
+    assert 'input_shapes' not in second
+
+
+def test_profiles_of_threads():
+    # stages of other threads are not collected by the profile of this thread
+    started, stop = threading.Event(), threading.Event()
+    records = {}
+
+    def run():
+        with Profile() as profile:
+            started.set()
+            with stage('thread'):
+                stop.wait(10)
+        records['thread'] = profile.records
+
+    thread = threading.Thread(target = run)
+    thread.start()
+    started.wait(10)
+    with Profile() as profile:
+        with stage('main'):
+            stop.set()
+            thread.join()
+    assert [record['stage'] for record in profile.records] == ['main']
+    assert [record['stage'] for record in records['thread']] == ['thread']
+
+
+def test_write(tmp_path):
+    filepath = os.path.join(str(tmp_path), 'profile.jsonl')
+    with Profile(file = 'test.wav') as profile:
+        with stage('first', shape = (2, 3)):
+            pass
+    profile.write(filepath)
+    profile.write(filepath)
+    with open(filepath) as f:
+        lines = [json.loads(line) for line in f]
+    assert len(lines) == 2
+    assert (lines[0]['stage'], lines[0]['shape'], lines[0]['file']) == ('first', [2, 3], 'test.wav')
@@ -0,0 +1,110 @@
+"""
+Tests of the audio readers with locally generated files
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import os
+import numpy as np
+import pytest
+from nacoustik import Wave
+from nacoustik.readers import open_reader, Reader, WavReader, FlacReader
+from nacoustik.spectrum import psd, psd_blocks
+
+soundfile = pytest.importorskip('soundfile')
+
+RATE = 22050
+N_SAMPLES = 20011
+
+# (extension, subtype, reader class, bits of the integer samples or 'None' for float)
+FORMATS = [('.wav', 'PCM_U8', WavReader, 8),
+           ('.wav', 'PCM_16', WavReader, 16),
+           ('.wav', 'PCM_24', WavReader, 24),
+           ('.wav', 'PCM_32', WavReader, 32),
+           ('.wav', 'FLOAT', WavReader, None),
+           ('.flac', 'PCM_S8', FlacReader, 8),
+           ('.flac', 'PCM_16', FlacReader, 16),
+           ('.flac', 'PCM_24', FlacReader, 24)]
+
+
+def reference_samples(filepath, subtype, bits):
+    """Decode a file with soundfile, integer samples in the range of their bit depth
+    (8-bit WAV samples are unsigned)"""
+
+    if bits is None:
+        return soundfile.read(filepath, dtype = 'float32', always_2d = True)[0]
+    samples = soundfile.read(filepath, dtype = 'int32', always_2d = True)[0] >> (32 - bits)
+    if subtype == 'PCM_U8':
+        samples += 128
+    return samples
+
+
+@pytest.fixture(params = FORMATS, ids = lambda f: f[0][1:] + '-' + f[1])
+def audio_file(request, write_audio):
+    extension, subtype, reader, bits = request.param
+    filepath = write_audio('test' + extension, RATE, N_SAMPLES, subtype = subtype, scale = 0.2)
+    return filepath, reader, reference_samples(filepath, subtype, bits)
+
+
+def test_read(audio_file):
+    filepath, reader_class, reference = audio_file
+    with open_reader(filepath) as reader:
+        assert type(reader) is reader_class
+        assert (reader.rate, reader.n_channels, reader.n_samples) == (RATE, 2, N_SAMPLES)
+        samples = reader.read()
+        assert samples.dtype == reader.dtype
+        np.testing.assert_array_equal(samples, reference)
+        for start, stop in [(0, 1), (1000, 1003), (12345, 17000), (N_SAMPLES - 5, N_SAMPLES + 10)]:
+            np.testing.assert_array_equal(reader.read(start, stop), reference[start:stop])
+        np.testing.assert_array_equal(np.concatenate(list(reader.blocks(4999))), reference)
+
+
+def test_psd_blocks(audio_file):
+    filepath, reader_class, reference = audio_file
+    blocks = list(psd_blocks(filepath, units = 'watts', window_length = 256, block_length = 7))
+    a = np.concatenate([block[2] for block in blocks], axis = 2)
+    with open_reader(filepath) as reader:
+        samples = reference.astype(reader.dtype)
+    f, t, expected = psd(samples, RATE, units = 'watts', window_length = 256)
+    np.testing.assert_allclose(a, expected, rtol = 1e-6)
+    np.testing.assert_allclose(np.concatenate([block[1] for block in blocks]), t)
+
+
+def open_files():
+    # number of open file descriptors of the process
+    return len(os.listdir('/proc/self/fd'))
+
+
+def test_readers_keep_no_open_files(audio_file):
+    if not os.path.isdir('/proc/self/fd'):
+        pytest.skip('requires /proc')
+    filepath, reader_class, reference = audio_file
+    n_files = open_files()
+    waves = [Wave(filepath) for i in range(50)]
+    for wave in waves:
+        wave.read_samples(10, 20)
+        next(wave.reader.blocks(100))
+    assert open_files() == n_files
+
+
+def test_reader_is_abstract():
+    with pytest.raises(TypeError):
+        Reader()
+
+    class ArrayReader(Reader):
+        def __init__(self, samples):
+            self.array = samples
+            self.n_samples, self.n_channels = samples.shape
+
+        def read(self, start = 0, stop = None):
+            start, stop = self._range(start, stop)
+            return self.array[start:stop]
+
+    samples = np.arange(20).reshape(10, 2)
+    reader = ArrayReader(samples)
+    np.testing.assert_array_equal(reader.samples(), samples)
+    np.testing.assert_array_equal(np.concatenate(list(reader.blocks(3))), samples)
@@ -0,0 +1,160 @@
+"""
+Tests of the spectrum module against scipy and numpy references
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import numpy as np
+import pytest
+from scipy.signal import spectrogram
+from nacoustik.spectrum import psd, stft_psd, SpectrogramPyramid, sel, sel_bands, octave_bands
+from nacoustik.index import calculate_aci
+from nacoustik.spectrum.summary import SpectrumSummary
+
+
+def scipy_psd(samples, rate, window_length, window_overlap, scaling):
+    """scipy.signal.spectrogram of each channel"""
+
+    noverlap = int(window_length * (window_overlap / 100.))
+    results = [spectrogram(samples[:, channel], fs = rate, window = 'hann',
+                           nperseg = window_length, noverlap = noverlap,
+                           detrend = 'constant', scaling = scaling)
+               for channel in range(samples.shape[1])]
+    return results[0][0], results[0][1], np.stack([result[2] for result in results])
+
+
+@pytest.mark.parametrize('scaling', ['density', 'spectrum'])
+@pytest.mark.parametrize('window_length', [256, 255, 1000])
+@pytest.mark.parametrize('window_overlap', [0, 50, 75, 90])
+@pytest.mark.parametrize('n_channels', [1, 3])
+def test_stft_psd_equals_scipy(scaling, window_length, window_overlap, n_channels):
+    rng = np.random.default_rng(window_length + window_overlap)
+    # an offset, so the constant detrending matters
+    samples = rng.normal(0.1, 0.2, size = (30011, n_channels))
+    # chunks of 3 to 20 windows, so the input is longer than 'chunk_size'
+    f, t, a = stft_psd(samples, 22050, window_length = window_length,
+                       window_overlap = window_overlap, scaling = scaling,
+                       chunk_size = 20 * window_length * n_channels)
+    reference_f, reference_t, reference = scipy_psd(samples, 22050, window_length,
+                                                    window_overlap, scaling)
+    assert a.shape == reference.shape
+    np.testing.assert_allclose(f, reference_f)
+    np.testing.assert_allclose(t, reference_t)
+    np.testing.assert_allclose(a, reference, rtol = 1e-9, atol = 1e-12 * reference.max())
+
+
+def test_stft_psd_out_and_float32():
+    rng = np.random.default_rng(1)
+    samples = rng.normal(0, 0.2, size = (20000, 2))
+    f, t, reference = scipy_psd(samples, 22050, 512, 50, 'density')
+    out = np.empty(shape = reference.shape, dtype = np.float32)
+    f, t, a = stft_psd(samples.astype(np.float32), 22050, window_length = 512,
+                       out = out, chunk_size = 10000)
+    assert a is out
+    np.testing.assert_allclose(a, reference, rtol = 1e-3, atol = 1e-6 * reference.max())
+    # decibels
+    f, t, a = stft_psd(samples, 22050, window_length = 512, units = 'decibels')
+    np.testing.assert_allclose(a, 10 * np.log10(reference / 400.), rtol = 1e-9)
+    with pytest.raises(ValueError):
+        stft_psd(samples, 22050, window_length = 512, out = np.empty((2, 257, 3)))
+
+
+def test_psd_mean_out():
+    samples = np.random.default_rng(4).normal(0, 0.2, size = (20000, 2))
+    f, t, expected = psd(samples, 22050, kind = 'mean', window_length = 512, units = 'watts')
+    # the spectrogram is written to 'out', and its mean returned
+    out = np.zeros(shape = (2, 257, len(t)))
+    f, t, psd_mean = psd(samples, 22050, kind = 'mean', window_length = 512, units = 'watts',
+                         out = out)
+    np.testing.assert_allclose(psd_mean, expected, rtol = 1e-12)
+    np.testing.assert_allclose(out.mean(axis = 2), expected, rtol = 1e-12)
+    with pytest.raises(ValueError):
+        psd(samples, 22050, kind = 'mean', window_length = 512, out = np.empty((2, 257, 3)))
+
+
+def test_summary_histograms_of_blocks():
+    rng = np.random.default_rng(0)
+    a = rng.exponential(1e-3, size = (2, 7, 1300))
+    summary = SpectrumSummary(2, 7, bin_width = 0.5)
+    for start in range(0, a.shape[2], 512):
+        summary.add(a[:, :, start:start + 512])
+    # the values of the first two blocks are counted, those of the last are pending
+    assert summary._histograms.sum() == 2 * 7 * 1024
+    decibels = 10 * np.log10(a / 400.)
+    bins = np.clip(((decibels + 200.) / 0.5), 0, 799).astype(np.int64)
+    assert summary.histograms.dtype == np.uint32
+    for channel in range(2):
+        for band in range(7):
+            np.testing.assert_array_equal(summary.histograms[channel, band],
+                                          np.bincount(bins[channel, band], minlength = 800))
+    np.testing.assert_allclose(summary.mean('watts'), a.mean(axis = 2))
+    levels = summary.levels((10, 50, 90))
+    reference = np.percentile(decibels[1], (90, 50, 10), axis = 1).T
+    np.testing.assert_allclose(levels[1], reference, atol = 0.5)
+
+
+@pytest.mark.parametrize('n_samples', [256, 300, 20000])
+def test_pyramid_deltas(n_samples):
+    # a single time step for 256 and 300 samples
+    samples = np.random.default_rng(0).normal(0, 0.2, size = (n_samples, 1))
+    f, t, a = stft_psd(samples, 22050, window_length = 256, window_overlap = 50)
+    pyramid = SpectrogramPyramid(f, t, a, 22050, n_samples / 22050., 256, window_overlap = 50)
+    assert pyramid.time_delta() == pytest.approx(128 / 22050.)
+    assert pyramid.time_delta((2, 1)) == pytest.approx(4 * 128 / 22050.)
+    assert pyramid.frequency_delta() == pytest.approx(f[1] - f[0])
+    assert pyramid.frequency_delta((2, 1)) == pytest.approx(2 * 22050 / 256.)
+    if len(t) > 1:
+        assert pyramid.time_delta() == pytest.approx(t[1] - t[0])
+
+
+def test_sel_bands():
+    rng = np.random.default_rng(0)
+    a = rng.normal(-60., 6., size = (2, 129, 50))
+    f = np.linspace(0, 11025, 129)
+    edges = [0., 500., 2000., 2010., 8000., np.inf]
+    sel = sel_bands(a, edges, f = f, units = 'watts')
+    watts = (10**(a / 10)).sum(axis = 2) * (f[1] - f[0])
+    for i in range(len(edges) - 1):
+        band = (f >= edges[i]) & (f < edges[i + 1])
+        np.testing.assert_allclose(sel[:, i], watts[:, band].sum(axis = 1), rtol = 1e-12)
+    # no frequency from 2000 to 2010 herz
+    assert np.all(sel[:, 2] == 0)
+    assert sel_bands(a, octave_bands(), f = f).shape == (2, 10)
+
+
+@pytest.mark.parametrize('edges', [[0., 2000., 1000., 8000.], [0., 1000., 1000., 8000.],
+                                   [1000.], [[0., 1000.]]])
+def test_sel_bands_edges(edges):
+    a = np.zeros(shape = (1, 129, 10))
+    with pytest.raises(ValueError):
+        sel_bands(a, edges, rate = 22050)
+
+
+def test_pyramid_levels_equal_base():
+    rng = np.random.default_rng(5)
+    samples = rng.normal(0, 0.2, size = (22050 * 3 + 1001, 2))
+    f, t, a = stft_psd(samples, 22050, window_length = 256)
+    pyramid = SpectrogramPyramid(f, t, a.copy(), 22050, len(samples) / 22050., 256)
+    decibels = 10 * np.log10(a / 400.)
+    expected = sel(decibels, 22050, len(samples) / 22050. / 60.)
+    # time levels (including a partial last group) count the energy of every time step
+    for level in [0, (1, 0), (2, 0), (5, 0)]:
+        np.testing.assert_allclose(sel(pyramid, level = level), expected, rtol = 1e-12)
+    # bands of frequency levels straddle the edges of the bins
+    for level in [1, (0, 2)]:
+        with pytest.raises(ValueError):
+            sel(pyramid, level = level)
+
+    time_delta = pyramid.time_delta()
+    np.testing.assert_allclose(calculate_aci(pyramid), calculate_aci(a, time_delta), rtol = 1e-12)
+    # a time level is the mean of pairs of time steps (of 'a' without the partial pair)
+    n = a.shape[2] // 2 * 2
+    pairs = a[:, :, :n].reshape(a.shape[:2] + (-1, 2)).mean(axis = 3)
+    aci = calculate_aci(pyramid, level = (1, 0), kind = 'blocks')
+    expected_aci = calculate_aci(pairs, 2 * time_delta, kind = 'blocks')
+    np.testing.assert_allclose(aci[:, :, :expected_aci.shape[2] - 1],
+                               expected_aci[:, :, :-1], rtol = 1e-12)
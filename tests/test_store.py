@@ -0,0 +1,58 @@
+"""
+Tests of the result store
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import os
+import numpy as np
+from nacoustik.store import ResultStore
+
+
+def append_files(store, n_chunks, n_rows):
+    for i in range(n_chunks):
+        store.append({'file': ['{0}-{1}.wav'.format(i, j) for j in range(n_rows)],
+                      'aci': np.arange(n_rows) + 100. * i,
+                      'aci_bands': np.ones((n_rows, 5)) * i})
+
+
+def test_compact(tmp_path):
+    store = ResultStore(str(tmp_path))
+    append_files(store, 5, 3)
+    before = store.read()
+    store.compact(chunk_size = 6)
+    assert len(store.chunks()) == 3
+    after = store.read()
+    assert sorted(after) == sorted(before)
+    # merged chunks are named by the time of their first chunk, so rows keep their order
+    for name in before:
+        np.testing.assert_array_equal(after[name], before[name])
+
+    # chunks appended after a compaction follow the merged chunks
+    append_files(store, 1, 2)
+    store.compact(chunk_size = 100)
+    assert len(store.chunks()) == 1
+    np.testing.assert_array_equal(store.read(['file'])['file'][:15], before['file'])
+
+
+def test_interrupted_compact(tmp_path):
+    store = ResultStore(str(tmp_path))
+    append_files(store, 3, 4)
+    before = store.read()
+    # a merged chunk written, but its sources not removed
+    sources = store.chunks()
+    store._write({name: values for name, values in before.items()}, replaces = sources)
+    assert len(os.listdir(str(tmp_path))) == 4
+    assert len(store.chunks()) == 1
+    after = store.read()
+    assert len(after['file']) == 12
+    np.testing.assert_array_equal(np.sort(after['file']), np.sort(before['file']))
+
+    # the sources are removed by the next compaction
+    store.compact()
+    assert os.listdir(str(tmp_path)) == store.chunks()
+    np.testing.assert_array_equal(np.sort(store.read()['file']), np.sort(before['file']))
@@ -0,0 +1,67 @@
+"""
+Tests of the lazy subpackage imports and the numba worker utilities
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import importlib
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+import nacoustik
+from nacoustik import warmup
+from nacoustik.utilities import _init_worker
+
+
+def imported_modules(statement):
+    # modules in 'sys.modules' after the statement, in a new interpreter
+    script = ("import json, sys\n{0}\n"
+              "print(json.dumps(sorted(sys.modules)))").format(statement)
+    environment = dict(os.environ, PYTHONPATH = os.pathsep.join(sys.path))
+    output = subprocess.check_output([sys.executable, '-c', script], env = environment)
+    return set(json.loads(output.decode()))
+
+
+def test_import_nacoustik_is_lazy():
+    modules = imported_modules('import nacoustik')
+    assert not modules & {'numba', 'scipy', 'matplotlib', 'pandas', 'nacoustik.spectrum',
+                          'nacoustik.index', 'nacoustik.plot'}
+
+
+def test_import_index():
+    # the indices do not load the spectrum subpackage (scipy.signal) or the plots
+    modules = imported_modules('import nacoustik.index')
+    assert {'numba', 'nacoustik.index'} <= modules
+    assert not modules & {'scipy.signal', 'matplotlib', 'pandas', 'nacoustik.spectrum',
+                          'nacoustik.plot'}
+
+
+def test_getattr_imports_submodules():
+    for name in nacoustik._SUBMODULES:
+        assert getattr(nacoustik, name) is importlib.import_module('nacoustik.' + name)
+    with pytest.raises(AttributeError, match = 'unknown'):
+        nacoustik.unknown
+
+
+def test_warmup():
+    from nacoustik.index.indices import _calculate_aci
+    warmup(dtypes = (np.float32,))
+    signatures = [str(signature) for signature in _calculate_aci.signatures]
+    assert any('float32' in signature for signature in signatures)
+
+
+def test_init_worker():
+    numba = pytest.importorskip('numba')
+    n_threads = numba.get_num_threads()
+    try:
+        _init_worker()
+        assert numba.get_num_threads() == 1
+    finally:
+        numba.set_num_threads(n_threads)
@@ -0,0 +1,131 @@
+"""
+Tests of the normalization, memory-mapping and segments of wave samples
+
+Jacob Dein 2016
+nacoustik
+Author: Jacob Dein
+License: MIT
+"""
+
+
+import numpy as np
+import pytest
+from nacoustik import Wave
+
+RATE = 22050
+
+
+def test_normalize_float_samples_in_place():
+    samples = np.random.default_rng(0).normal(0, 1000., size = (1000, 2))
+    expected = samples / 1000.
+    wave = Wave(samples)
+    wave.normalize(value = 1000.)
+    assert wave.samples is samples
+    np.testing.assert_allclose(samples, expected, rtol = 1e-15)
+    # normalizing again does nothing
+    wave.normalize(value = 10.)
+    np.testing.assert_allclose(wave.samples, expected, rtol = 1e-15)
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+@pytest.mark.parametrize('samples_dtype, scale, offset', [(np.int16, 2.**15, 0.),
+                                                          (np.int32, 2.**31, 0.),
+                                                          (np.uint8, 2.**7, 2.**7),
+                                                          (np.float32, 1., 0.)])
+def test_normalize_copies(dtype, samples_dtype, scale, offset):
+    info = np.iinfo(samples_dtype) if np.dtype(samples_dtype).kind in 'iu' else None
+    rng = np.random.default_rng(1)
+    if info is None:
+        samples = rng.uniform(-1, 1, size = (70000, 2)).astype(samples_dtype)
+    else:
+        samples = rng.integers(info.min, info.max, size = (70000, 2), dtype = samples_dtype,
+                               endpoint = True)
+    original = samples.copy()
+    wave = Wave(samples)
+    wave.normalize(dtype = dtype)
+    if np.dtype(samples_dtype) != np.dtype(dtype):
+        assert not np.shares_memory(wave.samples, samples)
+        np.testing.assert_array_equal(samples, original)
+    assert wave.samples.dtype == dtype
+    np.testing.assert_allclose(wave.samples, (original.astype(np.float64) - offset) / scale,
+                               rtol = 1e-6 if dtype == np.float32 else 1e-15)
+    assert np.abs(wave.samples).max() <= 1
+
+
+def test_normalize_read_only_samples_copies():
+    samples = np.ones((100, 1))
+    samples.flags.writeable = False
+    wave = Wave(samples)
+    wave.normalize(value = 2.)
+    assert not np.shares_memory(wave.samples, samples)
+    np.testing.assert_array_equal(wave.samples, 0.5)
+    np.testing.assert_array_equal(samples, 1)
+
+
+def test_normalize_parameters():
+    wave = Wave(np.ones((100, 1)))
+    with pytest.raises(ValueError):
+        wave.normalize(dtype = np.int16)
+    with pytest.raises(ValueError):
+        wave.normalize(value = 0)
+    assert not wave.normalized
+
+
+@pytest.mark.parametrize('extension, subtype', [('.wav', 'PCM_U8'), ('.wav', 'PCM_16'),
+                                                ('.wav', 'PCM_24'), ('.wav', 'PCM_32'),
+                                                ('.wav', 'FLOAT'), ('.flac', 'PCM_24')])
+def test_normalize_files(write_audio, extension, subtype):
+    soundfile = pytest.importorskip('soundfile')
+    filepath = write_audio('test' + extension, RATE, 30011, subtype = subtype, scale = 0.3,
+                           seed = 2)
+    expected = soundfile.read(filepath, dtype = 'float64', always_2d = True)[0]
+
+    # normalized as the samples are read, in blocks or all at once
+    wave = Wave(filepath)
+    wave.normalize()
+    np.testing.assert_allclose(wave.read_samples(1000, 1100), expected[1000:1100], rtol = 1e-15)
+    np.testing.assert_allclose(np.concatenate(list(wave.blocks(4096))), expected, rtol = 1e-15)
+    np.testing.assert_allclose(wave.samples, expected, rtol = 1e-15)
+
+    # normalized after the samples are read
+    wave = Wave(filepath)
+    wave.read()
+    wave.normalize(dtype = np.float32)
+    assert wave.samples.dtype == np.float32
+    np.testing.assert_allclose(wave.samples, expected, rtol = 1e-6, atol = 1e-7)
+
+
+def test_samples_are_memory_mapped(write_audio):
+    filepath = write_audio('test.wav', RATE, 30011)
+    wave = Wave(filepath)
+    # only the header is read
+    assert wave._samples is None
+    assert (wave.n_samples, wave.n_channels, wave.bit_depth) == (30011, 2, 16)
+    assert isinstance(wave.samples, np.memmap)
+    assert not wave.samples.flags.writeable
+    assert wave.samples.dtype == np.dtype('<i2')
+
+
+@pytest.mark.parametrize('subtype, bits', [('PCM_16', 16), ('PCM_24', 24)])
+def test_segment(write_audio, subtype, bits):
+    soundfile = pytest.importorskip('soundfile')
+    filepath = write_audio('test.wav', RATE, RATE * 2, n_channels = 3, subtype = subtype,
+                           scale = 0.3)
+    expected = soundfile.read(filepath, dtype = 'int32', always_2d = True)[0] >> (32 - bits)
+    wave = Wave(filepath)
+    np.testing.assert_array_equal(wave.segment(0.5, 1.), expected[11025:22050])
+    np.testing.assert_array_equal(wave.segment(end = 0.1, channels = 1), expected[:2205, 1])
+    np.testing.assert_array_equal(wave.segment(1.5, channels = [0, 2]),
+                                  expected[33075:, [0, 2]])
+    # bounds beyond the wave are clipped
+    np.testing.assert_array_equal(wave.segment(1.9, 5.), expected[41895:])
+    assert wave.segment(3., 4.).shape == (0, 3)
+    if bits == 24:
+        # the samples of the segments are decoded, not those of the whole wave
+        assert wave._samples is None
+
+    # segments of normalized waves
+    wave.normalize()
+    np.testing.assert_allclose(wave.segment(0.5, 1., channels = 2),
+                               expected[11025:22050, 2] / 2.**(bits - 1), rtol = 1e-15)
+    assert wave._samples is None